@@ -0,0 +1,72 @@
+import asyncio
+import time
+from collections import Counter
+
+from aiohttp import web
+
+BOT_USER = {"id": 1, "is_bot": True, "first_name": "Bench", "username": "bench_bot"}
+
+
+class FakeBotAPI:
+    """Локальная замена Bot API: отвечает успехом на любой метод.
+
+    Для send*/edit* возвращает сообщение, для sendMediaGroup - список
+    сообщений, для остальных методов - True. latency - искусственная
+    задержка ответа в секундах (имитация сети).
+    """
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls: Counter[str] = Counter()
+        self._message_id = 0
+        self._runner: web.AppRunner | None = None
+        self.base_url = ""
+
+    def total_calls(self) -> int:
+        return sum(self.calls.values())
+
+    def _message(self, chat_id: int, text: str | None = None) -> dict:
+        self._message_id += 1
+        return {
+            "message_id": self._message_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"},
+            "text": text,
+        }
+
+    async def handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"].lower()
+        self.calls[method] += 1
+        data = await request.post()
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        chat_id = int(data.get("chat_id", 0) or 0)
+        if method == "getme":
+            result = BOT_USER
+        elif method == "sendmediagroup":
+            # media приходит JSON-строкой, достаточно посчитать элементы
+            count = max(1, str(data.get("media", "")).count('"type"'))
+            result = [self._message(chat_id) for _ in range(count)]
+        elif method == "copymessages" or method == "forwardmessages":
+            count = max(1, str(data.get("message_ids", "")).count(",") + 1)
+            result = [{"message_id": self._message(chat_id)["message_id"]} for _ in range(count)]
+        elif method.startswith(("send", "edit", "copy", "forward")):
+            result = self._message(chat_id, data.get("text"))
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0):
+        app = web.Application()
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        host, port = self._runner.addresses[0][:2]
+        self.base_url = f"http://{host}:{port}"
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
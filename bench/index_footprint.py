@@ -0,0 +1,107 @@
+"""Объём и скорость индекса архива в памяти (services/archive_index.py).
+
+Запуск из корня проекта:
+
+    python -m bench.index_footprint --posts 100000
+
+Засевает временную SQLite-базу, загружает индекс и печатает занимаемую
+память (в пересчёте на 100 тыс. постов), время загрузки и время выборки
+страницы рубрики из памяти и из БД. Заодно сверяет страницы с get_rubric_page.
+"""
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Память и скорость индекса архива")
+    parser.add_argument("--posts", type=int, default=100_000, help="сколько постов засеять")
+    parser.add_argument("--pages", type=int, default=2000, help="сколько страниц выбрать для замера")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+async def run(args: argparse.Namespace):
+    from database.crud import FIXED_HASHTAGS, get_rubric_page, RUBRIC_PAGE_SIZE
+    from database.session import async_session, read_session
+    from main import create_tables
+    from bench.seed import seed_posts
+    from services import archive_index as archive_index_module
+    from services.archive_index import archive_index
+
+    await create_tables()
+    started = time.perf_counter()
+    async with async_session() as session:
+        await seed_posts(session, args.posts, args.seed)
+    print(f"Засеяно {args.posts} постов за {time.perf_counter() - started:.1f} с")
+
+    await archive_index.load()
+    print(f"Загрузка индекса: {archive_index.loaded_in:.2f} с")
+    # Повторная загрузка под tracemalloc: он сильно замедляет, но считает всю память.
+    # Всё, что выделено после start, включает и кэши SQLAlchemy (постоянная добавка,
+    # на малых базах она завышает пересчёт на 100 тыс.), поэтому на 100 тыс.
+    # пересчитывается только память, выделенная в services/archive_index.py
+    tracemalloc.start()
+    await archive_index.load()
+    traced, _ = tracemalloc.get_traced_memory()
+    snapshot = tracemalloc.take_snapshot().filter_traces([tracemalloc.Filter(True, archive_index_module.__file__)])
+    tracemalloc.stop()
+    index_traced = sum(stat.size for stat in snapshot.statistics("filename"))
+    per_100k = 100_000 / max(1, args.posts)
+    print(
+        f"Память: {archive_index.memory_bytes() / 2**20:.2f} МиБ по getsizeof; по tracemalloc "
+        f"{index_traced / 2**20:.2f} МиБ индекс, {traced / 2**20:.2f} МиБ всего за загрузку; "
+        f"индекс на 100 тыс. постов {index_traced * per_100k / 2**20:.2f} МиБ"
+    )
+
+    rng = random.Random(args.seed)
+    requests = []
+    for _ in range(args.pages):
+        tag = rng.choice(FIXED_HASHTAGS)
+        selection = await archive_index.rubric_page(tag, None, False, RUBRIC_PAGE_SIZE * 50)
+        cursor = rng.choice(selection[0]) if selection[0] and rng.random() < 0.8 else None
+        requests.append((tag, cursor, rng.random() < 0.3))
+
+    started = time.perf_counter()
+    memory_pages = [await archive_index.rubric_page(tag, cursor, backward, RUBRIC_PAGE_SIZE)
+                    for tag, cursor, backward in requests]
+    memory_time = time.perf_counter() - started
+
+    started = time.perf_counter()
+    sql_pages = []
+    for tag, cursor, backward in requests:
+        async with read_session() as session:
+            posts, has_more = await get_rubric_page(session, tag, cursor=cursor, backward=backward)
+        sql_pages.append(([post.id for post in posts], has_more))
+    sql_time = time.perf_counter() - started
+
+    mismatches = sum(1 for a, b in zip(memory_pages, sql_pages) if a != b)
+    print(
+        f"Страница рубрики: из памяти {memory_time / args.pages * 1e6:.0f} мкс, "
+        f"из БД {sql_time / args.pages * 1e6:.0f} мкс; расхождений {mismatches}"
+    )
+
+    for post_ids, _ in memory_pages:
+        await archive_index.message_ids(post_ids)
+    print(
+        f"После подгрузки частей альбомов для {archive_index.stats()['album_parts']} постов: "
+        f"{archive_index.memory_bytes() / 2**20:.2f} МиБ по getsizeof"
+    )
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{workdir}/index.db"
+        os.environ.setdefault("BOT_TOKEN", "42:bench")
+        os.environ.setdefault("CHANNEL_ID", "-1001000000000")
+        os.environ["ARCHIVE_INDEX_MAX_POSTS"] = str(max(args.posts, 1))
+        asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,322 @@
+"""Нагрузочный бенчмарк бота против локальной замены Bot API.
+
+Запуск из корня проекта:
+
+    python -m bench.run --posts 5000 --ops 500 --concurrency 50
+    python -m bench.run --compare bench/results/<прошлый_запуск>.json
+
+По умолчанию используется новая SQLite-база во временной папке; для
+PostgreSQL передайте --database-url. Результаты пишутся в JSON, чтобы
+сравнивать запуски до и после изменений.
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+SCENARIOS = ("start_storm", "rubric_clicks", "double_taps", "post_flood", "album_burst")
+RESULTS_DIR = Path(__file__).parent / "results"
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Бенчмарк бота с фейковым Bot API")
+    parser.add_argument("--database-url", help="БД для теста (по умолчанию временная SQLite)")
+    parser.add_argument("--posts", type=int, default=5000, help="сколько постов засеять в БД")
+    parser.add_argument("--ops", type=int, default=500, help="операций в каждом сценарии")
+    parser.add_argument("--users", type=int, default=100, help="сколько разных пользователей шлют запросы")
+    parser.add_argument("--concurrency", type=int, default=50, help="одновременных операций")
+    parser.add_argument("--album-size", type=int, default=4, help="частей в альбоме для album_burst")
+    parser.add_argument("--api-latency", type=float, default=0.0, help="задержка ответа Bot API, мс")
+    parser.add_argument("--real-limits", action="store_true", help="не снимать лимиты отправки Telegram")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="сценарии через запятую")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="файл результатов (по умолчанию bench/results/<время>.json)")
+    parser.add_argument("--compare", help="JSON прошлого запуска для сравнения")
+    return parser.parse_args()
+
+
+def configure_env(args: argparse.Namespace, workdir: str):
+    """Настройки бота задаются до первого обращения к settings (читаются один раз)"""
+    os.environ["DATABASE_URL"] = args.database_url or f"sqlite+aiosqlite:///{workdir}/bench.db"
+    os.environ["BOT_TOKEN"] = "42:bench"
+    os.environ["CHANNEL_ID"] = "-1001000000000"
+    os.environ["METRICS_PORT"] = "0"
+    os.environ["WEBHOOK_ENABLED"] = "0"
+    os.environ["MEDIA_GROUP_WINDOW"] = "0.05"
+    if not args.real_limits:
+        for name in ("SEND_GLOBAL_RATE", "SEND_PRIVATE_RATE", "SEND_PRIVATE_BURST",
+                     "SEND_GROUP_RATE", "SEND_GROUP_BURST"):
+            os.environ[name] = "1000000"
+
+
+def percentile(sorted_values: list[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+class Bench:
+    def __init__(self, args: argparse.Namespace):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.update_id = 0
+        self.next_message_id = 1
+
+    async def setup(self):
+        import main
+        from aiogram.client.session.aiohttp import AiohttpSession
+        from aiogram.client.telegram import TelegramAPIServer
+        from bench.fake_api import FakeBotAPI
+        from bench.seed import seed_posts
+        from database.session import async_session
+
+        logging.getLogger().setLevel(logging.WARNING)
+
+        self.api = FakeBotAPI(latency=self.args.api_latency / 1000)
+        await self.api.start()
+
+        await main.create_tables()
+        started = time.perf_counter()
+        async with async_session() as session:
+            self.next_message_id = await seed_posts(session, self.args.posts, seed=self.args.seed)
+        self.seed_seconds = time.perf_counter() - started
+
+        session = AiohttpSession(api=TelegramAPIServer.from_base(self.api.base_url))
+        self.bot = main.create_bot(session)
+        self.dp = main.create_dispatcher(self.bot)
+        await self.dp.emit_startup(bot=self.bot, dispatcher=self.dp, bots=[self.bot], **self.dp.workflow_data)
+
+    async def teardown(self):
+        await self.dp.emit_shutdown(bot=self.bot, dispatcher=self.dp, bots=[self.bot], **self.dp.workflow_data)
+        await self.bot.session.close()
+        await self.api.stop()
+
+    # Сборка update
+
+    def _update(self, **payload):
+        from aiogram.types import Update
+        self.update_id += 1
+        return Update.model_validate({"update_id": self.update_id, **payload}, context={"bot": self.bot})
+
+    def _user(self) -> dict:
+        user_id = 100000 + self.rng.randrange(self.args.users)
+        return {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"}
+
+    def start_update(self):
+        user = self._user()
+        return self._update(message={
+            "message_id": self.update_id, "date": int(time.time()),
+            "chat": {"id": user["id"], "type": "private"}, "from": user,
+            "text": "/start", "entities": [{"type": "bot_command", "offset": 0, "length": 6}],
+        })
+
+    def click_update(self, user: dict | None = None, data: str | None = None):
+        from database.crud import FIXED_HASHTAGS
+        user = user or self._user()
+        return self._update(callback_query={
+            "id": str(self.update_id), "chat_instance": "bench", "from": user,
+            "data": data or f"hashtag:{self.rng.choice(FIXED_HASHTAGS)}",
+            "message": {
+                "message_id": 1, "date": int(time.time()),
+                "chat": {"id": user["id"], "type": "private"}, "text": "Выберите рубрику для поиска:",
+            },
+        })
+
+    def double_tap_updates(self, taps: int = 3) -> list:
+        """Несколько нажатий одной кнопки одним пользователем подряд"""
+        from database.crud import FIXED_HASHTAGS
+        user = self._user()
+        data = f"hashtag:{self.rng.choice(FIXED_HASHTAGS)}"
+        return [self.click_update(user, data) for _ in range(taps)]
+
+    def _channel_message(self, message_id: int, with_hashtag: bool = True, **extra) -> dict:
+        from bench.seed import synthetic_text
+        from database.crud import FIXED_HASHTAGS
+        message = {
+            "message_id": message_id, "date": int(time.time()),
+            "chat": {"id": -1001000000000, "type": "channel"}, **extra,
+        }
+        if with_hashtag:
+            tag = self.rng.choice(FIXED_HASHTAGS)
+            text = f"{tag} {synthetic_text(self.rng, [])}"
+            entities = [{"type": "hashtag", "offset": 0, "length": len(tag)}]
+            if "photo" in extra:
+                message.update(caption=text, caption_entities=entities)
+            else:
+                message.update(text=text, entities=entities)
+        return message
+
+    def post_update(self):
+        message_id = self.next_message_id
+        self.next_message_id += 1
+        return self._update(channel_post=self._channel_message(message_id))
+
+    def album_updates(self) -> list:
+        first = self.next_message_id
+        self.next_message_id += self.args.album_size
+        group_id = f"bench-album-{first}"
+        updates = []
+        for i in range(self.args.album_size):
+            photo = [{"file_id": f"bench-photo-{first + i}", "file_unique_id": f"u{first + i}",
+                      "width": 1280, "height": 960}]
+            updates.append(self._update(channel_post=self._channel_message(
+                first + i, with_hashtag=i == 0, photo=photo, media_group_id=group_id
+            )))
+        return updates
+
+    # Прогон сценариев
+
+    async def drive(self, name: str, operations: list[list], wait_ingestion: bool = False) -> dict:
+        """operations - список операций, каждая из одного или нескольких update"""
+        from services.metrics import metrics
+
+        channel_parser = self.dp["channel_parser"]
+        sender = self.dp["sender"]
+        semaphore = asyncio.Semaphore(self.args.concurrency)
+        latencies = []
+        errors = 0
+
+        async def run(updates):
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    for update in updates:
+                        await self.dp.feed_update(self.bot, update)
+                except Exception:
+                    errors += 1
+                latencies.append(time.perf_counter() - started)
+
+        queries_before = metrics.db_queries.total()
+        calls_before = self.api.total_calls()
+        saved_before = channel_parser.ingestion.saved_count
+
+        started = time.perf_counter()
+        await asyncio.gather(*(run(updates) for updates in operations))
+        if wait_ingestion:
+            # Альбом уходит в очередь только после окна MEDIA_GROUP_WINDOW
+            while channel_parser.media_groups.pending():
+                await asyncio.sleep(0.01)
+            await channel_parser.ingestion.join()
+        await sender.drain()
+        duration = time.perf_counter() - started
+
+        ops = len(operations)
+        latencies.sort()
+        result = {
+            "ops": ops,
+            "errors": errors,
+            "duration_s": round(duration, 4),
+            "throughput_ops_s": round(ops / duration, 2) if duration else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+            "mean_ms": round(statistics.fmean(latencies) * 1000, 3) if latencies else 0.0,
+            "db_queries_per_op": round((metrics.db_queries.total() - queries_before) / ops, 3) if ops else 0.0,
+            "api_calls_per_op": round((self.api.total_calls() - calls_before) / ops, 3) if ops else 0.0,
+        }
+        if wait_ingestion:
+            result["posts_saved"] = channel_parser.ingestion.saved_count - saved_before
+        print(
+            f"{name:14} {ops:6} оп. {result['throughput_ops_s']:10.1f} оп./с  "
+            f"p50 {result['p50_ms']:8.2f}  p95 {result['p95_ms']:8.2f}  p99 {result['p99_ms']:8.2f} мс  "
+            f"БД {result['db_queries_per_op']:6.2f}/оп.  API {result['api_calls_per_op']:5.2f}/оп.  "
+            f"ошибок {errors}"
+        )
+        return result
+
+    async def run(self, scenarios: list[str]) -> dict:
+        ops = self.args.ops
+        results = {}
+        for name in scenarios:
+            if name == "start_storm":
+                results[name] = await self.drive(name, [[self.start_update()] for _ in range(ops)])
+            elif name == "rubric_clicks":
+                results[name] = await self.drive(name, [[self.click_update()] for _ in range(ops)])
+            elif name == "double_taps":
+                results[name] = await self.drive(name, [self.double_tap_updates() for _ in range(ops)])
+            elif name == "post_flood":
+                results[name] = await self.drive(name, [[self.post_update()] for _ in range(ops)], wait_ingestion=True)
+            elif name == "album_burst":
+                # Части альбома приходят отдельными update и обрабатываются параллельно
+                parts = [[update] for _ in range(ops) for update in self.album_updates()]
+                result = await self.drive(name, parts, wait_ingestion=True)
+                result["albums"] = ops
+                results[name] = result
+            else:
+                raise SystemExit(f"Неизвестный сценарий: {name}")
+        return results
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, previous_path: str):
+    previous = json.loads(Path(previous_path).read_text(encoding="utf-8"))
+    print(f"\nСравнение с {previous_path} ({previous['meta'].get('git_revision')}):")
+    for name, result in current["scenarios"].items():
+        old = previous["scenarios"].get(name)
+        if not old:
+            continue
+        for key in ("throughput_ops_s", "p95_ms", "db_queries_per_op"):
+            before, after = old[key], result[key]
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "—"
+            print(f"  {name:14} {key:18} {before:10} -> {after:10} ({change})")
+
+
+async def main(args: argparse.Namespace) -> dict:
+    scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    bench = Bench(args)
+    await bench.setup()
+    print(f"Засеяно {args.posts} постов за {bench.seed_seconds:.1f} с")
+    try:
+        results = await bench.run(scenarios)
+    finally:
+        await bench.teardown()
+
+    from config import settings
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "database": settings.DATABASE_URL.split("://")[0],
+            "seed_seconds": round(bench.seed_seconds, 3),
+            "args": vars(args),
+        },
+        "scenarios": results,
+    }
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as workdir:
+        configure_env(args, workdir)
+        report = asyncio.run(main(args))
+
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{datetime.now():%Y%m%d-%H%M%S}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"Результаты: {out}")
+    if args.compare:
+        compare(report, args.compare)
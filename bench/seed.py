@@ -0,0 +1,78 @@
+import random
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from database.crud import FIXED_HASHTAGS, init_hashtags, save_post_drafts
+from database.models import ChannelPost
+from database.schemas import PostDraft
+
+WORDS = (
+    "камень минерал выставка мастер геолог кварц малахит яшма агат аметист "
+    "украшение коллекция экспедиция Урал месторождение история символ огонь "
+    "вода дерево металл земля огранка кристалл музей азбука путеводитель"
+).split()
+
+SEED_CHUNK_SIZE = 1000
+
+
+def synthetic_text(rng: random.Random, hashtags: list[str], words: int = 40) -> str:
+    body = " ".join(rng.choice(WORDS) for _ in range(words))
+    return f"{body}\n\n{' '.join(hashtags)}"
+
+
+def synthetic_media(rng: random.Random, message_id: int, count: int) -> list[dict]:
+    return [
+        dict(
+            message_id=message_id + i,
+            media_type="photo" if rng.random() < 0.8 else "video",
+            file_id=f"bench-file-{message_id}-{i}",
+            file_unique_id=f"bench-unique-{message_id}-{i}",
+            file_size=rng.randint(50_000, 5_000_000),
+            width=1280,
+            height=960,
+        )
+        for i in range(count)
+    ]
+
+
+def synthetic_draft(rng: random.Random, message_id: int, date: datetime) -> PostDraft:
+    hashtags = rng.sample(FIXED_HASHTAGS, rng.choice((1, 1, 1, 2)))
+    # Примерно половина постов с медиа, четверть из них - альбомы
+    media_count = 0
+    if rng.random() < 0.5:
+        media_count = 1 if rng.random() < 0.75 else rng.randint(2, 5)
+    return PostDraft(
+        message_id=message_id,
+        text=synthetic_text(rng, hashtags),
+        date=date,
+        hashtags=hashtags,
+        media_group_id=f"bench-{message_id}" if media_count > 1 else None,
+        media=synthetic_media(rng, message_id, media_count)
+    )
+
+
+async def seed_posts(session: AsyncSession, count: int, seed: int = 0) -> int:
+    """Добавляет count синтетических постов после последнего message_id.
+
+    Возвращает message_id, с которого можно продолжать нумерацию.
+    """
+    await init_hashtags(session)
+    rng = random.Random(seed)
+    message_id = ((await session.scalar(select(func.max(ChannelPost.message_id)))) or 0) + 1
+    date = datetime(2020, 1, 1)
+
+    chunk = []
+    for _ in range(count):
+        draft = synthetic_draft(rng, message_id, date)
+        chunk.append(draft)
+        # Части альбома занимают свои message_id
+        message_id += max(1, len(draft.media))
+        date += timedelta(minutes=rng.randint(5, 600))
+        if len(chunk) >= SEED_CHUNK_SIZE:
+            await save_post_drafts(session, chunk)
+            chunk = []
+    if chunk:
+        await save_post_drafts(session, chunk)
+    return message_id
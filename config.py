@@ -1,3 +1,5 @@
+from functools import lru_cache
+
 from pydantic_settings import BaseSettings
 
 
@@ -5,9 +7,128 @@ class Settings(BaseSettings):
     BOT_TOKEN: str
     DATABASE_URL: str
     CHANNEL_ID: int
+    # Адрес БД только для чтения (реплика); по умолчанию DATABASE_URL
+    DATABASE_READ_URL: str | None = None
+
+    # Приводить схему БД к последней версии при запуске. False - схема не
+    # проверяется совсем (миграции отдельным шагом: python -m database.migrations)
+    DB_MIGRATE_ON_START: bool = True
+
+    # Пул соединений с БД
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    DB_POOL_TIMEOUT: float = 30.0
+    # Через сколько секунд переоткрывать соединение и проверять ли его перед выдачей
+    DB_POOL_RECYCLE: int = 1800
+    DB_POOL_PRE_PING: bool = True
+    # Кэш подготовленных запросов на соединение (asyncpg). 0 - выключить кэши
+    # SQLAlchemy и самого asyncpg и давать запросам уникальные имена: так
+    # работает pgbouncer в режиме transaction
+    DB_STATEMENT_CACHE_SIZE: int = 100
+    # PRAGMA для SQLite: журнал WAL не блокирует чтение во время записи
+    SQLITE_JOURNAL_MODE: str = "wal"
+    SQLITE_SYNCHRONOUS: str = "normal"
+    SQLITE_BUSY_TIMEOUT: int = 5000  # мс
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024  # байт
+    SQLITE_CACHE_SIZE: int = -64000  # отрицательное значение - в КиБ
+
+    # Как часто (в секундах) накопленные клики по рубрикам сбрасываются в БД
+    CLICK_FLUSH_INTERVAL: float = 5.0
+    # Как часто (в секундах) журнал кликов сворачивается в агрегаты статистики
+    STATS_ROLLUP_INTERVAL: float = 60.0
+    # Сколько дней хранить уже свёрнутые записи журнала кликов
+    STATS_EVENT_RETENTION_DAYS: int = 7
+    # Telegram id пользователей, которым доступен /health (пусто - никому),
+    # в .env списком JSON: ADMIN_IDS=[123456789]
+    ADMIN_IDS: list[int] = []
+    # Сколько популярных постов показывать в /stats
+    STATS_TOP_POSTS: int = 5
+    # Время жизни (в секундах) кэша списка рубрик
+    HASHTAG_CATALOG_TTL: float = 300.0
+    # Сколько кнопок рубрик в одной строке клавиатуры /start
+    KEYBOARD_COLUMNS: int = 1
+    # Сколько секунд ждать следующую часть альбома (media_group_id)
+    MEDIA_GROUP_WINDOW: float = 1.0
+    # Пакетная запись постов канала: размер пачки, макс. задержка (сек), размер очереди
+    INGEST_BATCH_SIZE: int = 100
+    INGEST_MAX_LATENCY: float = 0.5
+    INGEST_QUEUE_SIZE: int = 1000
+
+    # Кэш готовых страниц рубрик: максимум записей и время жизни (сек)
+    PAGE_CACHE_SIZE: int = 256
+    PAGE_CACHE_TTL: float = 600.0
+    # Как отправлять посты рубрики: copy - copyMessages из канала (до 100 сообщений
+    # за запрос, альбомы и любые медиа сохраняются), forward - forwardMessages,
+    # resend - заново по file_id. При ошибке copy/forward используется resend
+    DELIVERY_MODE: str = "copy"
+    # Индекс архива в памяти: страницы рубрик и количество постов без запросов
+    # к БД. При числе постов больше ARCHIVE_INDEX_MAX_POSTS индекс отключается
+    # (по tracemalloc на 100 тыс. постов: 4,3 МиБ сам индекс, 4,5 МиБ вместе с
+    # остальными выделениями при загрузке; см. bench/index_footprint.py)
+    ARCHIVE_INDEX_ENABLED: bool = False
+    ARCHIVE_INDEX_MAX_POSTS: int = 1_000_000
+    # Сколько результатов /search показывать на странице
+    SEARCH_PAGE_SIZE: int = 5
+
+    # Режим webhook вместо long polling. WEBHOOK_URL - внешний адрес бота;
+    # если он не задан, setWebhook не вызывается (локальная проверка)
+    WEBHOOK_ENABLED: bool = False
+    WEBHOOK_URL: str | None = None
+    WEBHOOK_PATH: str = "/webhook"
+    WEBHOOK_SECRET: str | None = None
+    WEBHOOK_HOST: str = "0.0.0.0"
+    WEBHOOK_PORT: int = 8080
+    # Повторное нажатие той же кнопки тем же пользователем в течение стольких
+    # секунд (или пока первое ещё обрабатывается) игнорируется
+    CALLBACK_DEBOUNCE_WINDOW: float = 1.0
+    # Сколько update обрабатывается одновременно
+    HANDLER_CONCURRENCY: int = 100
+    # Сколько секунд ждать начатые хендлеры при остановке
+    SHUTDOWN_TIMEOUT: float = 30.0
+
+    # Общее состояние процессов бота (клики, сброс кэшей, лимиты, FSM):
+    # redis://..., memory:// (один процесс) или пусто - всё в памяти процесса
+    SHARED_STATE_URL: str | None = None
+    # Сколько процессов-воркеров обрабатывают update (0 - всё в одном процессе).
+    # Основной процесс сохраняет посты канала и раздаёт остальные update
+    # воркерам по chat_id; воркеры слушают 127.0.0.1:WORKER_PORT_BASE+номер
+    WORKERS: int = 0
+    WORKER_PORT_BASE: int = 8090
+    # Роль процесса: all - основной, worker - воркер номер WORKER_INDEX
+    # (для запуска воркеров отдельно, например через systemd)
+    ROLE: str = "all"
+    WORKER_INDEX: int = 0
+
+    # Адрес HTTP-сервера метрик /metrics (порт 0 - не запускать);
+    # воркеры используют следующие порты: METRICS_PORT + номер + 1
+    METRICS_HOST: str = "127.0.0.1"
+    METRICS_PORT: int = 9100
+    # Запросы к БД дольше стольких секунд пишутся в лог (0 - не писать)
+    SLOW_QUERY_THRESHOLD: float = 0.0
+
+    # Лимиты исходящих сообщений (сообщений в секунду и размер всплеска)
+    SEND_GLOBAL_RATE: float = 30.0
+    SEND_PRIVATE_RATE: float = 1.0
+    SEND_PRIVATE_BURST: float = 5.0
+    SEND_GROUP_RATE: float = 20 / 60
+    SEND_GROUP_BURST: float = 3.0
+    # Сколько раз повторять запрос после TelegramRetryAfter
+    SEND_MAX_RETRIES: int = 3
 
     class Config:
         env_file = ".env"
 
 
-settings = Settings()
\ No newline at end of file
+@lru_cache
+def get_settings() -> Settings:
+    return Settings()
+
+
+class LazySettings:
+    """Settings читаются из окружения при первом обращении, а не при импорте config"""
+
+    def __getattr__(self, name: str):
+        return getattr(get_settings(), name)
+
+
+settings = LazySettings()
\ No newline at end of file
@@ -1,8 +1,26 @@
-from sqlalchemy import select
+from collections import Counter
+from datetime import datetime
+
+from sqlalchemy import select, tuple_, update, delete, bindparam, func, insert
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
-from database.models import ChannelPost, HashtagStats
+from database.fulltext import index_posts, unindex_post
+from database.models import (
+    ChannelPost, HashtagStats, PostHashtag, PostMedia, ClickEvent, StatsHourly, StatsDaily, RollupState
+)
+from database.schemas import PostDraft
+
+# Колонки PostMedia, которые заполняются из данных сообщения
+MEDIA_FIELDS = [
+    c.name for c in PostMedia.__table__.columns if c.name not in ("id", "post_id", "order_index")
+]
+
+# Количество постов на одной странице рубрики
+RUBRIC_PAGE_SIZE = 5
+# Сколько записей журнала кликов сворачивать за один проход
+ROLLUP_BATCH_SIZE = 5000
 
 # Фиксированный список хештегов
 FIXED_HASHTAGS = [
@@ -16,18 +34,188 @@ FIXED_HASHTAGS = [
     "#Символика_пяти_стихий"
 ]
 
+def split_hashtags(value: str | None) -> list[str]:
+    """Разбирает строку ChannelPost.hashtags ("#a,#b") в список без дублей"""
+    tags = []
+    for tag in (value or "").split(","):
+        tag = tag.strip()
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def upsert_insert(session: AsyncSession, table):
+    """INSERT с поддержкой ON CONFLICT для диалекта текущей БД"""
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        return postgresql.insert(table)
+    if dialect == "sqlite":
+        return sqlite.insert(table)
+    raise NotImplementedError(f"ON CONFLICT не поддерживается для {dialect}")
+
+
+async def save_post_drafts(session: AsyncSession, drafts: list[PostDraft]):
+    """Пакетная запись постов с медиа и хештегами в одной транзакции.
+
+    Дубли message_id отбрасываются в памяти и через ON CONFLICT DO NOTHING.
+    Возвращает (записанные посты, имена впервые созданных рубрик).
+    """
+    unique: dict[int, PostDraft] = {}
+    for draft in drafts:
+        unique.setdefault(draft.message_id, draft)
+    if not unique:
+        return [], set()
+
+    result = await session.execute(
+        upsert_insert(session, ChannelPost.__table__)
+        .values([
+            {
+                "message_id": d.message_id,
+                "media_group_id": d.media_group_id,
+                "text": d.text,
+                "date": d.date,
+                "hashtags": ",".join(split_hashtags(",".join(d.hashtags))),
+            }
+            for d in unique.values()
+        ])
+        .on_conflict_do_nothing(index_elements=["message_id"])
+        .returning(ChannelPost.__table__.c.id, ChannelPost.__table__.c.message_id)
+    )
+    post_ids = {message_id: post_id for post_id, message_id in result.all()}
+    saved = [d for d in unique.values() if d.message_id in post_ids]
+
+    media_rows = []
+    link_rows = []
+    tags = set()
+    for draft in saved:
+        post_id = draft.post_id = post_ids[draft.message_id]
+        for order_index, media in enumerate(draft.media):
+            row = {name: media.get(name) for name in MEDIA_FIELDS}
+            media_rows.append({**row, "post_id": post_id, "order_index": order_index})
+        for tag in split_hashtags(",".join(draft.hashtags)):
+            link_rows.append({"post_id": post_id, "hashtag": tag, "date": draft.date})
+            tags.add(tag)
+
+    await index_posts(session, [(post_ids[d.message_id], d.text) for d in saved])
+    if media_rows:
+        await session.execute(insert(PostMedia.__table__), media_rows)
+    if link_rows:
+        await session.execute(
+            upsert_insert(session, PostHashtag.__table__)
+            .values(link_rows)
+            .on_conflict_do_nothing()
+        )
+
+    new_tags = set()
+    if tags:
+        result = await session.execute(
+            upsert_insert(session, HashtagStats.__table__)
+            .values([{"name": tag, "click_count": 0} for tag in sorted(tags)])
+            .on_conflict_do_nothing(index_elements=["name"])
+            .returning(HashtagStats.__table__.c.name)
+        )
+        new_tags = set(result.scalars().all())
+
+    await session.commit()
+    return saved, new_tags
+
+
+async def apply_post_edit(
+        session: AsyncSession,
+        message_id: int,
+        text: str | None,
+        hashtags: list[str] | None,
+        media: dict | None
+):
+    """Применяет правку сообщения канала к сохранённому посту.
+
+    message_id - сам пост или часть альбома. hashtags=None значит, что
+    сообщение не несёт текст поста (часть альбома без подписи) и меняются
+    только медиа. Обновляются только изменившиеся строки; если в тексте не
+    осталось хештегов, пост удаляется.
+    Возвращает None, если пост не найден, иначе (затронутые рубрики, новые рубрики).
+    """
+    options = (selectinload(ChannelPost.media_files), selectinload(ChannelPost.hashtag_links))
+    result = await session.execute(
+        select(ChannelPost).where(ChannelPost.message_id == message_id).options(*options)
+    )
+    post = result.scalar_one_or_none()
+    if post is None:
+        result = await session.execute(
+            select(ChannelPost)
+            .join(PostMedia, PostMedia.post_id == ChannelPost.id)
+            .where(PostMedia.message_id == message_id)
+            .options(*options)
+        )
+        post = result.scalar_one_or_none()
+    if post is None:
+        return None
+
+    old_tags = {link.hashtag for link in post.hashtag_links}
+    new_tags = set()
+
+    if hashtags is not None:
+        tags = split_hashtags(",".join(hashtags))
+        if not tags:
+            await unindex_post(session, post.id, post.text)
+            await session.delete(post)
+            await session.commit()
+            return old_tags, new_tags
+
+        if post.text != text:
+            await unindex_post(session, post.id, post.text)
+            post.text = text
+            await index_posts(session, [(post.id, text)])
+
+        for link in list(post.hashtag_links):
+            if link.hashtag not in tags:
+                post.hashtag_links.remove(link)
+        for tag in tags:
+            if tag not in old_tags:
+                post.hashtag_links.append(PostHashtag(hashtag=tag, date=post.date))
+        if post.hashtags != ",".join(tags):
+            post.hashtags = ",".join(tags)
+
+        added = set(tags) - old_tags
+        if added:
+            result = await session.execute(
+                upsert_insert(session, HashtagStats.__table__)
+                .values([{"name": tag, "click_count": 0} for tag in sorted(added)])
+                .on_conflict_do_nothing(index_elements=["name"])
+                .returning(HashtagStats.__table__.c.name)
+            )
+            new_tags = set(result.scalars().all())
+
+    if media is not None:
+        row = next((m for m in post.media_files if m.message_id == message_id), None)
+        if row is None and len(post.media_files) == 1 and post.media_files[0].message_id is None:
+            # Пост сохранён до появления PostMedia.message_id
+            row = post.media_files[0]
+        if row is None:
+            post.media_files.append(PostMedia(
+                **{name: media.get(name) for name in MEDIA_FIELDS},
+                order_index=len(post.media_files)
+            ))
+        elif row.file_unique_id != media.get("file_unique_id"):
+            for name in MEDIA_FIELDS:
+                setattr(row, name, media.get(name))
+
+    await session.commit()
+    return old_tags | {link.hashtag for link in post.hashtag_links}, new_tags
+
+
 async def init_hashtags(session: AsyncSession):
-    """Инициализация фиксированных хештегов"""
-    for tag in FIXED_HASHTAGS:
-        existing = await session.execute(select(HashtagStats).where(HashtagStats.name == tag))
-        if not existing.scalar_one_or_none():
-            session.add(HashtagStats(name=tag))
+    """Инициализация фиксированных хештегов одним запросом"""
+    await session.execute(
+        upsert_insert(session, HashtagStats.__table__)
+        .values([{"name": tag, "click_count": 0, "post_count": 0} for tag in FIXED_HASHTAGS])
+        .on_conflict_do_nothing(index_elements=["name"])
+    )
     await session.commit()
 
 
 async def get_all_hashtags(session: AsyncSession):
-    """Получить все фиксированные хештеги со статистикой"""
-    await init_hashtags(session)  # Убедимся, что хештеги есть в БД
+    """Получить все хештеги со статистикой (заполняются init_hashtags при старте)"""
     result = await session.execute(select(HashtagStats).order_by(HashtagStats.name))
     return result.scalars().all()
 
@@ -36,17 +224,257 @@ async def search_posts_by_hashtag(session: AsyncSession, hashtag: str):
     """Поиск постов по конкретному хештегу с медиафайлами"""
     result = await session.execute(
         select(ChannelPost)
-        .where(ChannelPost.hashtags.contains(hashtag))
-        .order_by(ChannelPost.date.desc())
+        .join(PostHashtag, PostHashtag.post_id == ChannelPost.id)
+        .where(PostHashtag.hashtag == hashtag)
+        .order_by(PostHashtag.date.desc(), PostHashtag.post_id.desc())
         .options(selectinload(ChannelPost.media_files))  # Жадная загрузка медиафайлов
     )
     return result.scalars().all()
 
 
-async def increment_hashtag_counter(session: AsyncSession, hashtag: str):
-    """Увеличить счётчик кликов по хештегу"""
-    stats = await session.execute(select(HashtagStats).where(HashtagStats.name == hashtag))
-    stats = stats.scalar_one()
-    stats.click_count += 1
+async def get_hashtag(session: AsyncSession, name: str):
+    """Получить хештег по имени"""
+    result = await session.execute(select(HashtagStats).where(HashtagStats.name == name))
+    return result.scalar_one_or_none()
+
+
+async def get_hashtag_by_id(session: AsyncSession, hashtag_id: int):
+    """Получить хештег по id (используется в callback_data пагинации)"""
+    return await session.get(HashtagStats, hashtag_id)
+
+
+async def get_rubric_page(
+        session: AsyncSession,
+        hashtag: str,
+        cursor: int | None = None,
+        backward: bool = False,
+        limit: int = RUBRIC_PAGE_SIZE
+):
+    """Страница постов рубрики с keyset-пагинацией по (date, id).
+
+    cursor - id поста на границе текущей страницы: при backward=False
+    возвращаются более старые посты, при backward=True - более новые.
+    Возвращает (посты от новых к старым, есть ли ещё посты в этом направлении).
+    """
+    key = tuple_(PostHashtag.date, PostHashtag.post_id)
+    query = (
+        select(ChannelPost)
+        .join(PostHashtag, PostHashtag.post_id == ChannelPost.id)
+        .where(PostHashtag.hashtag == hashtag)
+        .options(selectinload(ChannelPost.media_files))
+        .limit(limit + 1)
+    )
+
+    if cursor is not None:
+        cursor_date = (
+            select(PostHashtag.date)
+            .where(PostHashtag.post_id == cursor, PostHashtag.hashtag == hashtag)
+            .scalar_subquery()
+        )
+        boundary = tuple_(cursor_date, cursor)
+        query = query.where(key > boundary if backward else key < boundary)
+
+    if backward:
+        query = query.order_by(PostHashtag.date.asc(), PostHashtag.post_id.asc())
+    else:
+        query = query.order_by(PostHashtag.date.desc(), PostHashtag.post_id.desc())
+
+    result = await session.execute(query)
+    posts = list(result.scalars().all())
+    has_more = len(posts) > limit
+    posts = posts[:limit]
+    if backward:
+        posts.reverse()
+    return posts, has_more
+
+
+async def get_posts_by_ids(session: AsyncSession, post_ids: list[int]) -> list[ChannelPost]:
+    """Посты с медиафайлами в порядке post_ids"""
+    result = await session.execute(
+        select(ChannelPost)
+        .where(ChannelPost.id.in_(post_ids))
+        .options(selectinload(ChannelPost.media_files))
+    )
+    posts = {post.id: post for post in result.scalars().all()}
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
+
+
+async def count_posts(session: AsyncSession) -> int:
+    return await session.scalar(select(func.count()).select_from(ChannelPost))
+
+
+async def stream_index_posts(session: AsyncSession, chunk_size: int):
+    """Пачки строк (id, message_id, date) всех постов по возрастанию id"""
+    result = await session.stream(
+        select(ChannelPost.id, ChannelPost.message_id, ChannelPost.date)
+        .order_by(ChannelPost.id)
+        .execution_options(yield_per=chunk_size)
+    )
+    async for rows in result.partitions():
+        yield rows
+
+
+async def stream_rubric_links(session: AsyncSession, chunk_size: int, hashtag: str | None = None):
+    """Пачки строк (hashtag, date, post_id, message_id) по возрастанию (hashtag, date, post_id)"""
+    query = (
+        select(PostHashtag.hashtag, PostHashtag.date, PostHashtag.post_id, ChannelPost.message_id)
+        .join(ChannelPost, ChannelPost.id == PostHashtag.post_id)
+        .order_by(PostHashtag.hashtag, PostHashtag.date, PostHashtag.post_id)
+        .execution_options(yield_per=chunk_size)
+    )
+    if hashtag is not None:
+        query = query.where(PostHashtag.hashtag == hashtag)
+    result = await session.stream(query)
+    async for rows in result.partitions():
+        yield rows
+
+
+async def get_media_message_ids(session: AsyncSession, post_ids: list[int]) -> list[tuple[int, int | None]]:
+    """Строки (post_id, message_id) медиафайлов постов"""
+    result = await session.execute(
+        select(PostMedia.post_id, PostMedia.message_id).where(PostMedia.post_id.in_(post_ids))
+    )
+    return result.all()
+
+
+async def add_hashtag_clicks(session: AsyncSession, clicks: dict[str, int], events: list[dict] | None = None):
+    """Атомарно прибавить накопленные клики: UPDATE ... SET click_count = click_count + :n.
+
+    events - записи журнала ClickEvent, пишутся в той же транзакции.
+    """
+    table = HashtagStats.__table__
+    if clicks:
+        await session.execute(
+            update(table)
+            .where(table.c.name == bindparam("b_name"))
+            .values(click_count=func.coalesce(table.c.click_count, 0) + bindparam("b_clicks")),
+            [{"b_name": name, "b_clicks": count} for name, count in clicks.items()]
+        )
+    if events:
+        await session.execute(insert(ClickEvent), events)
+    await session.commit()
+
+
+async def _upsert_views(session: AsyncSession, model, period: str, rows: list[dict]):
+    """Прибавляет views к агрегатам: INSERT ... ON CONFLICT DO UPDATE SET views = views + excluded.views"""
+    if not rows:
+        return
+    stmt = upsert_insert(session, model).values(rows)
+    await session.execute(stmt.on_conflict_do_update(
+        index_elements=[period, "hashtag", "post_id"],
+        set_={"views": model.views + stmt.excluded.views}
+    ))
+
+
+async def rollup_click_events(
+        session: AsyncSession,
+        retain_before: datetime | None = None,
+        limit: int = ROLLUP_BATCH_SIZE
+) -> int:
+    """Сворачивает новые записи журнала в почасовые и дневные агрегаты.
+
+    Обрабатывается не больше limit записей после сохранённой отметки
+    RollupState, поэтому каждая запись учитывается ровно один раз.
+    Свёрнутые записи старше retain_before удаляются.
+    Возвращает количество обработанных записей.
+    """
+    state = await session.get(RollupState, "click_events")
+    if state is None:
+        state = RollupState(name="click_events", last_event_id=0)
+        session.add(state)
+
+    ids = (
+        select(ClickEvent.id)
+        .where(ClickEvent.id > state.last_event_id)
+        .order_by(ClickEvent.id)
+        .limit(limit)
+        .subquery()
+    )
+    first_id, last_id, processed = (await session.execute(
+        select(func.min(ids.c.id), func.max(ids.c.id), func.count())
+    )).one()
+    if not processed:
+        await session.rollback()
+        return 0
+
+    result = await session.execute(
+        select(ClickEvent.hour, ClickEvent.hashtag, ClickEvent.post_id, func.sum(ClickEvent.count))
+        .where(ClickEvent.id.between(first_id, last_id))
+        .group_by(ClickEvent.hour, ClickEvent.hashtag, ClickEvent.post_id)
+    )
+    hourly = []
+    daily = Counter()
+    for hour, hashtag, post_id, views in result:
+        hourly.append({"hour": hour, "hashtag": hashtag, "post_id": post_id, "views": views})
+        daily[(hour.date(), hashtag, post_id)] += views
+
+    await _upsert_views(session, StatsHourly, "hour", hourly)
+    await _upsert_views(session, StatsDaily, "day", [
+        {"day": day, "hashtag": hashtag, "post_id": post_id, "views": views}
+        for (day, hashtag, post_id), views in daily.items()
+    ])
+
+    state.last_event_id = last_id
+    if retain_before is not None:
+        await session.execute(
+            delete(ClickEvent).where(ClickEvent.id <= last_id, ClickEvent.hour < retain_before)
+        )
     await session.commit()
-    return stats
\ No newline at end of file
+    return processed
+
+
+async def refresh_post_counts(session: AsyncSession) -> int:
+    """Пересчитывает HashtagStats.post_count, возвращает число изменившихся рубрик"""
+    counts = dict((await session.execute(
+        select(PostHashtag.hashtag, func.count()).group_by(PostHashtag.hashtag)
+    )).all())
+    current = (await session.execute(select(HashtagStats.name, HashtagStats.post_count))).all()
+    changed = [
+        {"b_name": name, "b_count": counts.get(name, 0)}
+        for name, post_count in current if post_count != counts.get(name, 0)
+    ]
+    if changed:
+        table = HashtagStats.__table__
+        await session.execute(
+            update(table).where(table.c.name == bindparam("b_name")).values(post_count=bindparam("b_count")),
+            changed
+        )
+        await session.commit()
+    return len(changed)
+
+
+def _stats_period(model):
+    return model.hour if model is StatsHourly else model.day
+
+
+async def get_rubric_views(session: AsyncSession, model, since=None) -> dict[str, int]:
+    """Клики по рубрикам из агрегатов (StatsHourly или StatsDaily) начиная с since"""
+    query = (
+        select(model.hashtag, func.sum(model.views))
+        .where(model.post_id == 0)
+        .group_by(model.hashtag)
+    )
+    if since is not None:
+        query = query.where(_stats_period(model) >= since)
+    return dict((await session.execute(query)).all())
+
+
+async def get_top_posts(session: AsyncSession, model, since=None, limit: int = 5):
+    """Самые просматриваемые посты из агрегатов: строки (message_id, text, views)"""
+    views = func.sum(model.views).label("views")
+    top = (
+        select(model.post_id, views)
+        .where(model.post_id != 0)
+        .group_by(model.post_id)
+        .order_by(views.desc())
+        .limit(limit)
+    )
+    if since is not None:
+        top = top.where(_stats_period(model) >= since)
+    top = top.subquery()
+    result = await session.execute(
+        select(ChannelPost.message_id, ChannelPost.text, top.c.views)
+        .join(top, top.c.post_id == ChannelPost.id)
+        .order_by(top.c.views.desc())
+    )
+    return result.all()
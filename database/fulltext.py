@@ -0,0 +1,113 @@
+# Полнотекстовый поиск по ChannelPost.text.
+# PostgreSQL: GIN-индекс по to_tsvector('russian', text), его поддерживает сама БД.
+# SQLite: таблица FTS5 с внешним содержимым, её пополняет index_posts при записи постов.
+import re
+
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncSession
+
+FTS_CONFIG = "russian"
+PG_INDEX_NAME = "ix_channel_posts_text_fts"
+SQLITE_FTS_TABLE = "channel_posts_fts"
+
+# Маркеры подсветки в сниппетах, заменяются на HTML после экранирования
+HIGHLIGHT_START = "\x02"
+HIGHLIGHT_END = "\x03"
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _dialect(bind) -> str:
+    return bind.dialect.name
+
+
+async def ensure_index(conn: AsyncConnection) -> bool:
+    """Создаёт полнотекстовый индекс, если его нет. True - если создан сейчас"""
+    dialect = _dialect(conn)
+    if dialect == "postgresql":
+        exists = await conn.scalar(text("SELECT to_regclass(:name)"), {"name": PG_INDEX_NAME})
+        if exists:
+            return False
+        await conn.execute(text(
+            f"CREATE INDEX {PG_INDEX_NAME} ON channel_posts "
+            f"USING gin (to_tsvector('{FTS_CONFIG}', coalesce(text, '')))"
+        ))
+        return True
+
+    if dialect == "sqlite":
+        exists = await conn.scalar(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {"name": SQLITE_FTS_TABLE}
+        )
+        if exists:
+            return False
+        await conn.execute(text(
+            f"CREATE VIRTUAL TABLE {SQLITE_FTS_TABLE} USING fts5("
+            f"text, content='channel_posts', content_rowid='id', tokenize='unicode61 remove_diacritics 2')"
+        ))
+        # Индексируем посты, которые уже есть в базе
+        await conn.execute(text(f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}) VALUES ('rebuild')"))
+        return True
+
+    return False
+
+
+async def index_posts(session: AsyncSession, posts: list[tuple[int, str | None]]):
+    """Добавляет новые посты (id, text) в индекс. Нужно только для SQLite"""
+    if _dialect(session.get_bind()) != "sqlite" or not posts:
+        return
+    await session.execute(
+        text(f"INSERT INTO {SQLITE_FTS_TABLE}(rowid, text) VALUES (:id, :text)"),
+        [{"id": post_id, "text": post_text or ""} for post_id, post_text in posts]
+    )
+
+
+async def unindex_post(session: AsyncSession, post_id: int, old_text: str | None):
+    """Убирает пост из индекса (перед удалением или заменой текста). Нужно только для SQLite"""
+    if _dialect(session.get_bind()) != "sqlite":
+        return
+    # Для FTS5 с внешним содержимым старую версию удаляют командой 'delete'
+    await session.execute(
+        text(f"INSERT INTO {SQLITE_FTS_TABLE}({SQLITE_FTS_TABLE}, rowid, text) VALUES ('delete', :id, :text)"),
+        {"id": post_id, "text": old_text or ""}
+    )
+
+
+async def search_posts(session: AsyncSession, query: str, limit: int, offset: int = 0):
+    """Ранжированный поиск: строки (id, message_id, date, snippet), лучшие первыми"""
+    dialect = _dialect(session.get_bind())
+    if dialect == "postgresql":
+        result = await session.execute(text(
+            f"""
+            SELECT p.id, p.message_id, p.date,
+                   ts_headline('{FTS_CONFIG}', coalesce(p.text, ''), q,
+                               'MaxFragments=1, MinWords=5, MaxWords=25, '
+                               'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}') AS snippet
+            FROM channel_posts p, websearch_to_tsquery('{FTS_CONFIG}', :query) q
+            WHERE to_tsvector('{FTS_CONFIG}', coalesce(p.text, '')) @@ q
+            ORDER BY ts_rank(to_tsvector('{FTS_CONFIG}', coalesce(p.text, '')), q) DESC, p.date DESC
+            LIMIT :limit OFFSET :offset
+            """
+        ), {"query": query, "limit": limit, "offset": offset})
+        return result.all()
+
+    if dialect == "sqlite":
+        # В SQLite нет русского стеммера: ищем слова по префиксу
+        words = _WORD_RE.findall(query)
+        if not words:
+            return []
+        match = " ".join(f'"{word}"*' for word in words)
+        result = await session.execute(text(
+            f"""
+            SELECT p.id, p.message_id, p.date,
+                   snippet({SQLITE_FTS_TABLE}, 0, '{HIGHLIGHT_START}', '{HIGHLIGHT_END}', '…', 25) AS snippet
+            FROM {SQLITE_FTS_TABLE}
+            JOIN channel_posts p ON p.id = {SQLITE_FTS_TABLE}.rowid
+            WHERE {SQLITE_FTS_TABLE} MATCH :match
+            ORDER BY bm25({SQLITE_FTS_TABLE}), p.date DESC
+            LIMIT :limit OFFSET :offset
+            """
+        ), {"match": match, "limit": limit, "offset": offset})
+        return result.all()
+
+    raise NotImplementedError(f"Полнотекстовый поиск не поддерживается для {dialect}")
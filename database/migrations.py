@@ -0,0 +1,295 @@
+"""Версионные миграции схемы БД.
+
+Номер последней применённой миграции хранится в schema_version. При
+запуске upgrade() читает его одним запросом и, если схема актуальна,
+больше ничего не проверяет. Иначе по очереди применяет недостающие шаги,
+каждый в своей транзакции вместе с новым номером версии. Все шаги
+идемпотентны: базы, созданные до появления версий, проходят их с начала.
+
+Шаг 1 создаёт таблицы по зафиксированной схеме SCHEMA_V1, а не по
+моделям: иначе новая база сразу получала бы текущую схему и следующие шаги
+шли бы на ней не так, как на обновляемой. Новое изменение схемы - правка
+модели вместе с новым шагом в конце MIGRATIONS (новые таблицы создаются
+через create(checkfirst=True), а не create_all). tests/test_migrations.py
+сверяет итоговую схему новой и обновлённой базы с моделями.
+
+Запуск отдельно от бота: python -m database.migrations
+"""
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, NamedTuple
+
+from sqlalchemy import (
+    Column, Date, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    select, insert, exists, inspect, text, update,
+)
+from sqlalchemy.sql import func
+from sqlalchemy.ext.asyncio import AsyncConnection, AsyncEngine
+
+from database.crud import split_hashtags
+from database.fulltext import ensure_index as ensure_fulltext_index
+from database.models import ChannelPost, HashtagStats, PostHashtag, PostMedia, SchemaVersion
+
+logger = logging.getLogger(__name__)
+
+BACKFILL_CHUNK = 1000
+# Блокировка PostgreSQL, чтобы два процесса не мигрировали одновременно
+PG_MIGRATION_LOCK = 0x73796d70
+
+# Схема версии 1: таблицы первого релиза и таблицы, появившиеся до версионных
+# миграций. Не меняется вместе с моделями - изменения идут следующими шагами
+SCHEMA_V1 = MetaData()
+
+Table(
+    "channel_posts", SCHEMA_V1,
+    Column("id", Integer, primary_key=True),
+    Column("message_id", Integer, unique=True),
+    Column("media_group_id", String),
+    Column("text", Text),
+    Column("date", DateTime(timezone=True), server_default=func.now()),
+    Column("hashtags", String),
+)
+
+Table(
+    "post_media", SCHEMA_V1,
+    Column("id", Integer, primary_key=True),
+    Column("post_id", Integer, ForeignKey("channel_posts.id")),
+    Column("media_type", String),
+    Column("file_id", String),
+    Column("file_unique_id", String),
+    Column("file_size", Integer),
+    Column("width", Integer),
+    Column("height", Integer),
+    Column("duration", Integer),
+    Column("mime_type", String),
+    Column("file_name", String),
+    Column("thumbnail_id", String),
+    Column("order_index", Integer),
+)
+
+Table(
+    "hashtag_stats", SCHEMA_V1,
+    Column("id", Integer, primary_key=True),
+    Column("name", String, unique=True),
+    Column("click_count", Integer),
+)
+
+_post_hashtags = Table(
+    "post_hashtags", SCHEMA_V1,
+    Column("post_id", Integer, ForeignKey("channel_posts.id", ondelete="CASCADE"), primary_key=True),
+    Column("hashtag", String, primary_key=True),
+    Column("date", DateTime(timezone=True), nullable=False),
+)
+Index(
+    "ix_post_hashtags_hashtag_date",
+    _post_hashtags.c.hashtag, _post_hashtags.c.date.desc(), _post_hashtags.c.post_id.desc(),
+)
+
+Table(
+    "click_events", SCHEMA_V1,
+    Column("id", Integer, primary_key=True),
+    Column("hour", DateTime(timezone=True), nullable=False),
+    Column("hashtag", String, nullable=False),
+    Column("post_id", Integer, nullable=False),
+    Column("count", Integer, nullable=False),
+)
+
+Table(
+    "stats_hourly", SCHEMA_V1,
+    Column("hour", DateTime(timezone=True), primary_key=True),
+    Column("hashtag", String, primary_key=True),
+    Column("post_id", Integer, primary_key=True, autoincrement=False),
+    Column("views", Integer, nullable=False),
+)
+
+Table(
+    "stats_daily", SCHEMA_V1,
+    Column("day", Date, primary_key=True),
+    Column("hashtag", String, primary_key=True),
+    Column("post_id", Integer, primary_key=True, autoincrement=False),
+    Column("views", Integer, nullable=False),
+)
+
+Table(
+    "rollup_state", SCHEMA_V1,
+    Column("name", String, primary_key=True),
+    Column("last_event_id", Integer, nullable=False),
+)
+
+# Колонки, добавленные после первого релиза: create(checkfirst=True) их в старые таблицы не добавит
+ADDED_COLUMNS = [
+    PostMedia.__table__.c.message_id,
+    HashtagStats.__table__.c.post_count,
+]
+
+
+async def add_missing_columns(conn: AsyncConnection) -> list[str]:
+    """Добавляет в существующие таблицы колонки из ADDED_COLUMNS"""
+    def existing_columns(sync_conn, table_name):
+        return {c["name"] for c in inspect(sync_conn).get_columns(table_name)}
+
+    added = []
+    for column in ADDED_COLUMNS:
+        table = column.table.name
+        if column.name in await conn.run_sync(existing_columns, table):
+            continue
+        column_type = column.type.compile(dialect=conn.dialect)
+        await conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column.name} {column_type}"))
+        added.append(f"{table}.{column.name}")
+    return added
+
+
+async def backfill_post_hashtags(conn: AsyncConnection) -> int:
+    """Заполняет post_hashtags из старой колонки ChannelPost.hashtags.
+
+    Обрабатывает только посты без связей, поэтому повторный запуск безопасен.
+    """
+    result = await conn.stream(
+        select(ChannelPost.id, ChannelPost.date, ChannelPost.hashtags)
+        .where(ChannelPost.hashtags.is_not(None))
+        .where(~exists().where(PostHashtag.post_id == ChannelPost.id))
+        .execution_options(yield_per=BACKFILL_CHUNK)
+    )
+
+    added = 0
+    rows = []
+    async for post_id, date, hashtags in result:
+        for tag in split_hashtags(hashtags):
+            rows.append({"post_id": post_id, "hashtag": tag, "date": date})
+        if len(rows) >= BACKFILL_CHUNK:
+            await conn.execute(insert(PostHashtag), rows)
+            added += len(rows)
+            rows = []
+
+    if rows:
+        await conn.execute(insert(PostHashtag), rows)
+        added += len(rows)
+    return added
+
+
+async def create_v1_tables(conn: AsyncConnection):
+    """Недостающие таблицы схемы SCHEMA_V1; существующие не трогает"""
+    await conn.run_sync(SCHEMA_V1.create_all, checkfirst=True)
+
+
+async def create_indexes(conn: AsyncConnection) -> list[str]:
+    """Индексы post_media.post_id, post_media.message_id и channel_posts.date"""
+    indexes = [
+        index
+        for table in (ChannelPost.__table__, PostMedia.__table__)
+        for index in table.indexes
+        if index.name in ("ix_channel_posts_date", "ix_post_media_post_id", "ix_post_media_message_id")
+    ]
+
+    def create(sync_conn):
+        existing = {
+            name
+            for table in ("channel_posts", "post_media")
+            for name in (i["name"] for i in inspect(sync_conn).get_indexes(table))
+        }
+        created = []
+        for index in indexes:
+            if index.name not in existing:
+                index.create(sync_conn)
+                created.append(index.name)
+        return created
+
+    return await conn.run_sync(create)
+
+
+async def cascade_post_media(conn: AsyncConnection) -> bool:
+    """ON DELETE CASCADE для post_media.post_id.
+
+    Только PostgreSQL: в SQLite ограничение таблицы не изменить без её
+    пересоздания, а внешние ключи там и так не проверяются.
+    """
+    if conn.dialect.name != "postgresql":
+        return False
+
+    def foreign_keys(sync_conn):
+        return inspect(sync_conn).get_foreign_keys("post_media")
+
+    changed = False
+    for fk in await conn.run_sync(foreign_keys):
+        if fk["referred_table"] != "channel_posts" or fk["options"].get("ondelete") == "CASCADE":
+            continue
+        await conn.execute(text(f'ALTER TABLE post_media DROP CONSTRAINT "{fk["name"]}"'))
+        changed = True
+    if changed:
+        await conn.execute(text(
+            "ALTER TABLE post_media ADD CONSTRAINT post_media_post_id_fkey "
+            "FOREIGN KEY (post_id) REFERENCES channel_posts (id) ON DELETE CASCADE"
+        ))
+    return changed
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    apply: Callable[[AsyncConnection], Awaitable[Any]]
+
+
+MIGRATIONS = [
+    Migration(1, "таблицы первой версии схемы", create_v1_tables),
+    Migration(2, "колонки, добавленные после первого релиза", add_missing_columns),
+    Migration(3, "перенос хештегов в post_hashtags", backfill_post_hashtags),
+    Migration(4, "полнотекстовый индекс постов", ensure_fulltext_index),
+    Migration(5, "индексы post_media и channel_posts.date", create_indexes),
+    Migration(6, "каскадное удаление медиа поста", cascade_post_media),
+]
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+async def get_version(conn: AsyncConnection) -> int:
+    """Текущая версия схемы; 0 - версий ещё нет (новая или старая база)"""
+    def has_table(sync_conn):
+        return inspect(sync_conn).has_table(SchemaVersion.__tablename__)
+
+    if not await conn.run_sync(has_table):
+        return 0
+    return await conn.scalar(select(SchemaVersion.version).where(SchemaVersion.id == 1)) or 0
+
+
+async def _set_version(conn: AsyncConnection, version: int):
+    result = await conn.execute(update(SchemaVersion).where(SchemaVersion.id == 1).values(version=version))
+    if result.rowcount == 0:
+        await conn.execute(insert(SchemaVersion).values(id=1, version=version))
+
+
+async def upgrade(engine: AsyncEngine) -> list[int]:
+    """Применяет недостающие миграции, возвращает номера применённых"""
+    async with engine.connect() as conn:
+        if await get_version(conn) >= LATEST_VERSION:
+            return []
+
+    applied = []
+    for migration in MIGRATIONS:
+        async with engine.begin() as conn:
+            if conn.dialect.name == "postgresql":
+                await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": PG_MIGRATION_LOCK})
+            await conn.run_sync(SchemaVersion.__table__.create, checkfirst=True)
+            # Версию перечитываем под блокировкой: шаг мог применить другой процесс
+            if await get_version(conn) >= migration.version:
+                continue
+            result = await migration.apply(conn)
+            await _set_version(conn, migration.version)
+        applied.append(migration.version)
+        details = f": {result}" if result else ""
+        logger.info(f"Применена миграция {migration.version} - {migration.description}{details}")
+    return applied
+
+
+async def main():
+    from database.session import get_engine
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    engine = get_engine()
+    try:
+        applied = await upgrade(engine)
+        print(f"Версия схемы {LATEST_VERSION}, применено миграций: {len(applied)}")
+    finally:
+        await engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, Text
+from sqlalchemy import Column, Integer, String, Date, DateTime, ForeignKey, Text, Index
 from sqlalchemy.sql import func
 from sqlalchemy.orm import relationship
 from database.session import Base
@@ -15,16 +15,25 @@ class ChannelPost(Base):
     hashtags = Column(String)
 
     # Связь с медиафайлами
-    media_files = relationship("PostMedia", back_populates="post", cascade="all, delete-orphan")
+    media_files = relationship(
+        "PostMedia", back_populates="post", cascade="all, delete-orphan", order_by="PostMedia.order_index"
+    )
+    # Нормализованные хештеги поста (см. PostHashtag)
+    hashtag_links = relationship("PostHashtag", back_populates="post", cascade="all, delete-orphan")
+
+    __table_args__ = (
+        Index('ix_channel_posts_date', 'date'),
+    )
 
 
 class PostMedia(Base):
     __tablename__ = 'post_media'
 
     id = Column(Integer, primary_key=True)
-    post_id = Column(Integer, ForeignKey('channel_posts.id'))
+    post_id = Column(Integer, ForeignKey('channel_posts.id', ondelete="CASCADE"))
     post = relationship("ChannelPost", back_populates="media_files")
 
+    message_id = Column(Integer, nullable=True)  # Сообщение канала с этим медиа (часть альбома)
     media_type = Column(String)  # photo, video, document, audio и т.д.
     file_id = Column(String)
     file_unique_id = Column(String)
@@ -37,10 +46,84 @@ class PostMedia(Base):
     thumbnail_id = Column(String, nullable=True)  # file_id превью
     order_index = Column(Integer)  # Порядок в альбоме
 
+    __table_args__ = (
+        # Медиа поста по порядку (selectinload media_files)
+        Index('ix_post_media_post_id', 'post_id', 'order_index'),
+        # Поиск поста по части альбома при редактировании
+        Index('ix_post_media_message_id', 'message_id'),
+    )
+
+
+class PostHashtag(Base):
+    """Связь пост ↔ хештег для поиска по рубрикам через индекс"""
+    __tablename__ = 'post_hashtags'
+
+    post_id = Column(Integer, ForeignKey('channel_posts.id', ondelete="CASCADE"), primary_key=True)
+    hashtag = Column(String, primary_key=True)
+    # Копия ChannelPost.date, чтобы выборка рубрики шла по одному индексу
+    date = Column(DateTime(timezone=True), nullable=False)
+
+    post = relationship("ChannelPost", back_populates="hashtag_links")
+
+    __table_args__ = (
+        Index('ix_post_hashtags_hashtag_date', 'hashtag', date.desc(), post_id.desc()),
+    )
+
 
 class HashtagStats(Base):
     __tablename__ = 'hashtag_stats'
 
     id = Column(Integer, primary_key=True)
     name = Column(String, unique=True)
-    click_count = Column(Integer, default=0)
\ No newline at end of file
+    click_count = Column(Integer, default=0)
+    # Количество постов рубрики, пересчитывается фоновым StatsRollup
+    post_count = Column(Integer, default=0)
+
+
+class ClickEvent(Base):
+    """Журнал просмотров: клики по рубрике (post_id = 0) и показы постов.
+
+    ClickCounter пишет его пачками, по строке на (час, рубрика, пост) за сброс.
+    StatsRollup сворачивает записи в StatsHourly/StatsDaily.
+    """
+    __tablename__ = 'click_events'
+
+    id = Column(Integer, primary_key=True)
+    hour = Column(DateTime(timezone=True), nullable=False)  # Начало часа (UTC)
+    hashtag = Column(String, nullable=False)
+    post_id = Column(Integer, nullable=False, default=0)
+    count = Column(Integer, nullable=False, default=1)
+
+
+class StatsHourly(Base):
+    __tablename__ = 'stats_hourly'
+
+    hour = Column(DateTime(timezone=True), primary_key=True)
+    hashtag = Column(String, primary_key=True)
+    post_id = Column(Integer, primary_key=True, autoincrement=False)  # 0 - клики по рубрике
+    views = Column(Integer, nullable=False, default=0)
+
+
+class StatsDaily(Base):
+    __tablename__ = 'stats_daily'
+
+    day = Column(Date, primary_key=True)
+    hashtag = Column(String, primary_key=True)
+    post_id = Column(Integer, primary_key=True, autoincrement=False)  # 0 - клики по рубрике
+    views = Column(Integer, nullable=False, default=0)
+
+
+class RollupState(Base):
+    """До какого ClickEvent.id журнал уже свёрнут в агрегаты"""
+    __tablename__ = 'rollup_state'
+
+    name = Column(String, primary_key=True)
+    last_event_id = Column(Integer, nullable=False, default=0)
+
+
+class SchemaVersion(Base):
+    """Номер последней применённой миграции (см. database/migrations.py)"""
+    __tablename__ = 'schema_version'
+
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
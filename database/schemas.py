@@ -0,0 +1,16 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+
+
+@dataclass
+class PostDraft:
+    """Пост канала, подготовленный к пакетной записи (без ORM-объектов)"""
+    message_id: int
+    text: str | None
+    date: datetime
+    hashtags: list[str]
+    media_group_id: str | None = None
+    # Значения колонок PostMedia (без post_id), в порядке order_index
+    media: list[dict] = field(default_factory=list)
+    # id записанного поста, заполняет save_post_drafts
+    post_id: int | None = None
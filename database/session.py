@@ -1,9 +1,121 @@
-from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from uuid import uuid4
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncEngine, AsyncSession
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from config import settings
 
 class Base(DeclarativeBase):
     pass
 
-engine = create_async_engine(settings.DATABASE_URL)
-async_session = sessionmaker(engine, expire_on_commit=False, class_=AsyncSession)
\ No newline at end of file
+
+def _is_memory_sqlite(url) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+
+
+def _sqlite_pragmas(read_only: bool) -> list[str]:
+    pragmas = [
+        f"PRAGMA journal_mode={settings.SQLITE_JOURNAL_MODE}",
+        f"PRAGMA synchronous={settings.SQLITE_SYNCHRONOUS}",
+        f"PRAGMA busy_timeout={settings.SQLITE_BUSY_TIMEOUT}",
+        f"PRAGMA mmap_size={settings.SQLITE_MMAP_SIZE}",
+        f"PRAGMA cache_size={settings.SQLITE_CACHE_SIZE}",
+    ]
+    if read_only:
+        pragmas.append("PRAGMA query_only=ON")
+    return pragmas
+
+
+def create_engine(database_url: str, read_only: bool = False) -> AsyncEngine:
+    """Движок с настройками пула и драйвера из settings"""
+    url = make_url(database_url)
+    options = {}
+
+    if url.get_backend_name() == "sqlite":
+        if not _is_memory_sqlite(url):
+            options.update(pool_size=settings.DB_POOL_SIZE, max_overflow=settings.DB_MAX_OVERFLOW)
+    else:
+        options.update(
+            pool_size=settings.DB_POOL_SIZE,
+            max_overflow=settings.DB_MAX_OVERFLOW,
+            pool_timeout=settings.DB_POOL_TIMEOUT,
+            pool_recycle=settings.DB_POOL_RECYCLE,
+            pool_pre_ping=settings.DB_POOL_PRE_PING,
+        )
+    if url.get_driver_name() == "asyncpg":
+        # Кэш подготовленных запросов SQLAlchemy на каждое соединение
+        connect_args = {"prepared_statement_cache_size": settings.DB_STATEMENT_CACHE_SIZE}
+        if not settings.DB_STATEMENT_CACHE_SIZE:
+            # pgbouncer в режиме transaction: выключаем и собственный кэш asyncpg, а
+            # подготовленные запросы получают уникальные имена, чтобы не
+            # пересекаться на общих соединениях сервера
+            connect_args["statement_cache_size"] = 0
+            connect_args["prepared_statement_name_func"] = lambda: f"__asyncpg_{uuid4()}__"
+        options["connect_args"] = connect_args
+    if read_only and url.get_backend_name() == "postgresql":
+        # Транзакции только на чтение: SET TRANSACTION READ ONLY
+        options["execution_options"] = {"postgresql_readonly": True}
+
+    new_engine = create_async_engine(url, **options)
+
+    if url.get_backend_name() == "sqlite" and not _is_memory_sqlite(url):
+        pragmas = _sqlite_pragmas(read_only)
+
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def set_sqlite_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+    return new_engine
+
+
+_engines: dict[str, AsyncEngine] = {}
+
+
+def get_engine() -> AsyncEngine:
+    """Движок основной БД; создаётся при первом обращении, а не при импорте"""
+    if "write" not in _engines:
+        _engines["write"] = create_engine(settings.DATABASE_URL)
+    return _engines["write"]
+
+
+def get_read_engine() -> AsyncEngine:
+    """Отдельный пул для чтения (поиск, рубрики, статистика), чтобы запросы
+    пользователей не ждали соединений, занятых записью постов. Может смотреть
+    на реплику (DATABASE_READ_URL); SQLite в памяти делит движок с записью.
+    """
+    if "read" not in _engines:
+        if settings.DATABASE_READ_URL or not _is_memory_sqlite(make_url(settings.DATABASE_URL)):
+            _engines["read"] = create_engine(settings.DATABASE_READ_URL or settings.DATABASE_URL, read_only=True)
+        else:
+            _engines["read"] = get_engine()
+    return _engines["read"]
+
+
+class LazySessionmaker:
+    """sessionmaker, который берёт движок при первом открытии сессии"""
+
+    def __init__(self, get_bind):
+        self._get_bind = get_bind
+        self._maker: sessionmaker | None = None
+
+    def __call__(self, **kwargs) -> AsyncSession:
+        if self._maker is None:
+            self._maker = sessionmaker(self._get_bind(), expire_on_commit=False, class_=AsyncSession)
+        return self._maker(**kwargs)
+
+
+async_session = LazySessionmaker(get_engine)
+read_session = LazySessionmaker(get_read_engine)
+
+
+def __getattr__(name: str):
+    # Старые импорты "from database.session import engine, read_engine"
+    if name == "engine":
+        return get_engine()
+    if name == "read_engine":
+        return get_read_engine()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,21 +1,117 @@
+import html
+from datetime import datetime, timedelta, timezone
+
 from aiogram import Router, types, F
+from aiogram.exceptions import TelegramBadRequest
 from aiogram.filters import Command
-from database.crud import get_all_hashtags
-from database.session import async_session
+from aiogram.methods import EditMessageText, SendMessage
+from config import settings
+from database.crud import get_rubric_views, get_top_posts
+from database.models import StatsDaily, StatsHourly
+from database.session import read_session
+from keyboards.inline import stats_keyboard
+from services.archive_index import archive_index
+from services.channel_parser import ChannelParser
+from services.click_counter import click_counter
+from services.hashtag_catalog import hashtag_catalog
+from services.links import post_link
+from services.page_cache import rubric_page_cache, rubric_page_flight
+from services.sender import OutboundDispatcher, PRIORITY_HIGH
 
 router = Router()
 
 
+# Периоды /stats: ключ (в callback_data и аргументе команды) -> подпись
+STATS_WINDOWS = {"today": "Сегодня", "7d": "7 дней", "30d": "30 дней", "all": "Всё время"}
+
+
+def stats_source(window: str):
+    """Таблица агрегатов и начало периода для окна статистики"""
+    now = datetime.now(timezone.utc)
+    if window == "today":
+        return StatsHourly, now.replace(hour=0, minute=0, second=0, microsecond=0)
+    if window == "7d":
+        return StatsDaily, now.date() - timedelta(days=6)
+    if window == "30d":
+        return StatsDaily, now.date() - timedelta(days=29)
+    return StatsDaily, None
+
+
 @router.message(Command("stats"))
 @router.callback_query(F.data.startswith("stats"))
-async def show_stats(message: types.Message | types.CallbackQuery):
-    async with async_session() as session:
-        hashtags = await get_all_hashtags(session)
-        stats_text = "📊 Статистика просмотров рубрик:\n\n"
-        for hashtag in sorted(hashtags, key=lambda x: x.click_count, reverse=True):
-            stats_text += f"{hashtag.name}: {hashtag.click_count} просмотров\n"
+async def show_stats(message: types.Message | types.CallbackQuery, sender: OutboundDispatcher):
+    if isinstance(message, types.CallbackQuery):
+        window = message.data.partition(":")[2]
+    else:
+        window = (message.text or "").partition(" ")[2].strip()
+    if window not in STATS_WINDOWS:
+        window = "all"
+
+    hashtags = await hashtag_catalog.get()
+    model, since = stats_source(window)
+    async with read_session() as session:
+        top_posts = await get_top_posts(session, model, since, limit=settings.STATS_TOP_POSTS)
+        if window == "all":
+            views = {}
+        else:
+            views = await get_rubric_views(session, model, since)
 
+    if window == "all":
+        # Сохранённые в БД клики + ещё не сброшенные (во всех процессах)
+        pending = await click_counter.pending_all()
+        counts = {hashtag.name: (hashtag.click_count or 0) + pending[hashtag.name] for hashtag in hashtags}
+    else:
+        counts = {hashtag.name: views.get(hashtag.name, 0) for hashtag in hashtags}
+    # Точное количество из индекса архива, иначе - пересчитанное StatsRollup
+    post_counts = {}
+    for hashtag in hashtags:
+        count = archive_index.post_count(hashtag.name)
+        post_counts[hashtag.name] = count if count is not None else hashtag.post_count
+
+    stats_text = f"📊 Статистика просмотров рубрик ({STATS_WINDOWS[window].lower()}):\n\n"
+    for name, count in sorted(counts.items(), key=lambda x: x[1], reverse=True):
+        stats_text += f"{name}: {count} просмотров, {post_counts[name]} постов\n"
+
+    if top_posts:
+        stats_text += "\n🔥 Популярные посты:\n"
+        for number, post in enumerate(top_posts, start=1):
+            title = html.escape(" ".join((post.text or "").split())[:60])
+            stats_text += f"{number}. {title}… — {post.views} просм.\n{post_link(post.message_id)}\n"
+
+    keyboard = stats_keyboard(STATS_WINDOWS, window)
     if isinstance(message, types.CallbackQuery):
-        await message.message.edit_text(stats_text)
+        chat_id = message.message.chat.id
+        await message.answer()
+        try:
+            await sender.send(chat_id, EditMessageText(
+                chat_id=chat_id,
+                message_id=message.message.message_id,
+                text=stats_text,
+                reply_markup=keyboard
+            ), PRIORITY_HIGH)
+        except TelegramBadRequest:
+            # Повторное нажатие на тот же период: текст не изменился
+            pass
     else:
-        await message.answer(stats_text)
\ No newline at end of file
+        await sender.send(message.chat.id, SendMessage(
+            chat_id=message.chat.id,
+            text=stats_text,
+            reply_markup=keyboard
+        ), PRIORITY_HIGH)
+
+
+def is_admin(message: types.Message) -> bool:
+    """Фильтр служебных команд: только пользователи из ADMIN_IDS"""
+    return message.from_user is not None and message.from_user.id in settings.ADMIN_IDS
+
+
+@router.message(Command("health"), is_admin)
+async def show_health(message: types.Message, channel_parser: ChannelParser, sender: OutboundDispatcher):
+    """Состояние приёма постов канала и кэша страниц (только для администраторов)"""
+    health = channel_parser.health()
+    health.update({f"page_cache_{key}": value for key, value in rubric_page_cache.stats().items()})
+    health["page_fetches_shared"] = rubric_page_flight.shared
+    health.update({f"archive_index_{key}": value for key, value in archive_index.stats().items()})
+    lines = ["🩺 Приём постов канала:\n"]
+    lines += [f"{key}: {value}" for key, value in health.items()]
+    await sender.send(message.chat.id, SendMessage(chat_id=message.chat.id, text="\n".join(lines)), PRIORITY_HIGH)
@@ -1,10 +1,23 @@
 from aiogram import Router, F
 from aiogram.types import Message
-from services.channel_parser import process_message
+from services.channel_parser import ChannelParser
 
 router = Router()
 
+
+@router.channel_post(F.media_group_id)
+async def handle_channel_album_part(message: Message, channel_parser: ChannelParser):
+    """Копит части альбома: пост сохранится, когда придут все элементы"""
+    channel_parser.add_album_part(message)
+
+
 @router.channel_post(F.text | F.caption)
-async def handle_channel_post(message: Message, bot):
+async def handle_channel_post(message: Message, channel_parser: ChannelParser):
     """Обрабатывает новые посты в канале"""
-    await process_message(message, bot)
\ No newline at end of file
+    await channel_parser.process_message(message)
+
+
+@router.edited_channel_post()
+async def handle_edited_channel_post(message: Message, channel_parser: ChannelParser):
+    """Синхронизирует сохранённый пост с отредактированным в канале"""
+    await channel_parser.process_edit(message)
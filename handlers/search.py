@@ -1,74 +1,410 @@
-from aiogram import Router, types, F, Bot
+import asyncio
+import html
+import logging
+from bisect import bisect_left
+
+from aiogram import Router, types, F
+from aiogram.filters import Command, CommandObject
+from aiogram.fsm.context import FSMContext
+from aiogram.exceptions import TelegramAPIError, TelegramBadRequest
+from aiogram.methods import (
+    CopyMessages, EditMessageText, ForwardMessages, SendAudio, SendDocument, SendMessage, SendMediaGroup,
+    SendPhoto, SendVideo, SendVoice, TelegramMethod
+)
 from aiogram.types import InputMediaPhoto, InputMediaVideo
-from database.crud import search_posts_by_hashtag, increment_hashtag_counter
-from database.session import async_session
-from sqlalchemy.orm import selectinload
+from config import settings
+from database.crud import get_hashtag, get_hashtag_by_id, get_posts_by_ids, get_rubric_page, RUBRIC_PAGE_SIZE
+from database.fulltext import search_posts, HIGHLIGHT_START, HIGHLIGHT_END
+from database.models import ChannelPost
+from database.session import read_session
+from keyboards.inline import rubric_page_keyboard, search_page_keyboard
+from services.archive_index import archive_index
+from services.click_counter import click_counter
+from services.hashtag_catalog import hashtag_catalog
+from services.links import post_link
+from services.page_cache import rubric_page_cache, rubric_page_flight
+from services.sender import OutboundDispatcher, PRIORITY_HIGH, PRIORITY_LOW
 
 router = Router()
+logger = logging.getLogger(__name__)
+
+# Лимит Bot API на число сообщений в одном copyMessages/forwardMessages
+MAX_BATCH_MESSAGES = 100
+
+
+class RenderedPage:
+    """Страница рубрики, готовая к отправке в любой чат.
+
+    items - (id поста, класс запроса Bot API, параметры без chat_id, текст на
+    случай ошибки отправки) для каждого поста; None, если страница выбрана
+    по индексу архива и посты ещё не читались (см. page_items). message_ids -
+    сообщения канала с этими постами по возрастанию (для copyMessages) или
+    None, если id частей какого-то альбома неизвестны. post_message_ids -
+    сообщение канала каждого поста из post_ids (первое сообщение альбома).
+    """
+    __slots__ = (
+        "hashtag_id", "items", "message_ids", "post_ids", "post_message_ids",
+        "first_id", "last_id", "has_prev", "has_next"
+    )
+
+    def __init__(
+            self,
+            hashtag_id: int,
+            items: list | None,
+            message_ids: list[int] | None,
+            post_ids: list[int],
+            post_message_ids: list[int],
+            first_id: int,
+            last_id: int,
+            has_prev: bool,
+            has_next: bool
+    ):
+        self.hashtag_id = hashtag_id
+        self.items = items
+        self.message_ids = message_ids
+        self.post_ids = post_ids
+        self.post_message_ids = post_message_ids
+        self.first_id = first_id
+        self.last_id = last_id
+        self.has_prev = has_prev
+        self.has_next = has_next
 
 
 @router.callback_query(F.data.startswith("hashtag:"))
-async def show_hashtag_posts(callback: types.CallbackQuery, bot: Bot):
+async def show_hashtag_posts(callback: types.CallbackQuery, sender: OutboundDispatcher):
     hashtag = callback.data.split(":")[1]
+    chat_id = callback.message.chat.id
+
+    # Увеличиваем счётчик (запишется в БД фоновым батчем)
+    click_counter.increment(hashtag)
+    await callback.answer()
+
+    # Первая страница рубрики (самые новые посты)
+    tag = await find_hashtag(name=hashtag)
+    page = await load_rubric_page(tag.name, tag.id) if tag else None
+
+    if not page:
+        await sender.send(chat_id, SendMessage(
+            chat_id=chat_id,
+            text=f"По рубрике {hashtag} пока нет публикаций."
+        ), PRIORITY_HIGH)
+        return
+
+    click_counter.record_views(tag.name, page.post_ids)
+    await send_rubric_page(sender, chat_id, page)
+
+
+@router.callback_query(F.data.startswith("page:"))
+async def show_rubric_page(callback: types.CallbackQuery, sender: OutboundDispatcher):
+    _, hashtag_id, cursor, direction = callback.data.split(":")
+
+    tag = await find_hashtag(hashtag_id=int(hashtag_id))
+    if not tag:
+        await callback.answer("Рубрика не найдена", show_alert=True)
+        return
+
+    page = await load_rubric_page(tag.name, tag.id, cursor=int(cursor), backward=direction == "p")
+    if not page:
+        await callback.answer("Больше публикаций нет")
+        return
+
+    await callback.answer()
+    click_counter.record_views(tag.name, page.post_ids)
+    await send_rubric_page(sender, callback.message.chat.id, page)
+
+
+async def find_hashtag(name: str | None = None, hashtag_id: int | None = None):
+    """Рубрика из кэша каталога, а если её там ещё нет - из БД"""
+    tag = await hashtag_catalog.find(name=name, hashtag_id=hashtag_id)
+    if tag is None:
+        async with read_session() as session:
+            if name is not None:
+                tag = await get_hashtag(session, name)
+            else:
+                tag = await get_hashtag_by_id(session, hashtag_id)
+    return tag
+
+
+async def load_rubric_page(
+        hashtag: str,
+        hashtag_id: int,
+        cursor: int | None = None,
+        backward: bool = False
+) -> RenderedPage | None:
+    """Страница рубрики из кэша; при промахе читается из БД и кэшируется.
+
+    Одновременные промахи по одной странице делят один запрос к БД.
+    """
+    key = (hashtag, cursor, backward)
+    page = rubric_page_cache.get(key)
+    if page is not None:
+        return page
+    return await rubric_page_flight.do(key, lambda: fetch_rubric_page(hashtag, hashtag_id, cursor, backward))
+
+
+async def fetch_rubric_page(
+        hashtag: str,
+        hashtag_id: int,
+        cursor: int | None,
+        backward: bool
+) -> RenderedPage | None:
+    key = (hashtag, cursor, backward)
+    generation = rubric_page_cache.generation(hashtag)
+    selection = await archive_index.rubric_page(hashtag, cursor, backward, RUBRIC_PAGE_SIZE)
+    if selection is not None:
+        # Страница выбрана по индексу в памяти, сами посты читаются только при отправке заново
+        post_ids, has_more = selection
+        posts = None
+        message_ids = await archive_index.message_ids(post_ids) if post_ids else None
+        post_message_ids = archive_index.post_message_ids(post_ids)
+    else:
+        async with read_session() as session:
+            posts, has_more = await get_rubric_page(session, hashtag, cursor=cursor, backward=backward)
+        post_ids = [post.id for post in posts]
+        post_message_ids = [post.message_id for post in posts]
+        message_ids = page_message_ids(posts)
+    if not post_ids:
+        return None
+    if post_message_ids is None:
+        message_ids = None
+
+    if cursor is None:
+        has_prev, has_next = False, has_more
+    elif backward:
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = True, has_more
+
+    page = RenderedPage(
+        hashtag_id=hashtag_id,
+        items=[(post.id, *render_post(post)) for post in posts] if posts is not None else None,
+        message_ids=message_ids,
+        post_ids=post_ids,
+        post_message_ids=post_message_ids or [],
+        first_id=post_ids[0],
+        last_id=post_ids[-1],
+        has_prev=has_prev,
+        has_next=has_next
+    )
+    rubric_page_cache.put(key, page, generation)
+    return page
+
+
+async def page_items(page: RenderedPage) -> list:
+    """Запросы для отправки постов страницы заново; при необходимости читает посты из БД"""
+    if page.items is None:
+        async with read_session() as session:
+            posts = await get_posts_by_ids(session, page.post_ids)
+        page.items = [(post.id, *render_post(post)) for post in posts]
+    return page.items
+
+
+async def send_rubric_page(sender: OutboundDispatcher, chat_id: int, page: RenderedPage):
+    """Отправляет одну страницу постов и кнопки навигации.
+
+    В режиме copy/forward вся страница уходит одним запросом copyMessages
+    (forwardMessages), при ошибке заново по file_id отправляются только
+    посты, которые не удалось скопировать. Все запросы сразу
+    ставятся в очередь OutboundDispatcher: порядок в чате сохраняется, а
+    темп отправки задают лимиты диспетчера. Посты в чате идут от старых к
+    новым в обоих режимах: copyMessages принимает id только по возрастанию.
+    """
+    delivered = await copy_rubric_page(sender, chat_id, page)
+    if len(delivered) < len(page.post_ids):
+        # Страница хранится от новых к старым, отправляем в порядке copyMessages
+        items = [item for item in reversed(await page_items(page)) if item[0] not in delivered]
+        results = await asyncio.gather(
+            *(sender.send(chat_id, method(chat_id=chat_id, **params), PRIORITY_LOW) for _, method, params, _ in items),
+            return_exceptions=True
+        )
+        for (_, _, _, fallback_text), result in zip(items, results):
+            if isinstance(result, Exception):
+                logger.error(f"Ошибка при отправке поста: {result}")
+                await sender.send(chat_id, SendMessage(chat_id=chat_id, text=fallback_text), PRIORITY_LOW)
+
+    keyboard = rubric_page_keyboard(page.hashtag_id, page.first_id, page.last_id, page.has_prev, page.has_next)
+    if keyboard:
+        await sender.send(chat_id, SendMessage(
+            chat_id=chat_id,
+            text="Ещё публикации рубрики:",
+            reply_markup=keyboard
+        ), PRIORITY_LOW)
+
+
+async def copy_rubric_page(sender: OutboundDispatcher, chat_id: int, page: RenderedPage) -> set[int]:
+    """Копирует сообщения страницы из канала, возвращает id доставленных постов.
+
+    Остальные посты нужно отправить заново: при ошибке пачки уже
+    скопированные пачки повторно не отправляются.
+    """
+    if settings.DELIVERY_MODE not in ("copy", "forward") or not page.message_ids:
+        return set()
+
+    method = CopyMessages if settings.DELIVERY_MODE == "copy" else ForwardMessages
+    delivered = set()
+    # Telegram отправляет сообщения по возрастанию id и сохраняет альбомы
+    for message_ids, post_ids in copy_batches(page):
+        try:
+            await sender.send(chat_id, method(
+                chat_id=chat_id,
+                from_chat_id=settings.CHANNEL_ID,
+                message_ids=message_ids
+            ), PRIORITY_LOW)
+        except TelegramAPIError as e:
+            # Например, пост удалён из канала или у бота нет доступа к нему
+            logger.warning(f"Не удалось скопировать посты из канала, отправляем заново: {e}")
+            break
+        delivered.update(post_ids)
+    return delivered
+
+
+def copy_batches(page: RenderedPage) -> list[tuple[list[int], list[int]]]:
+    """Сообщения страницы пачками до MAX_BATCH_MESSAGES: (id сообщений, id постов).
+
+    Альбом не разрывается между пачками, чтобы пост был доставлен целиком
+    или не доставлен совсем.
+    """
+    starts = sorted(zip(page.post_message_ids, page.post_ids))
+    batches: list[tuple[list[int], list[int]]] = []
+    pos = 0
+    for i, (first_message_id, post_id) in enumerate(starts):
+        # Сообщения поста - от его первого сообщения до первого сообщения следующего
+        end = len(page.message_ids)
+        if i + 1 < len(starts):
+            end = bisect_left(page.message_ids, starts[i + 1][0], pos)
+        message_ids = page.message_ids[pos:end]
+        pos = end
+        if not batches or len(batches[-1][0]) + len(message_ids) > MAX_BATCH_MESSAGES:
+            batches.append(([], []))
+        batches[-1][0].extend(message_ids)
+        batches[-1][1].append(post_id)
+    return batches
+
+
+def page_message_ids(posts: list[ChannelPost]) -> list[int] | None:
+    """Все сообщения канала со страницы постов (с частями альбомов) по возрастанию"""
+    message_ids = set()
+    for post in posts:
+        message_ids.add(post.message_id)
+        if len(post.media_files) > 1 and any(media.message_id is None for media in post.media_files):
+            # Альбом сохранён до появления PostMedia.message_id: части не скопировать
+            return None
+        message_ids.update(media.message_id for media in post.media_files if media.message_id is not None)
+    return sorted(message_ids)
+
+
+# Типы медиа, которые отправляются только по одному: метод и его поле с file_id
+SINGLE_MEDIA_METHODS = {
+    "document": (SendDocument, "document"),
+    "audio": (SendAudio, "audio"),
+    "voice": (SendVoice, "voice"),
+}
+
+
+def render_post(post: ChannelPost) -> tuple[type[TelegramMethod], dict, str]:
+    """Запрос к Bot API (без chat_id), которым пост отправляется пользователю"""
+    text = post.text or "📄 Сообщение без текста"
+
+    # Группируем медиа по типам для правильной отправки
+    media_group = []
+    for media in post.media_files:
+        if not media.file_id:
+            # Медиа из экспорта Telegram Desktop хранятся без file_id
+            continue
+        if media.media_type == 'photo':
+            media_group.append(InputMediaPhoto(
+                media=media.file_id,
+                caption=post.text if not media_group else None
+            ))
+        elif media.media_type == 'video':
+            media_group.append(InputMediaVideo(
+                media=media.file_id,
+                caption=post.text if not media_group else None
+            ))
+        # Можно добавить обработку других типов медиа
+
+    if not media_group:
+        # Документ, аудио или голосовое без альбома отправляем своим методом
+        single = next((m for m in post.media_files if m.file_id), None)
+        if single is not None and single.media_type in SINGLE_MEDIA_METHODS:
+            method, field = SINGLE_MEDIA_METHODS[single.media_type]
+            return method, {field: single.file_id, "caption": post.text}, text
+        # Если нет медиа - просто отправляем текст
+        return SendMessage, {"text": text}, text
+
+    if len(media_group) > 1:
+        # Если медиа несколько - отправляем как альбом
+        return SendMediaGroup, {"media": media_group}, text
+
+    # Если одно медиа - отправляем соответствующе
+    media = media_group[0]
+    if isinstance(media, InputMediaPhoto):
+        return SendPhoto, {"photo": media.media, "caption": media.caption}, text
+    return SendVideo, {"video": media.media, "caption": media.caption}, text
+
+
+@router.message(Command("search"))
+async def cmd_search(message: types.Message, command: CommandObject, state: FSMContext, sender: OutboundDispatcher):
+    query = (command.args or "").strip()
+    if not query:
+        await sender.send(message.chat.id, SendMessage(
+            chat_id=message.chat.id,
+            text="Напишите, что искать: /search <запрос>"
+        ), PRIORITY_HIGH)
+        return
+
+    # Запрос может не поместиться в callback_data, поэтому храним его в состоянии
+    await state.update_data(search_query=query)
+    await send_search_page(sender, message.chat.id, query, page=0)
+
+
+@router.callback_query(F.data.startswith("fts:"))
+async def show_search_page(callback: types.CallbackQuery, state: FSMContext, sender: OutboundDispatcher):
+    query = (await state.get_data()).get("search_query")
+    if not query:
+        await callback.answer("Повторите поиск командой /search", show_alert=True)
+        return
+
+    await callback.answer()
+    page = int(callback.data.split(":")[1])
+    await send_search_page(sender, callback.message.chat.id, query, page, edit_message_id=callback.message.message_id)
+
+
+async def send_search_page(
+        sender: OutboundDispatcher,
+        chat_id: int,
+        query: str,
+        page: int,
+        edit_message_id: int | None = None
+):
+    """Страница результатов полнотекстового поиска со сниппетами"""
+    limit = settings.SEARCH_PAGE_SIZE
+    async with read_session() as session:
+        rows = await search_posts(session, query, limit=limit + 1, offset=page * limit)
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+
+    if not rows:
+        text = f"По запросу «{html.escape(query)}» ничего не найдено."
+    else:
+        lines = [f"🔎 Результаты по запросу «{html.escape(query)}»:\n"]
+        for number, row in enumerate(rows, start=page * limit + 1):
+            snippet = html.escape(row.snippet or "")
+            snippet = snippet.replace(HIGHLIGHT_START, "<b>").replace(HIGHLIGHT_END, "</b>")
+            lines.append(f"{number}. {snippet}\n{post_link(row.message_id)}\n")
+        text = "\n".join(lines)
 
-    async with async_session() as session:
-        # Увеличиваем счётчик
-        await increment_hashtag_counter(session, hashtag)
-
-        # Ищем посты с загрузкой связанных медиафайлов
-        posts = await search_posts_by_hashtag(session, hashtag)
-
-        if not posts:
-            await callback.message.answer(f"По рубрике {hashtag} пока нет публикаций.")
-            await callback.answer()
-            return
-
-        # Ограничиваем вывод (например, 5 последних постов)
-        for post in posts:
-            if not post.media_files:
-                # Если нет медиа - просто отправляем текст
-                await callback.message.answer(post.text or "📄 Сообщение без текста")
-                continue
-
-            # Группируем медиа по типам для правильной отправки
-            media_group = []
-            for media in sorted(post.media_files, key=lambda x: x.order_index):
-                if media.media_type == 'photo':
-                    media_group.append(InputMediaPhoto(
-                        media=media.file_id,
-                        caption=post.text if not media_group else None
-                    ))
-                elif media.media_type == 'video':
-                    media_group.append(InputMediaVideo(
-                        media=media.file_id,
-                        caption=post.text if not media_group else None
-                    ))
-                # Можно добавить обработку других типов медиа
-
-            try:
-                if len(media_group) > 1:
-                    # Если медиа несколько - отправляем как альбом
-                    await bot.send_media_group(
-                        chat_id=callback.message.chat.id,
-                        media=media_group
-                    )
-                else:
-                    # Если одно медиа - отправляем соответствующе
-                    media = media_group[0]
-                    if isinstance(media, InputMediaPhoto):
-                        await bot.send_photo(
-                            chat_id=callback.message.chat.id,
-                            photo=media.media,
-                            caption=media.caption
-                        )
-                    elif isinstance(media, InputMediaVideo):
-                        await bot.send_video(
-                            chat_id=callback.message.chat.id,
-                            video=media.media,
-                            caption=media.caption
-                        )
-            except Exception as e:
-                print(f"Ошибка при отправке медиа: {e}")
-                await callback.message.answer(post.text or "📄 Сообщение без текста")
-
-        await callback.answer()
\ No newline at end of file
+    keyboard = search_page_keyboard(page, has_prev=page > 0, has_next=has_next)
+    if edit_message_id:
+        try:
+            await sender.send(chat_id, EditMessageText(
+                chat_id=chat_id,
+                message_id=edit_message_id,
+                text=text,
+                reply_markup=keyboard
+            ), PRIORITY_HIGH)
+        except TelegramBadRequest:
+            # Повторное нажатие на ту же страницу: текст не изменился
+            pass
+    else:
+        await sender.send(chat_id, SendMessage(chat_id=chat_id, text=text, reply_markup=keyboard), PRIORITY_HIGH)
@@ -1,17 +1,18 @@
 from aiogram import Router, types
 from aiogram.filters import Command
-from database.crud import get_all_hashtags
-from database.session import async_session
+from aiogram.methods import SendMessage
 from keyboards.inline import hashtags_keyboard
+from services.hashtag_catalog import hashtag_catalog
+from services.sender import OutboundDispatcher, PRIORITY_HIGH
 
 router = Router()
 
 @router.message(Command("start"))
-async def cmd_start(message: types.Message):
-    async with async_session() as session:
-        hashtags = await get_all_hashtags(session)
-        keyboard = await hashtags_keyboard(hashtags)
-        await message.answer(
-            "Выберите рубрику для поиска:",
-            reply_markup=keyboard
-        )
\ No newline at end of file
+async def cmd_start(message: types.Message, sender: OutboundDispatcher):
+    hashtags = await hashtag_catalog.get()
+    keyboard = await hashtags_keyboard(hashtags, version=hashtag_catalog.version)
+    await sender.send(message.chat.id, SendMessage(
+        chat_id=message.chat.id,
+        text="Выберите рубрику для поиска:",
+        reply_markup=keyboard
+    ), PRIORITY_HIGH)
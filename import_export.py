@@ -1,27 +1,532 @@
+import argparse
+import gzip
+import io
 import json
+import os
 import re
 import asyncio
+import sys
+import time
 from datetime import datetime
-from sqlalchemy import select, insert
+from typing import BinaryIO, Callable, Iterable, Iterator
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import ChannelPost, HashtagStats
+from sqlalchemy.orm import selectinload
+from config import settings
+from database.crud import FIXED_HASHTAGS, MEDIA_FIELDS, init_hashtags, save_post_drafts, split_hashtags
+from database.models import ChannelPost
+from database.schemas import PostDraft
 from database.session import async_session
 
-FIXED_HASHTAGS = [
-    "#новости",
-    "#анонсы",
-    "#истории",
-    "#советы",
-    "#обзоры",
-    "#авторскиеукрашения",
-]
+try:
+    import zstandard
+except ImportError:  # Нужен только для файлов .zst
+    zstandard = None
 
+# Поиск хештегов готовится один раз, а не для каждого сообщения
+HASHTAG_RE = re.compile(r'#\w+')
+# Рубрики бота без учёта регистра -> их написание в БД
+CANONICAL_HASHTAGS = {tag.lower(): tag for tag in FIXED_HASHTAGS}
+
+# Сколько постов записывать в БД одним пакетом (и одним коммитом)
+IMPORT_CHUNK_SIZE = 500
+# Размер блока чтения файла при потоковом разборе
+READ_CHUNK_SIZE = 1 << 20
+# Сколько постов выгружать одним блоком (и одной контрольной точкой)
+EXPORT_CHUNK_SIZE = 1000
+
+# Форматы архива: JSON как у Telegram Desktop и NDJSON (пост на строку, без потерь)
+FORMATS = ("telegram", "ndjson")
+TELEGRAM_DATE_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+# Типы файлов из экспорта Telegram Desktop -> PostMedia.media_type
+EXPORT_MEDIA_TYPES = {
+    "video_file": "video",
+    "audio_file": "audio",
+    "voice_message": "voice",
+    "video_message": "video_note",
+    "animation": "animation",
+    "sticker": "sticker",
+}
+
+EXPORT_MEDIA_TYPES_REVERSE = {value: key for key, value in EXPORT_MEDIA_TYPES.items()}
+
+_MESSAGES_START = re.compile(r'"messages"\s*:\s*\[')
+_SEPARATORS = re.compile(r'[\s,]*')
+
+
+def detect_compression(file_path: str) -> str | None:
+    if file_path.endswith(".gz"):
+        return "gzip"
+    if file_path.endswith(".zst"):
+        return "zstd"
+    return None
+
+
+def detect_format(file_path: str) -> str:
+    """*.json (в т.ч. .json.gz) - формат Telegram, остальное - NDJSON"""
+    name = file_path.removesuffix(".gz").removesuffix(".zst")
+    return "telegram" if name.endswith(".json") else "ndjson"
+
+
+def _zstd():
+    if zstandard is None:
+        raise RuntimeError("Для файлов .zst установите пакет zstandard (см. requirements-optional.txt)")
+    return zstandard
+
+
+def open_input(file_path: str, offset: int = 0) -> BinaryIO:
+    """Открывает архив на чтение (с распаковкой) с позиции offset распакованных данных"""
+    # Для сжатых файлов seek - это распаковка до offset без разбора JSON
+    compression = detect_compression(file_path)
+    if compression == "zstd":
+        reader = _zstd().ZstdDecompressor().stream_reader(open(file_path, "rb"), read_across_frames=True)
+        reader.seek(offset)
+        return io.BufferedReader(reader)
+
+    f = gzip.open(file_path, "rb") if compression == "gzip" else open(file_path, "rb")
+    f.seek(offset)
+    return f
+
+
+class StreamPosition:
+    """Байтовая позиция (в распакованных данных) после последнего прочитанного сообщения.
+
+    По ней импорт продолжается с места остановки, не разбирая файл с начала.
+    """
+    __slots__ = ("base", "text", "pos")
+
+    def __init__(self, offset: int = 0):
+        self.base = offset
+        self.text = ""
+        self.pos = 0
+
+    @property
+    def offset(self) -> int:
+        # Пересчёт из символов в байты нужен только при сохранении контрольной точки
+        return self.base + len(self.text[:self.pos].encode("utf-8"))
+
+
+def iter_export_messages(
+        file_path: str,
+        chunk_size: int = READ_CHUNK_SIZE,
+        position: StreamPosition | None = None
+) -> Iterator[dict]:
+    """Потоково читает массив "messages" из result.json.
+
+    В памяти держится только текущий блок файла, поэтому размер экспорта
+    не ограничен объёмом RAM. Если передан position с ненулевым offset,
+    чтение начинается с этой позиции внутри массива.
+    """
+    position = position or StreamPosition()
+    decoder = json.JSONDecoder()
+    with io.TextIOWrapper(open_input(file_path, position.base), encoding='utf-8', newline="") as f:
+        buf = ""
+        pos = 0
+        # С ненулевой позиции чтение идёт уже внутри массива
+        in_messages = position.base > 0
+        while not in_messages:
+            match = _MESSAGES_START.search(buf)
+            if match:
+                pos = match.end()
+                in_messages = True
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            # Хвост оставляем на случай, если ключ разрезан между блоками
+            position.base += len(buf[:-32].encode("utf-8"))
+            buf = buf[-32:] + chunk
+
+        while True:
+            pos = _SEPARATORS.match(buf, pos).end()
+            if buf.startswith("]", pos):
+                return
+            try:
+                msg, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    if buf[pos:].strip():
+                        raise
+                    return
+                position.base += len(buf[:pos].encode("utf-8"))
+                buf, pos = buf[pos:] + chunk, 0
+                continue
+            position.text, position.pos = buf, pos
+            yield msg
+
+
+def iter_ndjson(file_path: str, position: StreamPosition | None = None) -> Iterator[dict]:
+    """Построчно читает NDJSON-архив, начиная с position.offset"""
+    position = position or StreamPosition()
+    with open_input(file_path, position.base) as f:
+        for line in f:
+            position.base += len(line)
+            line = line.strip()
+            if line:
+                yield json.loads(line)
+
+
+def export_text(msg: dict) -> str:
+    """Текст сообщения: в экспорте это строка или список фрагментов"""
+    text = msg.get('text') or ""
+    if isinstance(text, list):
+        text = "".join(part if isinstance(part, str) else part.get('text', "") for part in text)
+    return text
+
+
+def export_media(msg: dict) -> list[dict]:
+    """Медиа сообщения из экспорта в виде значений колонок PostMedia.
+
+    В экспорте нет file_id, поэтому сохраняется путь к файлу в file_name.
+    """
+    if msg.get('photo'):
+        return [dict(
+            media_type="photo",
+            file_name=msg['photo'],
+            file_size=msg.get('photo_file_size'),
+            width=msg.get('width'),
+            height=msg.get('height'),
+        )]
+    if msg.get('file'):
+        return [dict(
+            media_type=EXPORT_MEDIA_TYPES.get(msg.get('media_type'), "document"),
+            file_name=msg['file'],
+            file_size=msg.get('file_size'),
+            width=msg.get('width'),
+            height=msg.get('height'),
+            duration=msg.get('duration_seconds'),
+            mime_type=msg.get('mime_type'),
+        )]
+    return []
+
+
+def export_to_draft(msg: dict) -> PostDraft | None:
+    """Пост для записи в БД или None, если в сообщении нет нужных хештегов.
+
+    В нашей собственной выгрузке (post_to_export_messages) у сообщения есть
+    поле hashtags: хештеги поста берутся из него как есть.
+    """
+    if msg.get('type', 'message') != 'message':
+        return None
+    text = export_text(msg)
+    if not text:
+        return None
+
+    if 'hashtags' in msg:
+        msg_hashtags = msg['hashtags']
+    else:
+        # Извлекаем только рубрики бота, в том написании, под которым они есть в БД
+        msg_hashtags = list(dict.fromkeys(
+            CANONICAL_HASHTAGS[tag.lower()] for tag in HASHTAG_RE.findall(text)
+            if tag.lower() in CANONICAL_HASHTAGS
+        ))
+    if not msg_hashtags:
+        return None
+
+    return PostDraft(
+        message_id=msg['id'],
+        text=text,
+        date=datetime.strptime(msg['date'], TELEGRAM_DATE_FORMAT),
+        hashtags=msg_hashtags,
+        media=export_media(msg)
+    )
+
+
+def record_to_draft(record: dict) -> PostDraft:
+    """Пост из строки NDJSON-архива (обратное к post_to_record)"""
+    return PostDraft(
+        message_id=record['message_id'],
+        text=record.get('text'),
+        date=datetime.fromisoformat(record['date']),
+        hashtags=record.get('hashtags', []),
+        media_group_id=record.get('media_group_id'),
+        media=record.get('media', [])
+    )
+
+
+def post_to_record(post: ChannelPost) -> dict:
+    """Строка NDJSON-архива: пост со всеми медиа, без потерь"""
+    return {
+        "message_id": post.message_id,
+        "date": post.date.isoformat(),
+        "text": post.text,
+        "hashtags": split_hashtags(post.hashtags),
+        "media_group_id": post.media_group_id,
+        "media": [
+            {name: getattr(media, name) for name in MEDIA_FIELDS if getattr(media, name) is not None}
+            for media in post.media_files
+        ],
+    }
+
+
+def post_to_export_messages(post: ChannelPost) -> list[dict]:
+    """Сообщения в формате экспорта Telegram Desktop.
+
+    Как и в настоящем экспорте, каждая часть альбома - отдельное сообщение,
+    текст есть только у первого. file_id в этом формате не предусмотрен:
+    вместо пути к файлу пишется file_name или file_id. Хештеги поста
+    пишутся в первое сообщение полем hashtags, чтобы импорт вернул их без
+    изменений.
+
+    Обратный импорт этого формата всё же с потерями: части альбома без
+    текста не импортируются, file_id превращается в file_name, часовой пояс
+    даты отбрасывается. Без потерь - только NDJSON.
+    """
+    date = post.date.strftime(TELEGRAM_DATE_FORMAT)
+    messages = [{
+        "id": post.message_id,
+        "type": "message",
+        "date": date,
+        "text": post.text or "",
+        "hashtags": split_hashtags(post.hashtags),
+    }]
+    for index, media in enumerate(post.media_files):
+        if index:
+            messages.append({
+                "id": media.message_id or post.message_id + index,
+                "type": "message",
+                "date": date,
+                "text": ""
+            })
+        msg = messages[-1]
+        path = media.file_name or media.file_id
+        if media.media_type == "photo":
+            msg.update(photo=path, photo_file_size=media.file_size, width=media.width, height=media.height)
+        else:
+            msg.update(file=path, file_size=media.file_size, mime_type=media.mime_type)
+            if media.media_type in EXPORT_MEDIA_TYPES_REVERSE:
+                msg["media_type"] = EXPORT_MEDIA_TYPES_REVERSE[media.media_type]
+            for key, value in (("width", media.width), ("height", media.height),
+                               ("duration_seconds", media.duration)):
+                if value is not None:
+                    msg[key] = value
+    return messages
+
+
+def checkpoint_path(file_path: str, kind: str) -> str:
+    return f"{file_path}.{kind}-checkpoint.json"
+
+
+def load_checkpoint(path: str) -> dict | None:
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def save_checkpoint(path: str, data: dict):
+    """Атомарно перезаписывает контрольную точку"""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class ExportWriter:
+    """Файл архива, который пишется блоками.
+
+    Сжатый блок - отдельный gzip-member или zstd-кадр; склеенные они
+    читаются как один поток. Поэтому файл можно обрезать по границе блока
+    из контрольной точки и дописывать дальше.
+    """
+
+    def __init__(self, file_path: str, offset: int | None = None):
+        self.compression = detect_compression(file_path)
+        if offset is None:
+            self._file = open(file_path, "wb")
+        else:
+            self._file = open(file_path, "r+b")
+            self._file.truncate(offset)
+            self._file.seek(offset)
+
+    def write(self, text: str) -> int:
+        """Дописывает блок и возвращает размер файла после него"""
+        data = text.encode("utf-8")
+        if self.compression == "gzip":
+            data = gzip.compress(data, mtime=0)
+        elif self.compression == "zstd":
+            data = _zstd().ZstdCompressor().compress(data)
+        self._file.write(data)
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        return self._file.tell()
+
+    def close(self):
+        self._file.close()
+
+
+async def export_posts(
+        session: AsyncSession,
+        file_path: str,
+        file_format: str,
+        resume: bool = False,
+        chunk_size: int = EXPORT_CHUNK_SIZE
+) -> int:
+    """Потоковая выгрузка постов с медиа в архив, возвращает число выгруженных постов.
+
+    Посты читаются курсором по возрастанию message_id, в памяти только
+    текущий блок. После каждого блока сохраняется контрольная точка; с
+    resume=True выгрузка продолжается после неё (в том числе дописываются
+    посты, появившиеся после прошлой полной выгрузки).
+    """
+    checkpoint_file = checkpoint_path(file_path, "export")
+    checkpoint = load_checkpoint(checkpoint_file) if resume else None
+    if checkpoint and checkpoint["format"] != file_format:
+        raise ValueError(f"Контрольная точка записана для формата {checkpoint['format']}")
+
+    last_message_id = checkpoint["message_id"] if checkpoint else 0
+    exported = checkpoint["exported"] if checkpoint else 0
+    written_messages = checkpoint["messages"] if checkpoint else 0
+    writer = ExportWriter(file_path, checkpoint["offset"] if checkpoint else None)
+
+    def save(offset: int):
+        save_checkpoint(checkpoint_file, {
+            "format": file_format,
+            "message_id": last_message_id,
+            "offset": offset,
+            "exported": exported,
+            "messages": written_messages,
+        })
+
+    started = time.monotonic()
+    added = 0
+    try:
+        if checkpoint is None:
+            if file_format == "telegram":
+                header = json.dumps({"type": "public_channel", "id": settings.CHANNEL_ID}, ensure_ascii=False)
+                save(writer.write(header[:-1] + ', "messages": [\n'))
+            else:
+                save(0)
+
+        posts = await session.stream_scalars(
+            select(ChannelPost)
+            .where(ChannelPost.message_id > last_message_id)
+            .order_by(ChannelPost.message_id)
+            .options(selectinload(ChannelPost.media_files))
+            .execution_options(yield_per=chunk_size)
+        )
+        chunk = []
+        async for post in posts:
+            if file_format == "ndjson":
+                chunk.append(json.dumps(post_to_record(post), ensure_ascii=False) + "\n")
+            else:
+                for msg in post_to_export_messages(post):
+                    chunk.append((",\n" if written_messages else "") + json.dumps(msg, ensure_ascii=False))
+                    written_messages += 1
+            last_message_id = post.message_id
+            exported += 1
+            added += 1
+            if added % chunk_size == 0:
+                save(writer.write("".join(chunk)))
+                chunk.clear()
+                elapsed = time.monotonic() - started
+                print(f"… выгружено {exported}, {added / elapsed if elapsed else 0:.0f} постов/с")
+        if chunk:
+            save(writer.write("".join(chunk)))
+
+        # Закрывающие скобки не входят в контрольную точку: следующая
+        # выгрузка с resume обрежет их и допишет новые посты
+        if file_format == "telegram":
+            writer.write("\n]}\n")
+    finally:
+        writer.close()
+    return added
+
+
+async def export_to_file(file_path: str, file_format: str | None = None, resume: bool = False):
+    """Выгрузка архива канала в JSON (формат Telegram) или NDJSON, .gz/.zst - со сжатием"""
+    file_format = file_format or detect_format(file_path)
+    started = time.monotonic()
+    async with async_session() as session:
+        added = await export_posts(session, file_path, file_format, resume=resume)
+    elapsed = time.monotonic() - started
+    print(f"✔ Выгружено {added} постов в {file_path} ({file_format}) за {elapsed:.1f} с")
+
+
+async def import_messages(
+        session: AsyncSession,
+        messages: Iterable[dict],
+        chunk_size: int = IMPORT_CHUNK_SIZE,
+        to_draft: Callable[[dict], PostDraft | None] = export_to_draft,
+        on_flush: Callable[[], None] | None = None
+):
+    """Пакетная запись сообщений экспорта с отчётом о прогрессе.
+
+    on_flush вызывается после записи каждого пакета (сохранение контрольной точки).
+    """
+    existing = set((await session.execute(select(ChannelPost.message_id))).scalars())
+    print(f"✔ В базе уже {len(existing)} сообщений")
+
+    started = time.monotonic()
+    processed = 0
+    added_count = 0
+    chunk = []
+
+    async def flush():
+        nonlocal added_count
+        saved, _ = await save_post_drafts(session, chunk)
+        added_count += len(saved)
+        existing.update(draft.message_id for draft in saved)
+        chunk.clear()
+        if on_flush:
+            on_flush()
+        elapsed = time.monotonic() - started
+        print(
+            f"… обработано {processed}, добавлено {added_count}, "
+            f"{processed / elapsed if elapsed else 0:.0f} сообщ./с"
+        )
+
+    for msg in messages:
+        processed += 1
+        draft = to_draft(msg)
+        if draft and draft.message_id not in existing:
+            chunk.append(draft)
+        if len(chunk) >= chunk_size:
+            await flush()
+
+    if chunk:
+        await flush()
+    elif on_flush:
+        on_flush()
+    return processed, added_count
+
+
+async def import_from_json(
+        file_path: str,
+        stream: bool = True,
+        file_format: str | None = None,
+        resume: bool = False
+):
+    """Импорт сообщений из JSON (экспорт Telegram Desktop) или NDJSON в базу данных.
+
+    stream=True разбирает файл потоково; stream=False читает его целиком.
+    resume=True продолжает потоковый импорт с позиции последнего записанного пакета.
+    """
+    file_format = file_format or detect_format(file_path)
+    if resume and not stream:
+        raise ValueError("Продолжить импорт можно только в потоковом режиме")
+
+    checkpoint_file = checkpoint_path(file_path, "import")
+    checkpoint = load_checkpoint(checkpoint_file) if resume else None
+    position = StreamPosition(checkpoint["offset"] if checkpoint else 0)
+    if checkpoint:
+        print(f"✔ Продолжаем импорт с байта {position.base}")
 
-async def import_from_json(file_path: str):
-    """Импорт сообщений из JSON в базу данных"""
     try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            data = json.load(f)
+        if file_format == "ndjson":
+            messages = iter_ndjson(file_path, position)
+        elif stream:
+            messages = iter_export_messages(file_path, position=position)
+        else:
+            with io.TextIOWrapper(open_input(file_path), encoding='utf-8') as f:
+                messages = json.load(f).get('messages', [])
+
+        def save():
+            if stream:
+                save_checkpoint(checkpoint_file, {"format": file_format, "offset": position.offset})
 
         async with async_session() as session:
             # Проверяем подключение к БД
@@ -31,53 +536,45 @@ async def import_from_json(file_path: str):
             # Инициализация хештегов
             await init_hashtags(session)
 
-            added_count = 0
-            for msg in data.get('messages', []):
-                if not msg.get('text'):
-                    continue
-
-                # Извлекаем только нужные хештеги
-                msg_hashtags = [
-                    tag.lower() for tag in re.findall(r'#\w+', msg['text'])
-                    if tag.lower() in [h.lower() for h in FIXED_HASHTAGS]
-                ]
-
-                if not msg_hashtags:
-                    continue
-
-                # Проверяем, есть ли уже такое сообщение
-                exists = await session.execute(
-                    select(ChannelPost)
-                    .where(ChannelPost.message_id == msg['id'])
-                )
-                if not exists.scalar_one_or_none():
-                    post = ChannelPost(
-                        message_id=msg['id'],
-                        text=msg['text'],
-                        date=datetime.strptime(msg['date'], '%Y-%m-%dT%H:%M:%S'),
-                        hashtags=",".join(msg_hashtags)
-                    )
-                    session.add(post)
-                    added_count += 1
-
-            await session.commit()
-            print(f"✔ Добавлено {added_count} новых сообщений")
+            started = time.monotonic()
+            processed, added_count = await import_messages(
+                session,
+                messages,
+                to_draft=record_to_draft if file_format == "ndjson" else export_to_draft,
+                on_flush=save
+            )
+            elapsed = time.monotonic() - started
+            print(f"✔ Добавлено {added_count} новых сообщений из {processed} за {elapsed:.1f} с")
 
     except Exception as e:
         print(f"❌ Ошибка импорта: {e}")
         raise
 
 
-async def init_hashtags(session: AsyncSession):
-    """Инициализация хештегов в базе"""
-    for tag in FIXED_HASHTAGS:
-        existing = await session.execute(
-            select(HashtagStats).where(HashtagStats.name == tag)
-        )
-        if not existing.scalar_one_or_none():
-            session.add(HashtagStats(name=tag))
-    await session.commit()
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Импорт и экспорт архива канала")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    import_parser = commands.add_parser("import", help="загрузить экспорт Telegram Desktop или NDJSON в базу")
+    import_parser.add_argument("file", nargs="?", default="result.json")
+    import_parser.add_argument("--no-stream", action="store_true", help="читать файл целиком через json.load")
+    import_parser.add_argument("--format", choices=FORMATS, help="по умолчанию по расширению файла")
+    import_parser.add_argument("--resume", action="store_true", help="продолжить с контрольной точки")
+
+    export_parser = commands.add_parser("export", help="выгрузить посты из базы (.gz/.zst - со сжатием)")
+    export_parser.add_argument("file")
+    export_parser.add_argument("--format", choices=FORMATS, help="по умолчанию по расширению файла")
+    export_parser.add_argument("--resume", action="store_true", help="продолжить с контрольной точки")
+    return parser
 
 
 if __name__ == "__main__":
-    asyncio.run(import_from_json("result.json"))
\ No newline at end of file
+    argv = sys.argv[1:]
+    # Старый вызов "import_export.py result.json" по-прежнему означает импорт
+    if not argv or argv[0] not in ("import", "export", "-h", "--help"):
+        argv = ["import", *argv]
+    args = build_parser().parse_args(argv)
+    if args.command == "export":
+        asyncio.run(export_to_file(args.file, args.format, resume=args.resume))
+    else:
+        asyncio.run(import_from_json(args.file, stream=not args.no_stream, file_format=args.format, resume=args.resume))
@@ -1,11 +1,74 @@
+from aiogram.types import InlineKeyboardMarkup
 from aiogram.utils.keyboard import InlineKeyboardBuilder
 
-async def hashtags_keyboard(hashtags):
+from config import settings
+
+# Готовая клавиатура рубрик: (версия каталога, число колонок) -> разметка
+_hashtags_keyboard_cache: dict[tuple[int, int], InlineKeyboardMarkup] = {}
+
+
+async def hashtags_keyboard(hashtags, version: int | None = None, columns: int | None = None):
+    """Клавиатура рубрик для /start.
+
+    Если передана version (HashtagCatalog.version), разметка строится один
+    раз и переиспользуется, пока набор рубрик не изменится.
+    """
+    columns = columns or settings.KEYBOARD_COLUMNS
+    key = (version, columns)
+    if version is not None and key in _hashtags_keyboard_cache:
+        return _hashtags_keyboard_cache[key]
+
     builder = InlineKeyboardBuilder()
     for hashtag in hashtags:
         builder.button(
             text=f"{hashtag.name}",
             callback_data=f"hashtag:{hashtag.name}"
         )
-    builder.adjust(1)  # По одному хештегу в строке
-    return builder.as_markup()
\ No newline at end of file
+    builder.adjust(columns)
+    markup = builder.as_markup()
+
+    if version is not None:
+        # Старые версии больше не понадобятся
+        _hashtags_keyboard_cache.clear()
+        _hashtags_keyboard_cache[key] = markup
+    return markup
+
+def rubric_page_keyboard(hashtag_id: int, first_id: int, last_id: int, has_prev: bool, has_next: bool):
+    """Кнопки "назад/вперёд" для страницы рубрики.
+
+    callback_data: page:<id хештега>:<id поста-границы>:<p|n>
+    """
+    builder = InlineKeyboardBuilder()
+    if has_prev:
+        builder.button(text="⬅️ Новее", callback_data=f"page:{hashtag_id}:{first_id}:p")
+    if has_next:
+        builder.button(text="Старше ➡️", callback_data=f"page:{hashtag_id}:{last_id}:n")
+    if not has_prev and not has_next:
+        return None
+    builder.adjust(2)
+    return builder.as_markup()
+
+
+def search_page_keyboard(page: int, has_prev: bool, has_next: bool):
+    """Кнопки листания результатов /search. callback_data: fts:<номер страницы>"""
+    if not has_prev and not has_next:
+        return None
+    builder = InlineKeyboardBuilder()
+    if has_prev:
+        builder.button(text="⬅️ Назад", callback_data=f"fts:{page - 1}")
+    if has_next:
+        builder.button(text="Дальше ➡️", callback_data=f"fts:{page + 1}")
+    builder.adjust(2)
+    return builder.as_markup()
+
+
+def stats_keyboard(windows: dict[str, str], current: str):
+    """Переключение периода /stats. callback_data: stats:<период>"""
+    builder = InlineKeyboardBuilder()
+    for window, title in windows.items():
+        builder.button(
+            text=f"• {title} •" if window == current else title,
+            callback_data=f"stats:{window}"
+        )
+    builder.adjust(len(windows))
+    return builder.as_markup()
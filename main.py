@@ -1,61 +1,280 @@
+import time
+
+# Время запуска считается от импорта main: импорт aiogram - заметная его часть
+_import_started = time.perf_counter()
+
 import asyncio
 import logging
+import multiprocessing
 from aiogram import Bot, Dispatcher
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.base import BaseSession
 from aiogram.enums import ParseMode
-from database.session import engine
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from database.session import get_engine, get_read_engine, async_session
 
 from config import settings
-from database.session import Base
+from database.crud import init_hashtags
+from database.migrations import upgrade
 from handlers import start, search, admin
 from handlers.channel import router as channel_router
+from middlewares.concurrency import ConcurrencyLimitMiddleware
+from middlewares.debounce import CallbackDebounceMiddleware
+from middlewares.fanout import UpdateFanoutMiddleware
+from middlewares.metrics import TelegramMetricsMiddleware, instrument_router
+from services.archive_index import archive_index
 from services.channel_parser import ChannelParser
+from services.click_counter import click_counter
+from services.invalidation import invalidation
+from services.stats_rollup import stats_rollup
+from services.metrics import StartupTimer, instrument_engine, start_metrics_server
+from services.sender import OutboundDispatcher
+from services.shared_state import SharedState, create_shared_state
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(name)s - %(levelname)s - %(message)s"
 )
 
+startup_timer = StartupTimer(_import_started)
+startup_timer.mark("imports")
+
 
 async def create_tables():
-    """Создает все таблицы в базе данных"""
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+    """Приводит схему БД к последней версии и создаёт фиксированные рубрики.
 
-async def scheduled_parser(bot: Bot):
-    while True:
-        try:
-            parser = ChannelParser(bot)
-            await parser.parse_new_messages()
-        except Exception as e:
-            logging.error(f"Parser error: {e}")
-        await asyncio.sleep(5)
+    Актуальная схема проверяется одним запросом к schema_version. С
+    DB_MIGRATE_ON_START=False схема не проверяется совсем: миграции
+    запускаются отдельным шагом перед выкладкой.
+    """
+    if settings.DB_MIGRATE_ON_START:
+        await upgrade(get_engine())
 
+    # Фиксированные рубрики создаются один раз при старте, а не на каждый запрос
+    async with async_session() as session:
+        await init_hashtags(session)
+    startup_timer.mark("schema")
 
-async def main():
-    # Инициализация aiogram бота
-    await create_tables()
+
+def worker_urls() -> list[str]:
+    return [
+        f"http://127.0.0.1:{settings.WORKER_PORT_BASE + index}{settings.WEBHOOK_PATH}"
+        for index in range(settings.WORKERS)
+    ]
+
+
+def create_dispatcher(bot: Bot, worker_index: int | None = None) -> Dispatcher:
+    """Диспетчер основного процесса (worker_index=None) или воркера"""
+    shared_state = create_shared_state(settings.SHARED_STATE_URL)
+    # Состояния FSM в общем хранилище видны всем процессам и переживают перезапуск
+    dp = Dispatcher(storage=shared_state.fsm_storage() if shared_state is not None else None)
+    dp["shared_state"] = shared_state
+    dp["worker_index"] = worker_index
+
+    # Ограничение числа одновременно обрабатываемых update
+    concurrency = ConcurrencyLimitMiddleware(settings.HANDLER_CONCURRENCY)
+    dp.update.outer_middleware(concurrency)
+    dp["concurrency"] = concurrency
+    # Основной процесс при наличии воркеров сам обрабатывает только посты канала
+    if worker_index is None and settings.WORKERS:
+        fanout = UpdateFanoutMiddleware(worker_urls(), settings.WEBHOOK_SECRET)
+        dp.update.outer_middleware(fanout)
+        dp["fanout"] = fanout
+    # Повторные нажатия одной кнопки не обрабатываются заново
+    dp.callback_query.outer_middleware(CallbackDebounceMiddleware(settings.CALLBACK_DEBOUNCE_WINDOW))
+
+    # Регистрация роутеров (с метриками времени хендлеров по роутеру)
+    for name, router in (
+            ("start", start.router),
+            ("search", search.router),
+            ("admin", admin.router),
+            ("channel", channel_router)
+    ):
+        instrument_router(router, name)
+        dp.include_router(router)
+
+    # Приём постов канала: один сервис на всё время работы,
+    # хендлеры получают его как аргумент channel_parser
+    dp["channel_parser"] = ChannelParser(bot)
+    # Все исходящие сообщения хендлеров идут через одну очередь с лимитами
+    dp["sender"] = OutboundDispatcher(
+        bot,
+        global_rate=settings.SEND_GLOBAL_RATE,
+        private_rate=settings.SEND_PRIVATE_RATE,
+        private_burst=settings.SEND_PRIVATE_BURST,
+        group_rate=settings.SEND_GROUP_RATE,
+        group_burst=settings.SEND_GROUP_BURST,
+        max_retries=settings.SEND_MAX_RETRIES,
+        shared=shared_state
+    )
+
+    dp.startup.register(on_startup)
+    dp.shutdown.register(on_shutdown)
+    startup_timer.mark("dispatcher")
+    return dp
+
+
+async def on_startup(
+        bot: Bot,
+        dispatcher: Dispatcher,
+        channel_parser: ChannelParser,
+        shared_state: SharedState | None = None,
+        worker_index: int | None = None
+):
+    owner = worker_index is None
+    # Счётчики запросов к БД по хендлерам
+    for db_engine in {get_engine(), get_read_engine()}:
+        instrument_engine(db_engine, settings.SLOW_QUERY_THRESHOLD)
+    if settings.METRICS_PORT:
+        # У воркеров свои порты метрик сразу за портом основного процесса
+        port = settings.METRICS_PORT if owner else settings.METRICS_PORT + worker_index + 1
+        dispatcher["metrics_runner"] = await start_metrics_server(settings.METRICS_HOST, port)
+
+    if settings.ARCHIVE_INDEX_ENABLED:
+        archive_index.start()
+    if shared_state is not None:
+        await invalidation.attach(shared_state)
+        # В БД клики пишет основной процесс, воркеры только передают свои
+        click_counter.attach(shared_state, owner=owner)
+    # Фоновая запись счётчиков кликов
+    click_counter.start()
+
+    if owner:
+        # Приём постов канала и свёртка статистики - только в основном процессе
+        await channel_parser.start()
+        stats_rollup.start()
+
+        if settings.WEBHOOK_ENABLED and settings.WEBHOOK_URL:
+            await bot.set_webhook(
+                settings.WEBHOOK_URL.rstrip("/") + settings.WEBHOOK_PATH,
+                secret_token=settings.WEBHOOK_SECRET
+            )
+
+    startup_timer.mark("startup")
+    logging.info(f"Бот запущен за {startup_timer.report()}")
+
+
+async def on_shutdown(
+        dispatcher: Dispatcher,
+        concurrency: ConcurrencyLimitMiddleware,
+        channel_parser: ChannelParser,
+        sender: OutboundDispatcher,
+        shared_state: SharedState | None = None,
+        fanout: UpdateFanoutMiddleware | None = None,
+        worker_index: int | None = None
+):
+    """Плавная остановка: дожидаемся начатых хендлеров, очереди постов и отправки"""
+    try:
+        await concurrency.wait_idle(settings.SHUTDOWN_TIMEOUT)
+    except asyncio.TimeoutError:
+        logging.warning(f"Не дождались {concurrency.in_flight} хендлеров при остановке")
+    if worker_index is None:
+        await channel_parser.stop()
+    # Воркер переносит остаток кликов в общее хранилище, основной процесс - в БД
+    await click_counter.stop()
+    if worker_index is None:
+        await stats_rollup.stop()
+    await sender.drain()
+    await archive_index.stop()
+    if fanout is not None:
+        await fanout.close()
+    if shared_state is not None:
+        await shared_state.close()
+    # Сервер метрик запущен уже в on_startup: aiogram копирует workflow_data до
+    # него, поэтому аргументом metrics_runner сюда не попадает
+    metrics_runner: web.AppRunner | None = dispatcher.workflow_data.get("metrics_runner")
+    if metrics_runner is not None:
+        await metrics_runner.cleanup()
+
+
+def create_bot(session: BaseSession | None = None) -> Bot:
     bot = Bot(
         token=settings.BOT_TOKEN,
+        session=session,
         default=DefaultBotProperties(parse_mode=ParseMode.HTML)
     )
+    bot.session.middleware(TelegramMetricsMiddleware())
+    return bot
 
-    dp = Dispatcher()
 
-    # Регистрация роутеров
-    dp.include_router(start.router)
-    dp.include_router(search.router)
-    dp.include_router(admin.router)
-    dp.include_router(channel_router)
+async def main():
+    # Инициализация aiogram бота
+    await create_tables()
+    bot = create_bot()
+    dp = create_dispatcher(bot)
+    await dp.start_polling(bot)
 
-    # Запуск парсера в фоне
-    asyncio.create_task(scheduled_parser(bot))
 
-    try:
-        await dp.start_polling(bot)
-    finally:
-        await bot.session.close()
+def setup_webhook(app: web.Application, bot: Bot, dp: Dispatcher):
+    # Порядок важен: остановка диспетчера должна идти до закрытия сессии бота
+    setup_application(app, dp, bot=bot)
+    SimpleRequestHandler(
+        dispatcher=dp,
+        bot=bot,
+        secret_token=settings.WEBHOOK_SECRET
+    ).register(app, path=settings.WEBHOOK_PATH)
+
+
+def run_webhook():
+    """Режим webhook: aiohttp-сервер принимает update от Telegram.
+
+    Без WEBHOOK_URL setWebhook не вызывается - так сервер удобно проверять
+    локально, отправляя POST с update на WEBHOOK_PATH.
+    """
+    bot = create_bot()
+    dp = create_dispatcher(bot)
+
+    app = web.Application()
+    app.on_startup.append(lambda _: create_tables())
+    setup_webhook(app, bot, dp)
+    web.run_app(app, host=settings.WEBHOOK_HOST, port=settings.WEBHOOK_PORT)
+
+
+def run_worker(index: int):
+    """Воркер: принимает update от основного процесса на локальный webhook"""
+    bot = create_bot()
+    dp = create_dispatcher(bot, worker_index=index)
+    app = web.Application()
+    setup_webhook(app, bot, dp)
+    web.run_app(
+        app,
+        host="127.0.0.1",
+        port=settings.WORKER_PORT_BASE + index,
+        print=lambda _: logging.info(f"Воркер {index} запущен")
+    )
+
+
+def start_workers() -> list[multiprocessing.Process]:
+    if not settings.SHARED_STATE_URL or settings.SHARED_STATE_URL.startswith("memory://"):
+        raise RuntimeError("Для WORKERS > 0 нужно общее хранилище: SHARED_STATE_URL=redis://...")
+    context = multiprocessing.get_context("spawn")
+    workers = [
+        context.Process(target=run_worker, args=(index,), name=f"worker-{index}")
+        for index in range(settings.WORKERS)
+    ]
+    for worker in workers:
+        worker.start()
+    return workers
+
+
+def stop_workers(workers: list[multiprocessing.Process]):
+    # SIGTERM: воркер плавно останавливается, как и основной процесс
+    for worker in workers:
+        worker.terminate()
+    for worker in workers:
+        worker.join()
 
 
 if __name__ == "__main__":
-    asyncio.run(main())
\ No newline at end of file
+    if settings.ROLE == "worker":
+        run_worker(settings.WORKER_INDEX)
+    else:
+        workers = start_workers() if settings.WORKERS else []
+        try:
+            if settings.WEBHOOK_ENABLED:
+                run_webhook()
+            else:
+                asyncio.run(main())
+        finally:
+            stop_workers(workers)
@@ -0,0 +1,54 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import CallbackQuery
+
+from services.metrics import metrics
+
+# После скольких записей чистить устаревшие нажатия
+MAX_TRACKED_CALLBACKS = 10000
+
+
+class CallbackDebounceMiddleware(BaseMiddleware):
+    """Отбрасывает повторные нажатия одной и той же кнопки одним пользователем.
+
+    Нажатие с тем же (пользователь, callback_data), пока предыдущее ещё
+    обрабатывается или прошло меньше window секунд, сразу получает пустой
+    ответ и до хендлера не доходит. Подключается как outer-middleware на
+    dp.callback_query.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._started: dict[tuple[int, str], float] = {}
+        self._in_flight: set[tuple[int, str]] = set()
+
+    async def __call__(
+            self,
+            handler: Callable[[CallbackQuery, dict[str, Any]], Awaitable[Any]],
+            event: CallbackQuery,
+            data: dict[str, Any]
+    ) -> Any:
+        key = (event.from_user.id, event.data or "")
+        now = time.monotonic()
+        started = self._started.get(key)
+        if key in self._in_flight or (started is not None and now - started < self.window):
+            metrics.callbacks_debounced.inc()
+            # Убираем «часики» на кнопке, ничего не делая повторно
+            await event.answer()
+            return None
+
+        if len(self._started) >= MAX_TRACKED_CALLBACKS:
+            self._prune(now)
+        self._started[key] = now
+        self._in_flight.add(key)
+        try:
+            return await handler(event, data)
+        finally:
+            self._in_flight.discard(key)
+
+    def _prune(self, now: float):
+        for key, started in list(self._started.items()):
+            if now - started >= self.window and key not in self._in_flight:
+                del self._started[key]
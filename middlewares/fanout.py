@@ -0,0 +1,74 @@
+import logging
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware
+from aiogram.types import Update
+from aiohttp import ClientSession, ClientTimeout
+
+logger = logging.getLogger(__name__)
+
+# Посты канала всегда обрабатывает процесс, который их сохраняет
+LOCAL_UPDATE_TYPES = {"channel_post", "edited_channel_post"}
+
+
+def partition_key(update: Update) -> int:
+    """По чату update: все update одного чата попадают в один процесс"""
+    event = update.event
+    chat = getattr(event, "chat", None) or getattr(getattr(event, "message", None), "chat", None)
+    if chat is not None:
+        return chat.id
+    user = getattr(event, "from_user", None)
+    if user is not None:
+        return user.id
+    return update.update_id
+
+
+class UpdateFanoutMiddleware(BaseMiddleware):
+    """Раздаёт update воркерам по chat_id.
+
+    Подключается как outer-middleware на dp.update в процессе, который
+    получает update от Telegram. Посты канала обрабатываются здесь же,
+    остальное отправляется POST-запросом на webhook воркера
+    chat_id % len(urls). Если воркер недоступен, update обрабатывается
+    локально.
+    """
+
+    def __init__(self, urls: list[str], secret_token: str | None = None, timeout: float = 10.0):
+        self.urls = urls
+        self.secret_token = secret_token
+        self.timeout = ClientTimeout(total=timeout)
+        self.forwarded = 0
+        self._session: ClientSession | None = None
+
+    async def __call__(
+            self,
+            handler: Callable[[Update, dict[str, Any]], Awaitable[Any]],
+            event: Update,
+            data: dict[str, Any]
+    ) -> Any:
+        if event.event_type in LOCAL_UPDATE_TYPES:
+            return await handler(event, data)
+
+        url = self.urls[partition_key(event) % len(self.urls)]
+        try:
+            await self._forward(url, event)
+        except Exception as e:
+            logger.error(f"Не удалось передать update {event.update_id} на {url}: {e}")
+            return await handler(event, data)
+        self.forwarded += 1
+        return None
+
+    async def _forward(self, url: str, update: Update):
+        if self._session is None:
+            self._session = ClientSession(timeout=self.timeout)
+        headers = {"Content-Type": "application/json"}
+        if self.secret_token:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.secret_token
+        body = update.model_dump_json(exclude_none=True)
+        async with self._session.post(url, data=body, headers=headers) as response:
+            response.raise_for_status()
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
@@ -0,0 +1,70 @@
+import time
+from typing import Any, Awaitable, Callable
+
+from aiogram import BaseMiddleware, Bot, Router
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware, NextRequestMiddlewareType
+from aiogram.methods import TelegramMethod
+from aiogram.methods.base import Response, TelegramType
+from aiogram.types import TelegramObject
+
+from services.metrics import metrics, current_handler
+
+
+class HandlerMetricsMiddleware(BaseMiddleware):
+    """Время работы и ошибки хендлеров одного роутера.
+
+    Подключается как inner-middleware, поэтому срабатывает только когда
+    хендлер найден. Пока он работает, запросы к БД относятся к нему.
+    """
+
+    def __init__(self, router_name: str):
+        self.router_name = router_name
+
+    async def __call__(
+            self,
+            handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+            event: TelegramObject,
+            data: dict[str, Any]
+    ) -> Any:
+        handler_object = data.get("handler")
+        handler_name = getattr(getattr(handler_object, "callback", None), "__name__", "unknown")
+        token = current_handler.set(f"{self.router_name}.{handler_name}")
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            metrics.handler_errors.inc(router=self.router_name, handler=handler_name)
+            raise
+        finally:
+            metrics.handler_seconds.observe(
+                time.perf_counter() - started, router=self.router_name, handler=handler_name
+            )
+            current_handler.reset(token)
+
+
+def instrument_router(router: Router, name: str):
+    """Вешает HandlerMetricsMiddleware на все типы событий роутера"""
+    middleware = HandlerMetricsMiddleware(name)
+    for event_name, observer in router.observers.items():
+        if event_name not in ("update", "error"):
+            observer.middleware(middleware)
+
+
+class TelegramMetricsMiddleware(BaseRequestMiddleware):
+    """Время и ошибки запросов к Bot API (middleware сессии бота)"""
+
+    async def __call__(
+            self,
+            make_request: NextRequestMiddlewareType[TelegramType],
+            bot: Bot,
+            method: TelegramMethod[TelegramType]
+    ) -> Response[TelegramType]:
+        method_name = type(method).__name__
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        except Exception as e:
+            metrics.telegram_errors.inc(method=method_name, error=type(e).__name__)
+            raise
+        finally:
+            metrics.telegram_seconds.observe(time.perf_counter() - started, method=method_name)
@@ -0,0 +1,330 @@
+import asyncio
+import logging
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+
+from config import settings
+from database.crud import count_posts, get_media_message_ids, stream_index_posts, stream_rubric_links
+from database.schemas import PostDraft
+from database.session import read_session
+
+logger = logging.getLogger(__name__)
+
+# Сколько строк читать из БД за раз при загрузке
+LOAD_CHUNK = 5000
+# Сообщения альбома для поста без медиа или с одним медиа
+NO_PARTS = ()
+
+
+def timestamp(date: datetime) -> float:
+    # SQLite возвращает даты без часового пояса, они хранятся в UTC
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
+
+
+class RubricIndex:
+    """Посты рубрики по возрастанию (date, id) в двух параллельных массивах"""
+    __slots__ = ("dates", "ids", "stale")
+
+    def __init__(self):
+        self.dates = array("d")
+        self.ids = array("q")
+        self.stale = False
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def __getitem__(self, i: int) -> tuple[float, int]:
+        # Для bisect: ключ сортировки i-го поста
+        return self.dates[i], self.ids[i]
+
+    def add(self, date: float, post_id: int):
+        pos = bisect_left(self, (date, post_id))
+        if pos < len(self.ids) and self.ids[pos] == post_id:
+            return
+        self.dates.insert(pos, date)
+        self.ids.insert(pos, post_id)
+
+
+class ArchiveIndex:
+    """Компактный индекс архива в памяти: страницы рубрик без запросов к БД.
+
+    Хранит id, message_id и даты постов в отсортированных по id массивах
+    array и списки постов каждой рубрики. ORM-объекты не хранятся; id
+    сообщений частей альбомов подгружаются по мере надобности. Загружается
+    в фоне после старта (до готовности всё читается из БД) и пополняется
+    при приёме постов. Если постов больше max_posts, индекс отключается,
+    и всё читается из БД как раньше.
+    """
+
+    def __init__(self, max_posts: int | None = None):
+        self._max_posts = max_posts
+        self.enabled = False
+        self.loaded_in = 0.0
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        # Изменения, пришедшие во время загрузки: применяются после неё
+        self._loading = False
+        self._backlog: list[PostDraft] = []
+        self._stale_during_load: set[str] = set()
+        self._clear()
+
+    @property
+    def max_posts(self) -> int:
+        # Настройки читаются при первом обращении, а не при импорте модуля
+        return settings.ARCHIVE_INDEX_MAX_POSTS if self._max_posts is None else self._max_posts
+
+    def _clear(self):
+        self._post_ids = array("q")
+        self._message_ids = array("q")
+        self._dates = array("d")
+        self._rubrics: dict[str, RubricIndex] = {}
+        self._album_parts: dict[int, tuple[int, ...] | None] = {}
+
+    def _disable(self, reason: str):
+        logger.warning(f"Индекс архива в памяти отключён: {reason}")
+        self.enabled = False
+        self._clear()
+        self._backlog = []
+
+    async def load(self):
+        started = time.monotonic()
+        self.enabled = False
+        self._clear()
+        self._loading = True
+        try:
+            await self._read_all()
+        finally:
+            self._loading = False
+        backlog, self._backlog = self._backlog, []
+        stale, self._stale_during_load = self._stale_during_load, set()
+        if not self.enabled:
+            return
+
+        self.add_posts(backlog)
+        for hashtag in stale:
+            self.invalidate_hashtag(hashtag)
+        self.loaded_in = time.monotonic() - started
+        logger.info(
+            f"Индекс архива загружен за {self.loaded_in:.2f} с: {len(self._post_ids)} постов, "
+            f"{len(self._rubrics)} рубрик, {self.memory_bytes() // 1024} КиБ"
+        )
+
+    async def _read_all(self):
+        async with read_session() as session:
+            total = await count_posts(session)
+            if total > self.max_posts:
+                self._disable(f"{total} постов больше лимита {self.max_posts}")
+                return
+            async for rows in stream_index_posts(session, LOAD_CHUNK):
+                for post_id, message_id, date in rows:
+                    self._post_ids.append(post_id)
+                    self._message_ids.append(message_id)
+                    self._dates.append(timestamp(date))
+            async for rows in stream_rubric_links(session, LOAD_CHUNK):
+                for hashtag, date, post_id, _ in rows:
+                    rubric = self._rubrics.get(hashtag)
+                    if rubric is None:
+                        rubric = self._rubrics[hashtag] = RubricIndex()
+                    # Строки уже отсортированы по (hashtag, date, id)
+                    rubric.dates.append(timestamp(date))
+                    rubric.ids.append(post_id)
+        self.enabled = True
+
+    async def _run_load(self):
+        try:
+            await self.load()
+        except Exception as e:
+            self._disable(f"ошибка загрузки: {e}")
+
+    def start(self):
+        """Загрузка в фоне, чтобы не задерживать запуск бота"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run_load())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def _position(self, post_id: int) -> int | None:
+        pos = bisect_left(self._post_ids, post_id)
+        if pos < len(self._post_ids) and self._post_ids[pos] == post_id:
+            return pos
+        return None
+
+    def _add_post(self, post_id: int, message_id: int, date: float):
+        pos = bisect_left(self._post_ids, post_id)
+        if pos < len(self._post_ids) and self._post_ids[pos] == post_id:
+            return
+        self._post_ids.insert(pos, post_id)
+        self._message_ids.insert(pos, message_id)
+        self._dates.insert(pos, date)
+
+    def add_posts(self, drafts: list[PostDraft]):
+        """Новые посты, только что записанные в БД (drafts с заполненным post_id)"""
+        if self._loading:
+            self._backlog.extend(drafts)
+            return
+        if not self.enabled:
+            return
+        if len(self._post_ids) + len(drafts) > self.max_posts:
+            self._disable(f"превышен лимит {self.max_posts} постов")
+            return
+        for draft in drafts:
+            date = timestamp(draft.date)
+            self._add_post(draft.post_id, draft.message_id, date)
+            for tag in set(draft.hashtags):
+                self._rubrics.setdefault(tag, RubricIndex()).add(date, draft.post_id)
+            parts = [media.get("message_id") for media in draft.media]
+            self._album_parts[draft.post_id] = album_parts(parts)
+
+    def invalidate_hashtag(self, hashtag: str):
+        """Рубрика изменилась не через add_posts: перечитать её из БД при обращении"""
+        if self._loading:
+            self._stale_during_load.add(hashtag)
+            return
+        rubric = self._rubrics.get(hashtag)
+        if rubric is not None:
+            rubric.stale = True
+        elif self.enabled:
+            self._rubrics[hashtag] = rubric = RubricIndex()
+            rubric.stale = True
+
+    async def _rubric(self, hashtag: str) -> RubricIndex | None:
+        rubric = self._rubrics.get(hashtag)
+        if rubric is None or not rubric.stale:
+            return rubric
+        async with self._lock:
+            if rubric.stale:
+                await self._reload_rubric(hashtag)
+        return self._rubrics.get(hashtag)
+
+    async def _reload_rubric(self, hashtag: str):
+        fresh = RubricIndex()
+        async with read_session() as session:
+            async for rows in stream_rubric_links(session, LOAD_CHUNK, hashtag):
+                for _, date, post_id, message_id in rows:
+                    date = timestamp(date)
+                    # Пост мог быть принят другим процессом
+                    self._add_post(post_id, message_id, date)
+                    fresh.dates.append(date)
+                    fresh.ids.append(post_id)
+        if len(self._post_ids) > self.max_posts:
+            self._disable(f"превышен лимит {self.max_posts} постов")
+            return
+        self._rubrics[hashtag] = fresh
+
+    async def rubric_page(
+            self,
+            hashtag: str,
+            cursor: int | None,
+            backward: bool,
+            limit: int
+    ) -> tuple[list[int], bool] | None:
+        """Как get_rubric_page, но id постов: (id от новых к старым, есть ли ещё).
+
+        None - ответить из памяти нельзя, нужно читать из БД.
+        """
+        if not self.enabled:
+            return None
+        rubric = await self._rubric(hashtag)
+        if not self.enabled:
+            return None
+        if rubric is None:
+            return [], False
+
+        if cursor is None:
+            # Без курсора: самые новые посты, а при backward - самые старые
+            start, end = (0, None) if backward else (None, len(rubric))
+        else:
+            pos = self._position(cursor)
+            if pos is None:
+                return None
+            key = (self._dates[pos], cursor)
+            start, end = (bisect_right(rubric, key), None) if backward else (None, bisect_left(rubric, key))
+
+        if backward:
+            end = min(len(rubric), start + limit)
+            return list(reversed(rubric.ids[start:end])), end < len(rubric)
+        start = max(0, end - limit)
+        return list(reversed(rubric.ids[start:end])), start > 0
+
+    async def message_ids(self, post_ids: list[int]) -> list[int] | None:
+        """Как page_message_ids: сообщения канала постов с частями альбомов по возрастанию"""
+        missing = [post_id for post_id in post_ids if post_id not in self._album_parts]
+        if missing:
+            parts: dict[int, list[int | None]] = {post_id: [] for post_id in missing}
+            async with read_session() as session:
+                for post_id, message_id in await get_media_message_ids(session, missing):
+                    parts[post_id].append(message_id)
+            for post_id, ids in parts.items():
+                self._album_parts[post_id] = album_parts(ids)
+
+        message_ids = set()
+        for post_id in post_ids:
+            pos = self._position(post_id)
+            parts = self._album_parts.get(post_id)
+            if pos is None or parts is None:
+                return None
+            message_ids.add(self._message_ids[pos])
+            message_ids.update(parts)
+        return sorted(message_ids)
+
+    def post_message_ids(self, post_ids: list[int]) -> list[int] | None:
+        """Сообщение канала каждого поста (первое сообщение альбома)"""
+        positions = [self._position(post_id) for post_id in post_ids]
+        if None in positions:
+            return None
+        return [self._message_ids[pos] for pos in positions]
+
+    def post_count(self, hashtag: str) -> int | None:
+        """Количество постов рубрики или None, если индекс его не знает"""
+        if not self.enabled:
+            return None
+        rubric = self._rubrics.get(hashtag)
+        if rubric is None:
+            return 0
+        return None if rubric.stale else len(rubric)
+
+    def memory_bytes(self) -> int:
+        """Примерный объём индекса в памяти"""
+        size = sum(sys.getsizeof(a) for a in (self._post_ids, self._message_ids, self._dates))
+        size += sys.getsizeof(self._rubrics) + sys.getsizeof(self._album_parts)
+        for name, rubric in self._rubrics.items():
+            size += sys.getsizeof(name) + sys.getsizeof(rubric)
+            size += sys.getsizeof(rubric.dates) + sys.getsizeof(rubric.ids)
+        for post_id, parts in self._album_parts.items():
+            size += sys.getsizeof(post_id)
+            if parts:
+                size += sys.getsizeof(parts) + sum(sys.getsizeof(i) for i in parts)
+        return size
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "posts": len(self._post_ids),
+            "rubrics": len(self._rubrics),
+            "album_parts": len(self._album_parts),
+            "memory_kib": self.memory_bytes() // 1024,
+        }
+
+
+def album_parts(message_ids: list[int | None]) -> tuple[int, ...] | None:
+    """Сообщения частей альбома; None, если альбом сохранён без них"""
+    if len(message_ids) <= 1:
+        return tuple(i for i in message_ids if i is not None) or NO_PARTS
+    if any(i is None for i in message_ids):
+        return None
+    return tuple(message_ids)
+
+
+archive_index = ArchiveIndex()
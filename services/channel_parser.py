@@ -1,114 +1,166 @@
 import logging
 from aiogram import Bot
 from aiogram.types import Message, PhotoSize, Video, Document, Audio, Voice
-from sqlalchemy import select
+from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from database.models import ChannelPost, PostMedia, HashtagStats
+from config import settings
+from database.crud import apply_post_edit
+from database.models import ChannelPost
+from database.schemas import PostDraft
 from database.session import async_session
+from services.archive_index import archive_index
+from services.ingestion import IngestionQueue
+from services.invalidation import invalidation
+from services.media_group import MediaGroupCollector
 
 logger = logging.getLogger(__name__)
 
 
 class ChannelParser:
+    """Сервис приёма постов канала.
+
+    Создаётся один раз на всё время работы бота и получает посты из
+    channel-роутера. Альбомы собираются в MediaGroupCollector, готовые
+    посты пачками пишутся в БД через IngestionQueue.
+    """
+
     def __init__(self, bot: Bot):
         self.bot = bot
+        self.ingestion = IngestionQueue(
+            batch_size=settings.INGEST_BATCH_SIZE,
+            max_latency=settings.INGEST_MAX_LATENCY,
+            max_size=settings.INGEST_QUEUE_SIZE
+        )
+        self.media_groups = MediaGroupCollector(settings.MEDIA_GROUP_WINDOW, self.process_album)
+        self.running = False
+        # message_id последнего поста в БД на момент старта
+        self._start_message_id = 0
+
+    @property
+    def last_message_id(self) -> int:
+        """Последний сохранённый message_id (high-water mark, без запросов к БД)"""
+        return max(self._start_message_id, self.ingestion.last_saved_message_id)
+
+    async def start(self):
+        async with async_session() as session:
+            self._start_message_id = await self._get_last_message_id(session)
+        self.ingestion.start()
+        self.running = True
+        logger.info(f"Приём постов канала запущен, последний message_id: {self._start_message_id}")
+
+    async def stop(self):
+        self.running = False
+        await self.media_groups.flush_all()
+        await self.ingestion.stop()
+        logger.info(f"Приём постов канала остановлен: {self.health()}")
+
+    def health(self) -> dict:
+        return {
+            "running": self.running,
+            "last_message_id": self.last_message_id,
+            "queue_size": self.ingestion.qsize(),
+            "pending_albums": self.media_groups.pending(),
+            "saved_posts": self.ingestion.saved_count,
+            "failed_posts": self.ingestion.failed_count,
+            "last_batch_at": self.ingestion.last_batch_at,
+        }
+
+    async def process_message(self, message: Message):
+        """Новый пост канала (не альбом)"""
+        draft = self._build_draft([message])
+        if draft:
+            await self.ingestion.put(draft)
+
+    def add_album_part(self, message: Message):
+        """Часть альбома: пост сохранится, когда придут все элементы"""
+        self.media_groups.add(message)
+
+    async def process_album(self, messages: list[Message]):
+        """Сохраняет все части альбома одним постом с упорядоченными медиа"""
+        draft = self._build_draft(messages)
+        if draft:
+            await self.ingestion.put(draft)
+
+    async def process_edit(self, message: Message):
+        """Отредактированный пост канала: обновляет только изменившиеся строки"""
+        if self.media_groups.replace(message):
+            return
+        # Исходный пост может ещё стоять в очереди записи: ждём только его пачку
+        await self.ingestion.wait_saved(message.message_id)
+
+        # Текст альбома хранится в одной из частей, правка остальных меняет только медиа
+        carries_text = bool(message.text or message.caption) or not message.media_group_id
+        hashtags = self._extract_hashtags(message)
+        async with async_session() as session:
+            result = await apply_post_edit(
+                session,
+                message.message_id,
+                text=message.text or message.caption,
+                hashtags=hashtags if carries_text else None,
+                media=self._build_media(message)
+            )
 
-    async def parse_new_messages(self):
-        """Парсинг новых сообщений через канальные updates"""
-        try:
-            async with async_session() as session:
-                last_id = await self._get_last_message_id(session)
-                new_messages = await self._get_new_messages(last_id)
+        if result is None:
+            # Пост не сохранялся, потому что в нём не было хештегов
+            if hashtags and not message.media_group_id:
+                await self.process_message(message)
+            return
 
-                if new_messages:
-                    await self._save_messages(session, new_messages)
-                    logger.info(f"Добавлено {len(new_messages)} новых сообщений")
-        except Exception as e:
-            logger.error(f"Ошибка парсинга: {e}")
+        affected_tags, new_tags = result
+        for tag in affected_tags:
+            archive_index.invalidate_hashtag(tag)
+        await invalidation.hashtags_changed(affected_tags)
+        if new_tags:
+            await invalidation.catalog_changed()
+        logger.info(f"Пост {message.message_id} обновлён после редактирования")
 
     async def _get_last_message_id(self, session: AsyncSession) -> int:
-        result = await session.execute(
-            select(ChannelPost.message_id).order_by(ChannelPost.message_id.desc())
-        )
+        result = await session.execute(select(func.max(ChannelPost.message_id)))
         return result.scalar() or 0
 
-    async def _get_new_messages(self, last_id: int) -> list[Message]:
-        """Получаем новые сообщения через обработчик channel_post"""
-        return []  # Реальные сообщения будут приходить через хендлер
-
-    async def _save_messages(self, session: AsyncSession, messages: list[Message]):
-        for msg in messages:
-            hashtags = self._extract_hashtags(msg)
-            if not hashtags:
-                continue
-
-            # Проверяем, есть ли уже такое сообщение (с await!)
-            existing_post = await session.execute(
-                select(ChannelPost).where(ChannelPost.message_id == msg.message_id))
-            existing_post = existing_post.scalar_one_or_none()
-
-            if existing_post:
-                continue
-
-            post = ChannelPost(
-                message_id=msg.message_id,
-                media_group_id=msg.media_group_id,
-                text=msg.text or msg.caption,
-                hashtags=",".join(hashtags)
-            )
-
-            await self._process_media(msg, post)
-            session.add(post)
-
-            for tag in hashtags:
-                existing_tag = await session.execute(
-                    select(HashtagStats).where(HashtagStats.name == tag))
-                existing_tag = existing_tag.scalar_one_or_none()
+    def _build_draft(self, messages: list[Message]) -> PostDraft | None:
+        """Готовит пост из одного сообщения или всех частей альбома.
 
-                if not existing_tag:
-                    session.add(HashtagStats(name=tag))
+        Посты без хештегов не сохраняются.
+        """
+        messages = sorted(messages, key=lambda m: m.message_id)
 
-        await session.commit()
-
-    async def _process_media(self, message: Message, post: ChannelPost):
-        """Обрабатываем все типы медиа в сообщении"""
-        order_index = 0
+        # Подпись альбома Telegram присылает только в одной из частей
+        captioned = next((m for m in messages if m.caption or m.text), messages[0])
+        hashtags = self._extract_hashtags(captioned)
+        if not hashtags:
+            return None
+
+        media = [self._build_media(m) for m in messages]
+        return PostDraft(
+            message_id=messages[0].message_id,
+            media_group_id=messages[0].media_group_id,
+            text=captioned.text or captioned.caption,
+            date=messages[0].date,
+            hashtags=hashtags,
+            media=[m for m in media if m]
+        )
 
+    def _build_media(self, message: Message) -> dict | None:
+        """Значения колонок PostMedia для медиа одного сообщения (части альбома)"""
         # Фото - берем только самое большое (последнее в списке)
         if message.photo:
             largest_photo = message.photo[-1]  # Последний элемент - самое большое фото
-            post.media_files.append(PostMedia(
+            return dict(
+                message_id=message.message_id,
                 media_type="photo",
                 file_id=largest_photo.file_id,
                 file_unique_id=largest_photo.file_unique_id,
                 file_size=largest_photo.file_size,
                 width=largest_photo.width,
-                height=largest_photo.height,
-                order_index=order_index
-            ))
-            order_index += 1
-
-        # Видео
-        elif message.video:
-            video = message.video
-            media = PostMedia(
-                media_type="video",
-                file_id=video.file_id,
-                file_unique_id=video.file_unique_id,
-                file_size=video.file_size,
-                width=video.width,
-                height=video.height,
-                duration=video.duration,
-                thumbnail_id=video.thumbnail.file_id if video.thumbnail else None,
-                order_index=order_index
+                height=largest_photo.height
             )
-            post.media_files.append(media)
-            order_index += 1
 
         # Видео
         elif message.video:
             video = message.video
-            media = PostMedia(
+            return dict(
+                message_id=message.message_id,
                 media_type="video",
                 file_id=video.file_id,
                 file_unique_id=video.file_unique_id,
@@ -116,60 +168,52 @@ class ChannelParser:
                 width=video.width,
                 height=video.height,
                 duration=video.duration,
-                thumbnail_id=video.thumbnail.file_id if video.thumbnail else None,
-                order_index=order_index
+                thumbnail_id=video.thumbnail.file_id if video.thumbnail else None
             )
-            post.media_files.append(media)
-            order_index += 1
 
         # Документы
         elif message.document:
             doc = message.document
-            media = PostMedia(
+            return dict(
+                message_id=message.message_id,
                 media_type="document",
                 file_id=doc.file_id,
                 file_unique_id=doc.file_unique_id,
                 file_size=doc.file_size,
                 mime_type=doc.mime_type,
                 file_name=doc.file_name,
-                thumbnail_id=doc.thumbnail.file_id if doc.thumbnail else None,
-                order_index=order_index
+                thumbnail_id=doc.thumbnail.file_id if doc.thumbnail else None
             )
-            post.media_files.append(media)
-            order_index += 1
 
         # Аудио
         elif message.audio:
             audio = message.audio
-            media = PostMedia(
+            return dict(
+                message_id=message.message_id,
                 media_type="audio",
                 file_id=audio.file_id,
                 file_unique_id=audio.file_unique_id,
                 file_size=audio.file_size,
                 duration=audio.duration,
                 mime_type=audio.mime_type,
-                file_name=audio.file_name,
-                order_index=order_index
+                file_name=audio.file_name
             )
-            post.media_files.append(media)
-            order_index += 1
 
         # Голосовые сообщения
         elif message.voice:
             voice = message.voice
-            media = PostMedia(
+            return dict(
+                message_id=message.message_id,
                 media_type="voice",
                 file_id=voice.file_id,
                 file_unique_id=voice.file_unique_id,
                 file_size=voice.file_size,
                 duration=voice.duration,
-                mime_type=voice.mime_type,
-                order_index=order_index
+                mime_type=voice.mime_type
             )
-            post.media_files.append(media)
-            order_index += 1
 
         # Можно добавить обработку других типов медиа (стикеры, анимации и т.д.)
+        return None
 
     def _extract_hashtags(self, message: Message) -> list[str]:
         text = message.text or message.caption or ""
@@ -178,43 +222,3 @@ class ChannelParser:
             text[e.offset:e.offset + e.length]
             for e in entities if e.type == "hashtag"
         ]
-
-
-async def process_message(message: Message, bot: Bot):
-    """Обработчик новых сообщений из канала"""
-    parser = ChannelParser(bot)
-    async with async_session() as session:
-        hashtags = parser._extract_hashtags(message)
-        if not hashtags:
-            return
-
-        # Проверяем, есть ли уже такое сообщение (с await!)
-        existing_post = await session.execute(
-            select(ChannelPost).where(ChannelPost.message_id == message.message_id))
-        existing_post = existing_post.scalar_one_or_none()
-
-        if existing_post:
-            return
-
-        post = ChannelPost(
-            message_id=message.message_id,
-            media_group_id=message.media_group_id,
-            text=message.text or message.caption,
-            hashtags=",".join(hashtags)
-        )
-
-        # Обрабатываем медиафайлы
-        await parser._process_media(message, post)
-
-        session.add(post)
-
-        # Добавляем хештеги в статистику (тоже с await!)
-        for tag in hashtags:
-            existing_tag = await session.execute(
-                select(HashtagStats).where(HashtagStats.name == tag))
-            existing_tag = existing_tag.scalar_one_or_none()
-
-            if not existing_tag:
-                session.add(HashtagStats(name=tag))
-
-        await session.commit()
\ No newline at end of file
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from config import settings
+from database.crud import add_hashtag_clicks
+from database.session import async_session
+from services.invalidation import invalidation
+from services.shared_state import SharedState, CLICKS_KEY
+
+logger = logging.getLogger(__name__)
+
+
+def current_hour() -> datetime:
+    return datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+
+
+def encode_counters(clicks: Counter[str], events: Counter[tuple[datetime, str, int]]) -> dict[str, int]:
+    """Клики и журнал одним хешем общего хранилища: c|рубрика и e|час|пост|рубрика"""
+    values = {f"c|{hashtag}": count for hashtag, count in clicks.items()}
+    for (hour, hashtag, post_id), count in events.items():
+        values[f"e|{int(hour.timestamp())}|{post_id}|{hashtag}"] = count
+    return values
+
+
+def decode_counters(values: dict[str, int]) -> tuple[Counter[str], Counter[tuple[datetime, str, int]]]:
+    clicks: Counter[str] = Counter()
+    events: Counter[tuple[datetime, str, int]] = Counter()
+    for field, count in values.items():
+        if field.startswith("c|"):
+            clicks[field[2:]] += count
+        else:
+            _, hour, post_id, hashtag = field.split("|", 3)
+            events[(datetime.fromtimestamp(int(hour), timezone.utc), hashtag, int(post_id))] += count
+    return clicks, events
+
+
+class ClickCounter:
+    """Копит клики по рубрикам в памяти и пачкой сбрасывает их в БД.
+
+    Вместе с итоговыми счётчиками пишется журнал ClickEvent: клики и показы
+    постов, сгруппированные по (час, рубрика, пост) за один сброс.
+
+    С общим хранилищем (attach) каждый процесс при сбросе переносит свои
+    счётчики туда, а в БД их пишет только процесс-владелец.
+    """
+
+    def __init__(self, flush_interval: float | None = None):
+        self._flush_interval = flush_interval
+        self.shared: SharedState | None = None
+        self.owner = True
+        self._pending: Counter[str] = Counter()
+        self._flushing: Counter[str] = Counter()
+        self._events: Counter[tuple[datetime, str, int]] = Counter()
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        # stop() не отменяет фоновую задачу, а просит её выйти после текущего сброса
+        self._stopping = asyncio.Event()
+
+    @property
+    def flush_interval(self) -> float:
+        # Настройки читаются при первом обращении, а не при импорте модуля
+        if self._flush_interval is None:
+            return settings.CLICK_FLUSH_INTERVAL
+        return self._flush_interval
+
+    def attach(self, shared: SharedState, owner: bool):
+        self.shared = shared
+        self.owner = owner
+
+    def increment(self, hashtag: str, count: int = 1):
+        self._pending[hashtag] += count
+        self._events[(current_hour(), hashtag, 0)] += count
+
+    def record_views(self, hashtag: str, post_ids: list[int]):
+        """Показ постов рубрики пользователю"""
+        hour = current_hour()
+        for post_id in post_ids:
+            self._events[(hour, hashtag, post_id)] += 1
+
+    def pending(self, hashtag: str) -> int:
+        """Клики этого процесса, ещё не записанные в БД (включая сбрасываемые прямо сейчас)"""
+        return self._pending[hashtag] + self._flushing[hashtag]
+
+    async def pending_all(self) -> Counter[str]:
+        """Все незаписанные клики по рубрикам, включая клики других процессов"""
+        pending = self._pending + self._flushing
+        if self.shared is not None:
+            clicks, _ = decode_counters(await self.shared.get_counters(CLICKS_KEY))
+            pending.update(clicks)
+        return pending
+
+    async def flush(self) -> int:
+        """Записывает накопленные клики одним батчем, возвращает их количество"""
+        async with self._lock:
+            if self.shared is None:
+                return await self._flush_local()
+            await self._push_shared()
+            if not self.owner:
+                return 0
+            return await self._flush_shared()
+
+    async def _flush_local(self) -> int:
+        if not self._pending and not self._events:
+            return 0
+
+        self._flushing, self._pending = self._pending, Counter()
+        events, self._events = self._events, Counter()
+        try:
+            await self._write(self._flushing, events)
+        except BaseException:
+            # Не теряем клики (в том числе при отмене): вернём их в очередь до следующей попытки
+            self._pending.update(self._flushing)
+            self._events.update(events)
+            raise
+        finally:
+            flushed = sum(self._flushing.values())
+            self._flushing = Counter()
+        return flushed
+
+    async def _push_shared(self):
+        """Переносит счётчики процесса в общее хранилище"""
+        if not self._pending and not self._events:
+            return
+
+        self._flushing, self._pending = self._pending, Counter()
+        events, self._events = self._events, Counter()
+        try:
+            await self.shared.incr_many(CLICKS_KEY, encode_counters(self._flushing, events))
+        except BaseException:
+            self._pending.update(self._flushing)
+            self._events.update(events)
+            raise
+        finally:
+            self._flushing = Counter()
+
+    async def _flush_shared(self) -> int:
+        """Забирает счётчики всех процессов из общего хранилища и пишет их в БД"""
+        values = await self.shared.pop_counters(CLICKS_KEY)
+        if not values:
+            return 0
+
+        self._flushing, events = decode_counters(values)
+        try:
+            await self._write(self._flushing, events)
+        except BaseException:
+            # Счётчики уже забраны из хранилища: без возврата они пропадут
+            await self.shared.incr_many(CLICKS_KEY, values)
+            raise
+        finally:
+            flushed = sum(self._flushing.values())
+            self._flushing = Counter()
+        return flushed
+
+    async def _write(self, clicks: Counter[str], events: Counter[tuple[datetime, str, int]]):
+        started = time.monotonic()
+        async with async_session() as session:
+            await add_hashtag_clicks(session, dict(clicks), [
+                {"hour": hour, "hashtag": hashtag, "post_id": post_id, "count": count}
+                for (hour, hashtag, post_id), count in events.items()
+            ])
+        await invalidation.clicks_written(clicks, started)
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка записи счётчиков кликов: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._stopping.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновый сброс, дождавшись текущего, и записывает остаток"""
+        if self._task is not None:
+            self._stopping.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+
+click_counter = ClickCounter()
@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+from config import settings
+from database.crud import get_all_hashtags
+from database.session import read_session
+
+
+class HashtagEntry:
+    """Снимок строки HashtagStats без привязки к сессии"""
+    __slots__ = ("id", "name", "click_count", "post_count")
+
+    def __init__(self, id: int, name: str, click_count: int, post_count: int = 0):
+        self.id = id
+        self.name = name
+        self.click_count = click_count
+        self.post_count = post_count
+
+
+class HashtagCatalog:
+    """Кэш списка рубрик в памяти процесса.
+
+    Перечитывается из БД по истечении TTL или после invalidate().
+    version увеличивается, только когда меняется набор рубрик.
+    """
+
+    def __init__(self, ttl: float | None = None):
+        self._ttl = ttl
+        self.version = 0
+        self._entries: list[HashtagEntry] | None = None
+        self._loaded_at = 0.0
+        self._lock = asyncio.Lock()
+
+    @property
+    def ttl(self) -> float:
+        # Настройки читаются при первом обращении, а не при импорте модуля
+        return settings.HASHTAG_CATALOG_TTL if self._ttl is None else self._ttl
+
+    def _is_fresh(self) -> bool:
+        return self._entries is not None and time.monotonic() - self._loaded_at < self.ttl
+
+    async def get(self) -> list[HashtagEntry]:
+        if self._is_fresh():
+            return self._entries
+
+        async with self._lock:
+            if not self._is_fresh():
+                await self._load()
+        return self._entries
+
+    async def _load(self):
+        async with read_session() as session:
+            hashtags = await get_all_hashtags(session)
+        entries = [HashtagEntry(h.id, h.name, h.click_count or 0, h.post_count or 0) for h in hashtags]
+
+        old_names = [e.name for e in self._entries] if self._entries is not None else None
+        if old_names != [e.name for e in entries]:
+            self.version += 1
+        self._entries = entries
+        self._loaded_at = time.monotonic()
+
+    async def find(self, name: str | None = None, hashtag_id: int | None = None) -> HashtagEntry | None:
+        """Рубрика по имени или id из кэша"""
+        for entry in await self.get():
+            if entry.name == name or entry.id == hashtag_id:
+                return entry
+        return None
+
+    def invalidate(self):
+        """Сбрасывает кэш: следующий get() перечитает рубрики из БД"""
+        self._loaded_at = 0.0
+
+    def apply_clicks(self, clicks: dict[str, int], flush_started: float):
+        """Учитывает в кэше клики, только что записанные в БД.
+
+        Если кэш перечитывался во время записи, неизвестно, вошли ли в него
+        эти клики, поэтому он просто сбрасывается.
+        """
+        if self._loaded_at >= flush_started:
+            self.invalidate()
+            return
+        for entry in self._entries or []:
+            entry.click_count += clicks.get(entry.name, 0)
+
+
+hashtag_catalog = HashtagCatalog()
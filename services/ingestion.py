@@ -0,0 +1,145 @@
+import asyncio
+import logging
+from datetime import datetime, timezone
+
+from database.crud import save_post_drafts
+from database.schemas import PostDraft
+from database.session import async_session
+from services.archive_index import archive_index
+from services.invalidation import invalidation
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class IngestionQueue:
+    """Очередь записи постов канала в БД микро-пачками.
+
+    put() ждёт, пока в очереди освободится место (backpressure). Фоновый
+    обработчик забирает до batch_size постов, но не ждёт дольше
+    max_latency секунд после первого, и пишет их одной транзакцией.
+    wait_saved() ждёт только пачку с нужным постом, а не всю очередь.
+    """
+
+    def __init__(self, batch_size: int, max_latency: float, max_size: int):
+        self.batch_size = batch_size
+        self.max_latency = max_latency
+        self._queue: asyncio.Queue[PostDraft] = asyncio.Queue(maxsize=max_size)
+        self._task: asyncio.Task | None = None
+        # message_id постов в очереди (и частей альбомов) -> future, завершается после записи пачки
+        self._pending: dict[int, asyncio.Future] = {}
+        # Статистика для health-отчёта
+        self.saved_count = 0
+        self.failed_count = 0
+        self.last_saved_message_id = 0
+        self.last_batch_at: datetime | None = None
+
+    async def put(self, draft: PostDraft):
+        # Регистрируется до put: правка может прийти, пока очередь переполнена
+        future = self._pending.get(draft.message_id)
+        if future is None:
+            future = asyncio.get_running_loop().create_future()
+        for message_id in message_ids(draft):
+            self._pending.setdefault(message_id, future)
+        try:
+            await self._queue.put(draft)
+        except BaseException:
+            self._resolve([draft])
+            raise
+
+    async def wait_saved(self, message_id: int):
+        """Ждёт записи пачки с постом message_id, если он ещё в очереди"""
+        future = self._pending.get(message_id)
+        if future is not None:
+            await asyncio.shield(future)
+
+    def _resolve(self, batch: list[PostDraft]):
+        for draft in batch:
+            for message_id in message_ids(draft):
+                future = self._pending.pop(message_id, None)
+                if future is not None and not future.done():
+                    future.set_result(None)
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    async def _next_batch(self) -> list[PostDraft]:
+        batch = [await self._queue.get()]
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_latency
+
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except asyncio.QueueEmpty:
+                pass
+
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _write(self, batch: list[PostDraft]):
+        metrics.ingest_batch_size.observe(len(batch))
+        async with async_session() as session:
+            saved, new_tags = await save_post_drafts(session, batch)
+        self.saved_count += len(saved)
+        self.last_batch_at = datetime.now(timezone.utc)
+        if saved:
+            self.last_saved_message_id = max(
+                self.last_saved_message_id, *(draft.message_id for draft in saved)
+            )
+            logger.info(f"Сохранено {len(saved)} новых постов из {len(batch)}")
+        archive_index.add_posts(saved)
+        # Новый пост меняет страницы своих рубрик
+        await invalidation.hashtags_changed({tag for draft in saved for tag in draft.hashtags})
+        # Новая рубрика должна появиться в /start и /stats
+        if new_tags:
+            await invalidation.catalog_changed()
+
+    async def _run(self):
+        while True:
+            batch = await self._next_batch()
+            try:
+                await self._write(batch)
+            except Exception as e:
+                self.failed_count += len(batch)
+                ids = [draft.message_id for draft in batch]
+                logger.error(f"Ошибка записи постов {ids}: {e}")
+            finally:
+                self._resolve(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    def start(self):
+        if self._task is None:
+            metrics.ingest_queue_depth.set_function(self.qsize)
+            self._task = asyncio.create_task(self._run())
+
+    async def join(self):
+        """Ждёт, пока все поставленные в очередь посты будут записаны"""
+        await self._queue.join()
+
+    async def stop(self):
+        """Дожидается записи всех постов из очереди и останавливает обработчик"""
+        if self._task is None:
+            return
+        await self._queue.join()
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+def message_ids(draft: PostDraft) -> set[int]:
+    """Сообщения канала поста: правка может прийти на любую часть альбома"""
+    ids = {media["message_id"] for media in draft.media if media.get("message_id")}
+    ids.add(draft.message_id)
+    return ids
@@ -0,0 +1,70 @@
+import json
+import logging
+import uuid
+
+from services.archive_index import archive_index
+from services.hashtag_catalog import hashtag_catalog
+from services.page_cache import rubric_page_cache
+from services.shared_state import SharedState, INVALIDATION_CHANNEL
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidationBus:
+    """Сброс кэшей рубрик во всех процессах бота.
+
+    Изменение сразу применяется к кэшам своего процесса, а при подключённом
+    общем хранилище ещё и рассылается остальным процессам. Свои сообщения,
+    вернувшиеся из канала, пропускаются.
+    """
+
+    def __init__(self):
+        self.sender_id = uuid.uuid4().hex
+        self._shared: SharedState | None = None
+
+    async def attach(self, shared: SharedState):
+        self._shared = shared
+        await shared.subscribe(INVALIDATION_CHANNEL, self._receive)
+
+    async def hashtags_changed(self, hashtags):
+        """Изменились посты рубрик: их страницы нужно перечитать"""
+        hashtags = list(hashtags)
+        for tag in hashtags:
+            rubric_page_cache.invalidate_hashtag(tag)
+        if hashtags:
+            await self._publish({"kind": "hashtags", "hashtags": hashtags})
+
+    async def catalog_changed(self):
+        """Изменился набор рубрик или их счётчики"""
+        hashtag_catalog.invalidate()
+        await self._publish({"kind": "catalog"})
+
+    async def clicks_written(self, clicks: dict[str, int], flush_started: float):
+        """Клики записаны в БД: свой кэш дополняется, остальные процессы перечитывают"""
+        hashtag_catalog.apply_clicks(clicks, flush_started)
+        await self._publish({"kind": "catalog"})
+
+    async def _publish(self, message: dict):
+        if self._shared is None:
+            return
+        message["from"] = self.sender_id
+        try:
+            await self._shared.publish(INVALIDATION_CHANNEL, json.dumps(message))
+        except Exception as e:
+            # Остальные процессы догонят изменения по TTL кэшей
+            logger.error(f"Не удалось разослать сброс кэша: {e}")
+
+    def _receive(self, raw: str):
+        message = json.loads(raw)
+        if message.get("from") == self.sender_id:
+            return
+        if message["kind"] == "hashtags":
+            for tag in message["hashtags"]:
+                rubric_page_cache.invalidate_hashtag(tag)
+                # Посты приняты другим процессом: рубрика перечитается из БД
+                archive_index.invalidate_hashtag(tag)
+        elif message["kind"] == "catalog":
+            hashtag_catalog.invalidate()
+
+
+invalidation = InvalidationBus()
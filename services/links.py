@@ -0,0 +1,9 @@
+from config import settings
+
+
+def post_link(message_id: int) -> str:
+    """Ссылка на пост в канале settings.CHANNEL_ID"""
+    channel = str(settings.CHANNEL_ID)
+    if channel.startswith("-100"):
+        channel = channel[4:]
+    return f"https://t.me/c/{channel}/{message_id}"
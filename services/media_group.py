@@ -0,0 +1,69 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+from aiogram.types import Message
+
+logger = logging.getLogger(__name__)
+
+
+class MediaGroupCollector:
+    """Собирает части альбома по media_group_id.
+
+    Telegram присылает каждый элемент альбома отдельным update. Группа
+    считается собранной, когда за window секунд не пришло новых частей,
+    после чего все сообщения передаются в on_complete одним списком.
+    """
+
+    def __init__(self, window: float, on_complete: Callable[[list[Message]], Awaitable[None]]):
+        self.window = window
+        self.on_complete = on_complete
+        self._groups: dict[str, list[Message]] = {}
+        self._timers: dict[str, asyncio.Task] = {}
+
+    def add(self, message: Message):
+        group_id = message.media_group_id
+        self._groups.setdefault(group_id, []).append(message)
+
+        # Каждая новая часть продлевает ожидание группы
+        timer = self._timers.pop(group_id, None)
+        if timer:
+            timer.cancel()
+        self._timers[group_id] = asyncio.create_task(self._flush_later(group_id))
+
+    def replace(self, message: Message) -> bool:
+        """Подменяет часть ещё не собранного альбома отредактированной версией"""
+        messages = self._groups.get(message.media_group_id)
+        if not messages:
+            return False
+        for index, part in enumerate(messages):
+            if part.message_id == message.message_id:
+                messages[index] = message
+                return True
+        return False
+
+    async def _flush_later(self, group_id: str):
+        await asyncio.sleep(self.window)
+        self._timers.pop(group_id, None)
+        await self._flush(group_id)
+
+    async def _flush(self, group_id: str):
+        messages = self._groups.pop(group_id, None)
+        if not messages:
+            return
+        try:
+            await self.on_complete(messages)
+        except Exception as e:
+            logger.error(f"Ошибка сохранения альбома {group_id}: {e}")
+
+    def pending(self) -> int:
+        """Количество недособранных альбомов"""
+        return len(self._groups)
+
+    async def flush_all(self):
+        """Сохраняет все недособранные альбомы (при остановке бота)"""
+        for timer in self._timers.values():
+            timer.cancel()
+        self._timers.clear()
+        for group_id in list(self._groups):
+            await self._flush(group_id)
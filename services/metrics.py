@@ -0,0 +1,238 @@
+import contextvars
+import logging
+import time
+from bisect import bisect_left
+from typing import Callable
+
+from aiohttp import web
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
+
+logger = logging.getLogger(__name__)
+
+# Стандартные границы гистограмм Prometheus (секунды)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+# Хендлер, который сейчас выполняется: к нему относятся запросы к БД.
+# Вне хендлеров (фоновые задачи) - "background"
+current_handler: contextvars.ContextVar[str] = contextvars.ContextVar("current_handler", default="background")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names: tuple[str, ...], values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.label_names = labels
+        self._values: dict[tuple, object] = {}
+
+    def _key(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.label_names)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} {self.kind}"]
+        lines += self._samples()
+        return lines
+
+    def _samples(self) -> list[str]:
+        return [
+            f"{self.name}{_format_labels(self.label_names, key)} {value}"
+            for key, value in self._values.items()
+        ]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self) -> float:
+        """Сумма по всем значениям меток"""
+        return sum(self._values.values())
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = ()):
+        super().__init__(name, description, labels)
+        self._function: Callable[[], float] | None = None
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = value
+
+    def set_function(self, function: Callable[[], float]):
+        """Значение вычисляется в момент чтения метрик"""
+        self._function = function
+
+    def _samples(self) -> list[str]:
+        if self._function is not None:
+            return [f"{self.name} {self._function()}"]
+        return super()._samples()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, labels: tuple[str, ...] = (), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, description, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        data = self._values.get(key)
+        if data is None:
+            # Счётчики по корзинам (без накопления), сумма, количество
+            data = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        data[0][bisect_left(self.buckets, value)] += 1
+        data[1] += value
+        data[2] += 1
+
+    def _samples(self) -> list[str]:
+        lines = []
+        for key, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip((*self.buckets, "+Inf"), counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.label_names, key, f'le="{bound}"')
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.label_names, key)
+            lines.append(f"{self.name}_sum{labels} {total}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Метрики бота в памяти процесса и их вывод в текстовом формате Prometheus"""
+
+    def __init__(self):
+        self._metrics: list[_Metric] = []
+        self.handler_seconds = self._add(Histogram(
+            "bot_handler_seconds", "Время обработки update хендлером", ("router", "handler")
+        ))
+        self.handler_errors = self._add(Counter(
+            "bot_handler_errors_total", "Исключения в хендлерах", ("router", "handler")
+        ))
+        self.callbacks_debounced = self._add(Counter(
+            "bot_callbacks_debounced_total", "Повторные нажатия кнопок, отброшенные без обработки"
+        ))
+        self.db_queries = self._add(Counter(
+            "bot_db_queries_total", "Запросы к БД", ("handler",)
+        ))
+        self.db_query_seconds = self._add(Histogram(
+            "bot_db_query_seconds", "Время выполнения запросов к БД", ("handler",)
+        ))
+        self.db_slow_queries = self._add(Counter(
+            "bot_db_slow_queries_total", "Запросы к БД дольше SLOW_QUERY_THRESHOLD", ("handler",)
+        ))
+        self.telegram_seconds = self._add(Histogram(
+            "bot_telegram_request_seconds", "Время запросов к Bot API", ("method",)
+        ))
+        self.telegram_errors = self._add(Counter(
+            "bot_telegram_errors_total", "Ошибки запросов к Bot API", ("method", "error")
+        ))
+        self.telegram_retries = self._add(Counter(
+            "bot_telegram_retries_total", "Повторы запросов после flood wait", ("method",)
+        ))
+        self.ingest_queue_depth = self._add(Gauge(
+            "bot_ingest_queue_depth", "Постов в очереди записи"
+        ))
+        self.ingest_batch_size = self._add(Histogram(
+            "bot_ingest_batch_size", "Размер пачки постов при записи", buckets=BATCH_BUCKETS
+        ))
+        self.startup_seconds = self._add(Gauge(
+            "bot_startup_seconds", "Длительность этапов запуска процесса", ("phase",)
+        ))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+
+class StartupTimer:
+    """Длительность этапов запуска: в метрику bot_startup_seconds и в лог"""
+
+    def __init__(self, started: float):
+        self.started = started
+        self.phases: dict[str, float] = {}
+        self._last = started
+
+    def mark(self, phase: str):
+        """Закончился этап phase (время с предыдущей отметки)"""
+        now = time.perf_counter()
+        self.phases[phase] = self.phases.get(phase, 0.0) + now - self._last
+        self._last = now
+        metrics.startup_seconds.set(round(self.phases[phase], 4), phase=phase)
+
+    def report(self) -> str:
+        total = self._last - self.started
+        metrics.startup_seconds.set(round(total, 4), phase="total")
+        phases = ", ".join(f"{phase} {seconds:.2f} с" for phase, seconds in self.phases.items())
+        return f"{total:.2f} с ({phases})"
+
+
+def instrument_engine(engine: AsyncEngine, slow_query_threshold: float = 0):
+    """Подключает к движку подсчёт запросов и их времени по хендлерам.
+
+    Запросы дольше slow_query_threshold секунд пишутся в лог (0 - не писать).
+    """
+    sync_engine = engine.sync_engine
+
+    @event.listens_for(sync_engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(sync_engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["query_started"].pop()
+        handler = current_handler.get()
+        metrics.db_queries.inc(handler=handler)
+        metrics.db_query_seconds.observe(elapsed, handler=handler)
+        if slow_query_threshold and elapsed >= slow_query_threshold:
+            metrics.db_slow_queries.inc(handler=handler)
+            logger.warning(f"Медленный запрос ({elapsed:.3f} с, {handler}): {' '.join(statement.split())[:500]}")
+
+    @event.listens_for(sync_engine, "handle_error")
+    def handle_error(exception_context):
+        # Запрос упал: after_cursor_execute не будет, убираем его время старта
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+async def start_metrics_server(host: str, port: int) -> web.AppRunner:
+    """HTTP-сервер с единственным адресом /metrics"""
+    async def handle_metrics(request: web.Request) -> web.Response:
+        return web.Response(text=metrics.render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle_metrics)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Метрики доступны на http://{host}:{port}/metrics")
+    return runner
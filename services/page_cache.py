@@ -0,0 +1,87 @@
+import time
+from collections import OrderedDict
+from typing import Any
+
+from config import settings
+from services.single_flight import SingleFlight
+
+
+class RubricPageCache:
+    """LRU-кэш готовых к отправке страниц рубрик с ограничением по TTL.
+
+    Ключ - (хештег, курсор, направление). Число записей ограничено
+    max_entries; при добавлении поста с хештегом все страницы этой рубрики
+    сбрасываются через invalidate_hashtag.
+    """
+
+    def __init__(self, max_entries: int | None = None, ttl: float | None = None):
+        self._max_entries = max_entries
+        self._ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[tuple, tuple[float, Any]] = OrderedDict()
+        self._keys_by_hashtag: dict[str, set[tuple]] = {}
+        # Счётчик изменений рубрики: страница, прочитанная до изменения, не кэшируется
+        self._generations: dict[str, int] = {}
+
+    # Без явных значений - из настроек при первом обращении, а не при импорте модуля
+    @property
+    def max_entries(self) -> int:
+        return settings.PAGE_CACHE_SIZE if self._max_entries is None else self._max_entries
+
+    @property
+    def ttl(self) -> float:
+        return settings.PAGE_CACHE_TTL if self._ttl is None else self._ttl
+
+    def get(self, key: tuple):
+        entry = self._entries.get(key)
+        if entry is None or time.monotonic() - entry[0] > self.ttl:
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def generation(self, hashtag: str) -> int:
+        return self._generations.get(hashtag, 0)
+
+    def put(self, key: tuple, value: Any, generation: int | None = None):
+        hashtag = key[0]
+        if generation is not None and generation != self.generation(hashtag):
+            return
+        self._entries[key] = (time.monotonic(), value)
+        self._entries.move_to_end(key)
+        self._keys_by_hashtag.setdefault(hashtag, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+
+    def _remove(self, key: tuple):
+        self._entries.pop(key, None)
+        keys = self._keys_by_hashtag.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_hashtag[key[0]]
+
+    def invalidate_hashtag(self, hashtag: str):
+        """Сбрасывает все закэшированные страницы рубрики"""
+        self._generations[hashtag] = self.generation(hashtag) + 1
+        for key in list(self._keys_by_hashtag.get(hashtag, ())):
+            self._remove(key)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+rubric_page_cache = RubricPageCache()
+# Общие загрузки страниц рубрик для одновременных промахов кэша
+rubric_page_flight = SingleFlight()
@@ -0,0 +1,206 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from typing import Any
+
+from aiogram import Bot
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import CopyMessages, ForwardMessages, SendMediaGroup, TelegramMethod
+from services.metrics import metrics
+from services.shared_state import SharedState
+
+logger = logging.getLogger(__name__)
+
+# Приоритеты исходящих сообщений: меньше - раньше
+PRIORITY_HIGH = 0  # Короткие ответы на команды
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2  # Массовая отправка постов рубрики
+
+# После скольких чатов чистить лимиты неактивных
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    """Ограничение скорости: rate токенов в секунду, не больше capacity подряд.
+
+    Запрос дороже capacity ждёт полного bucket и уходит в долг: следующие
+    запросы ждут, пока долг не восстановится, так что средняя скорость не
+    превышает rate при любой стоимости.
+    """
+    __slots__ = ("rate", "capacity", "tokens", "updated", "paused_until")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def reserve(self, cost: float = 1) -> float:
+        """Списывает cost токенов и возвращает 0 или сколько секунд ждать"""
+        now = time.monotonic()
+        if now < self.paused_until:
+            return self.paused_until - now
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        # Списывается полная стоимость, а ждать нужно не больше полного bucket
+        needed = min(cost, self.capacity)
+        if self.tokens >= needed:
+            self.tokens -= cost
+            return 0
+        return (needed - self.tokens) / self.rate
+
+    async def acquire(self, cost: float = 1):
+        while wait := self.reserve(cost):
+            await asyncio.sleep(wait)
+
+    async def pause(self, seconds: float):
+        """Не выдавать токены ближайшие seconds секунд"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class SharedTokenBucket:
+    """Token bucket в общем хранилище: один лимит на все процессы бота"""
+
+    def __init__(self, shared: SharedState, key: str, rate: float, capacity: float):
+        self.shared = shared
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+
+    async def acquire(self, cost: float = 1):
+        while wait := await self.shared.reserve_tokens(self.key, self.rate, self.capacity, cost):
+            await asyncio.sleep(wait)
+
+    async def pause(self, seconds: float):
+        await self.shared.pause_tokens(self.key, seconds)
+
+
+class OutboundDispatcher:
+    """Единая очередь исходящих запросов к Bot API.
+
+    Для каждого чата своя очередь с приоритетами и своим обработчиком,
+    поэтому разные чаты обслуживаются параллельно, а в одном чате порядок
+    сохраняется. Скорость ограничивается общим и по-чатовым token bucket
+    (лимиты Telegram: ~30 сообщений/с на бота, ~1/с в личный чат, ~20/мин
+    в группу). С общим хранилищем (shared) общий лимит делят все процессы
+    бота; по-чатовые остаются локальными, так как update одного чата
+    обрабатывает один процесс. На TelegramRetryAfter запрос повторяется после
+    retry_after, а общий лимит на это время приостанавливается: flood wait
+    действует на всего бота, а не на один чат.
+    Одинаковые запросы, ещё ожидающие отправки, склеиваются в один.
+    """
+
+    def __init__(
+            self,
+            bot: Bot,
+            global_rate: float,
+            private_rate: float,
+            private_burst: float,
+            group_rate: float,
+            group_burst: float,
+            max_retries: int,
+            shared: SharedState | None = None
+    ):
+        self.bot = bot
+        self.private_rate = private_rate
+        self.private_burst = private_burst
+        self.group_rate = group_rate
+        self.group_burst = group_burst
+        self.max_retries = max_retries
+        if shared is not None:
+            self._global = SharedTokenBucket(shared, "send:global", global_rate, global_rate)
+        else:
+            self._global = TokenBucket(global_rate, global_rate)
+        self._buckets: dict[int, TokenBucket] = {}
+        self._queues: dict[int, list] = {}
+        self._pending: dict[tuple[int, str], asyncio.Future] = {}
+        self._workers: dict[int, asyncio.Task] = {}
+        self._seq = itertools.count()
+
+    def _bucket(self, chat_id: int) -> TokenBucket:
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            if len(self._buckets) >= MAX_CHAT_BUCKETS:
+                self._prune_buckets()
+            if chat_id > 0:
+                bucket = TokenBucket(self.private_rate, self.private_burst)
+            else:
+                bucket = TokenBucket(self.group_rate, self.group_burst)
+            self._buckets[chat_id] = bucket
+        return bucket
+
+    def _prune_buckets(self):
+        """Забывает чаты без очереди, у которых лимит уже полностью восстановился"""
+        now = time.monotonic()
+        for chat_id, bucket in list(self._buckets.items()):
+            idle = now - bucket.updated
+            if chat_id not in self._workers and bucket.tokens + idle * bucket.rate >= bucket.capacity:
+                del self._buckets[chat_id]
+
+    def send(self, chat_id: int, method: TelegramMethod, priority: int = PRIORITY_NORMAL) -> asyncio.Future:
+        """Ставит запрос в очередь чата; результат - future с ответом Bot API"""
+        key = (chat_id, repr(method))
+        future = self._pending.get(key)
+        if future is not None:
+            return future
+
+        future = asyncio.get_running_loop().create_future()
+        self._pending[key] = future
+        heapq.heappush(self._queues.setdefault(chat_id, []), (priority, next(self._seq), key, method))
+
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._work(chat_id))
+        return future
+
+    async def _work(self, chat_id: int):
+        queue = self._queues[chat_id]
+        try:
+            while queue:
+                _, _, key, method = heapq.heappop(queue)
+                future = self._pending.pop(key)
+                try:
+                    result = await self._deliver(chat_id, method)
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                else:
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            del self._workers[chat_id]
+            if not queue:
+                del self._queues[chat_id]
+
+    async def _deliver(self, chat_id: int, method: TelegramMethod) -> Any:
+        # Альбом и пакетное копирование расходуют лимит за каждое сообщение
+        if isinstance(method, SendMediaGroup):
+            cost = len(method.media)
+        elif isinstance(method, (CopyMessages, ForwardMessages)):
+            cost = len(method.message_ids)
+        else:
+            cost = 1
+        for attempt in range(self.max_retries + 1):
+            await self._bucket(chat_id).acquire(cost)
+            await self._global.acquire(cost)
+            try:
+                return await self.bot(method)
+            except TelegramRetryAfter as e:
+                if attempt == self.max_retries:
+                    raise
+                metrics.telegram_retries.inc(method=type(method).__name__)
+                logger.warning(f"Flood wait {e.retry_after} с для чата {chat_id}, попытка {attempt + 1}")
+                # Остальные чаты тоже ждут на общем лимите, иначе получат такой же 429
+                await self._global.pause(e.retry_after)
+                await asyncio.sleep(e.retry_after)
+
+    def pending(self) -> int:
+        """Количество запросов в очередях"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    async def drain(self):
+        """Ждёт отправки всего, что уже стоит в очередях"""
+        while self._workers:
+            await asyncio.gather(*self._workers.values(), return_exceptions=True)
@@ -0,0 +1,238 @@
+import asyncio
+import logging
+import time
+from abc import ABC, abstractmethod
+from typing import Callable
+
+from aiogram.fsm.storage.base import BaseStorage
+from aiogram.fsm.storage.memory import MemoryStorage
+
+try:
+    from redis.asyncio import Redis
+    from aiogram.fsm.storage.redis import RedisStorage
+except ImportError:  # Нужен только для SHARED_STATE_URL=redis://...
+    Redis = None
+    RedisStorage = None
+
+logger = logging.getLogger(__name__)
+
+# Ключи и каналы в общем хранилище
+CLICKS_KEY = "clicks:pending"
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+
+class SharedState(ABC):
+    """Состояние, общее для всех процессов бота.
+
+    Счётчики (хеши name -> int), сообщения между процессами (pub/sub),
+    общие token bucket и хранилище FSM aiogram.
+    """
+
+    @abstractmethod
+    async def incr_many(self, key: str, values: dict[str, int]):
+        """Атомарно прибавляет значения к счётчикам хеша key"""
+
+    @abstractmethod
+    async def get_counters(self, key: str) -> dict[str, int]:
+        """Текущие значения счётчиков без изменения"""
+
+    @abstractmethod
+    async def pop_counters(self, key: str) -> dict[str, int]:
+        """Атомарно забирает и обнуляет все счётчики хеша key"""
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str):
+        """Отправляет сообщение всем подписчикам канала, включая другие процессы"""
+
+    @abstractmethod
+    async def subscribe(self, channel: str, callback: Callable[[str], None]):
+        """Вызывает callback для каждого сообщения канала"""
+
+    @abstractmethod
+    async def reserve_tokens(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        """Общий token bucket: списывает cost и возвращает 0 или сколько секунд ждать"""
+
+    @abstractmethod
+    async def pause_tokens(self, key: str, seconds: float):
+        """Token bucket key не выдаёт токены ближайшие seconds секунд"""
+
+    @abstractmethod
+    def fsm_storage(self) -> BaseStorage:
+        """Хранилище состояний FSM для Dispatcher"""
+
+    async def close(self):
+        pass
+
+
+class MemorySharedState(SharedState):
+    """Общее состояние в памяти одного процесса: для тестов и локального запуска"""
+
+    def __init__(self):
+        self._hashes: dict[str, dict[str, int]] = {}
+        self._subscribers: dict[str, list[Callable[[str], None]]] = {}
+        self._buckets: dict[str, tuple[float, float]] = {}
+        self._paused_until: dict[str, float] = {}
+
+    async def incr_many(self, key: str, values: dict[str, int]):
+        counters = self._hashes.setdefault(key, {})
+        for field, value in values.items():
+            counters[field] = counters.get(field, 0) + value
+
+    async def get_counters(self, key: str) -> dict[str, int]:
+        return dict(self._hashes.get(key, {}))
+
+    async def pop_counters(self, key: str) -> dict[str, int]:
+        return self._hashes.pop(key, {})
+
+    async def publish(self, channel: str, message: str):
+        for callback in self._subscribers.get(channel, []):
+            callback(message)
+
+    async def subscribe(self, channel: str, callback: Callable[[str], None]):
+        self._subscribers.setdefault(channel, []).append(callback)
+
+    async def reserve_tokens(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        now = time.monotonic()
+        paused_until = self._paused_until.get(key, 0.0)
+        if now < paused_until:
+            return paused_until - now
+        tokens, updated = self._buckets.get(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * rate)
+        # Как TokenBucket: полная стоимость, дорогой запрос уходит в долг
+        needed = min(cost, capacity)
+        wait = 0.0
+        if tokens >= needed:
+            tokens -= cost
+        else:
+            wait = (needed - tokens) / rate
+        self._buckets[key] = (tokens, now)
+        return wait
+
+    async def pause_tokens(self, key: str, seconds: float):
+        self._paused_until[key] = max(self._paused_until.get(key, 0.0), time.monotonic() + seconds)
+
+    def fsm_storage(self) -> BaseStorage:
+        return MemoryStorage()
+
+
+# Token bucket в Redis: пересчёт и списание одной атомарной операцией.
+# Время передаёт клиент: процессы работают на одной машине
+_RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local needed = math.min(cost, capacity)
+local now = tonumber(ARGV[4])
+local data = redis.call('HMGET', KEYS[1], 'tokens', 'updated', 'paused_until')
+local paused_until = tonumber(data[3]) or 0
+if now < paused_until then
+    return tostring(paused_until - now)
+end
+local tokens = tonumber(data[1]) or capacity
+local updated = tonumber(data[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= needed then
+    tokens = tokens - cost
+else
+    wait = (needed - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+-- Ключ живёт, пока bucket (с учётом долга) не восстановится полностью
+redis.call('EXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate) + 1)
+return tostring(wait)
+"""
+
+# Пауза token bucket (flood wait): позже выставленная пауза не укорачивается
+_PAUSE_SCRIPT = """
+local paused_until = tonumber(ARGV[1]) + tonumber(ARGV[2])
+local current = tonumber(redis.call('HGET', KEYS[1], 'paused_until')) or 0
+if paused_until > current then
+    redis.call('HSET', KEYS[1], 'paused_until', tostring(paused_until))
+end
+redis.call('EXPIRE', KEYS[1], math.ceil(tonumber(ARGV[2])) + 60)
+"""
+
+
+class RedisSharedState(SharedState):
+    """Общее состояние в Redis для нескольких процессов бота"""
+
+    def __init__(self, redis, prefix: str = "symphony:"):
+        self.redis = redis
+        self.prefix = prefix
+        self._reserve = redis.register_script(_RESERVE_SCRIPT)
+        self._pause = redis.register_script(_PAUSE_SCRIPT)
+        self._listeners: list[asyncio.Task] = []
+
+    @classmethod
+    def from_url(cls, url: str, prefix: str = "symphony:") -> "RedisSharedState":
+        if Redis is None:
+            raise RuntimeError("Для SHARED_STATE_URL=redis://... установите пакет redis")
+        return cls(Redis.from_url(url, decode_responses=True), prefix)
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key
+
+    async def incr_many(self, key: str, values: dict[str, int]):
+        if not values:
+            return
+        # Одной транзакцией: счётчики не должны попасть в хранилище частично
+        async with self.redis.pipeline(transaction=True) as pipe:
+            for field, value in values.items():
+                pipe.hincrby(self._key(key), field, value)
+            await pipe.execute()
+
+    async def get_counters(self, key: str) -> dict[str, int]:
+        values = await self.redis.hgetall(self._key(key))
+        return {field: int(value) for field, value in values.items()}
+
+    async def pop_counters(self, key: str) -> dict[str, int]:
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hgetall(self._key(key))
+            pipe.delete(self._key(key))
+            values, _ = await pipe.execute()
+        return {field: int(value) for field, value in values.items()}
+
+    async def publish(self, channel: str, message: str):
+        await self.redis.publish(self._key(channel), message)
+
+    async def subscribe(self, channel: str, callback: Callable[[str], None]):
+        pubsub = self.redis.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(self._key(channel))
+
+        async def listen():
+            async for message in pubsub.listen():
+                try:
+                    callback(message["data"])
+                except Exception as e:
+                    logger.error(f"Ошибка обработки сообщения {channel}: {e}")
+
+        self._listeners.append(asyncio.create_task(listen()))
+
+    async def reserve_tokens(self, key: str, rate: float, capacity: float, cost: float = 1) -> float:
+        wait = await self._reserve(keys=[self._key(key)], args=[rate, capacity, cost, time.time()])
+        return float(wait)
+
+    async def pause_tokens(self, key: str, seconds: float):
+        await self._pause(keys=[self._key(key)], args=[time.time(), seconds])
+
+    def fsm_storage(self) -> BaseStorage:
+        return RedisStorage(self.redis)
+
+    async def close(self):
+        for task in self._listeners:
+            task.cancel()
+        await asyncio.gather(*self._listeners, return_exceptions=True)
+        self._listeners.clear()
+        await self.redis.aclose()
+
+
+def create_shared_state(url: str | None) -> SharedState | None:
+    """Общее состояние по SHARED_STATE_URL: redis://..., memory:// или None (один процесс)"""
+    if not url:
+        return None
+    if url.startswith("memory://"):
+        return MemorySharedState()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisSharedState.from_url(url)
+    raise ValueError(f"Неизвестное общее хранилище: {url}")
@@ -0,0 +1,32 @@
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    """Склеивает одновременные одинаковые запросы в один.
+
+    Пока выполняется запрос с ключом key, остальные вызовы do(key, ...)
+    не запускают свой, а ждут результат первого. Отмена одного из
+    ожидающих не отменяет общий запрос.
+    """
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self.shared = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            self.shared += 1
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+
+    def in_flight(self) -> int:
+        return len(self._calls)
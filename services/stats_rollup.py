@@ -0,0 +1,80 @@
+import asyncio
+import logging
+from datetime import datetime, timedelta, timezone
+
+from config import settings
+from database.crud import rollup_click_events, refresh_post_counts, ROLLUP_BATCH_SIZE
+from database.session import async_session
+from services.invalidation import invalidation
+
+logger = logging.getLogger(__name__)
+
+
+class StatsRollup:
+    """Фоновая свёртка журнала кликов в почасовые и дневные агрегаты.
+
+    Каждый проход обрабатывает только записи, появившиеся после прошлого,
+    и пересчитывает количество постов в рубриках. /stats читает готовые
+    агрегаты и не трогает журнал.
+    """
+
+    def __init__(self, interval: float | None = None, retention_days: int | None = None):
+        self._interval = interval
+        self._retention_days = retention_days
+        self.last_run_at: datetime | None = None
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+
+    # Без явных значений - из настроек при первом обращении, а не при импорте модуля
+    @property
+    def interval(self) -> float:
+        return settings.STATS_ROLLUP_INTERVAL if self._interval is None else self._interval
+
+    @property
+    def retention_days(self) -> int:
+        return settings.STATS_EVENT_RETENTION_DAYS if self._retention_days is None else self._retention_days
+
+    async def run_once(self) -> int:
+        """Сворачивает всё накопленное, возвращает число записей журнала"""
+        async with self._lock:
+            retain_before = datetime.now(timezone.utc) - timedelta(days=self.retention_days)
+            total = 0
+            while True:
+                async with async_session() as session:
+                    processed = await rollup_click_events(session, retain_before)
+                total += processed
+                if processed < ROLLUP_BATCH_SIZE:
+                    break
+
+            async with async_session() as session:
+                if await refresh_post_counts(session):
+                    # Новые количества постов должны попасть в /stats
+                    await invalidation.catalog_changed()
+            self.last_run_at = datetime.now(timezone.utc)
+            return total
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка свёртки статистики: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Останавливает фоновую задачу и сворачивает остаток журнала"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.run_once()
+
+
+stats_rollup = StatsRollup()
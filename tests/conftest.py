@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# Настройки читаются при первом обращении, поэтому окружение задаётся до импорта модулей бота
+_workdir = tempfile.mkdtemp(prefix="symphony-tests-")
+os.environ.setdefault("BOT_TOKEN", "42:tests")
+os.environ.setdefault("CHANNEL_ID", "-1001000000000")
+os.environ["DATABASE_URL"] = f"sqlite+aiosqlite:///{_workdir}/tests.db"
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
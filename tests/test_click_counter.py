@@ -0,0 +1,66 @@
+"""Сброс кликов: остановка во время записи не теряет клики"""
+import asyncio
+from collections import Counter
+
+from services.click_counter import ClickCounter
+from services.shared_state import MemorySharedState, CLICKS_KEY
+
+
+class SlowCounter(ClickCounter):
+    """Запись в БД подменена медленной записью в список"""
+
+    def __init__(self, delay: float):
+        super().__init__(flush_interval=0.01)
+        self.delay = delay
+        self.written: Counter[str] = Counter()
+
+    async def _write(self, clicks, events):
+        await asyncio.sleep(self.delay)
+        self.written.update(clicks)
+
+
+def test_stop_during_slow_write_keeps_clicks():
+    async def run():
+        counter = SlowCounter(delay=0.2)
+        counter.start()
+        counter.increment("#a", 3)
+        # Фоновый сброс уже пишет, когда приходит stop
+        await asyncio.sleep(0.05)
+        counter.increment("#a", 2)
+        await counter.stop()
+        return counter
+
+    counter = asyncio.run(run())
+    assert counter.written == {"#a": 5}
+    assert counter.pending("#a") == 0
+
+
+def test_cancelled_write_returns_clicks():
+    async def run():
+        counter = SlowCounter(delay=1)
+        counter.increment("#a", 3)
+        flush = asyncio.create_task(counter.flush())
+        await asyncio.sleep(0.05)
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+        return counter
+
+    counter = asyncio.run(run())
+    assert counter.written == {}
+    assert counter.pending("#a") == 3
+
+
+def test_cancelled_shared_write_returns_clicks_to_storage():
+    async def run():
+        shared = MemorySharedState()
+        counter = SlowCounter(delay=1)
+        counter.attach(shared, owner=True)
+        counter.increment("#a", 4)
+        flush = asyncio.create_task(counter.flush())
+        await asyncio.sleep(0.05)
+        flush.cancel()
+        await asyncio.gather(flush, return_exceptions=True)
+        return await shared.get_counters(CLICKS_KEY)
+
+    values = asyncio.run(run())
+    assert values["c|#a"] == 4
@@ -0,0 +1,63 @@
+"""Очередь записи постов: микро-пачки, backpressure и ожидание записи конкретного поста"""
+import asyncio
+from datetime import datetime, timezone
+
+from database.schemas import PostDraft
+from services.ingestion import IngestionQueue
+
+
+def draft(message_id: int) -> PostDraft:
+    return PostDraft(message_id=message_id, text=None, date=datetime(2024, 5, 1, tzinfo=timezone.utc), hashtags=[])
+
+
+class RecordingQueue(IngestionQueue):
+    """Пачки не пишутся в БД, а запоминаются"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.batches = []
+
+    async def _write(self, batch):
+        self.batches.append([d.message_id for d in batch])
+
+
+def test_posts_are_written_in_batches():
+    async def run():
+        queue = RecordingQueue(batch_size=3, max_latency=0.05, max_size=10)
+        for message_id in range(1, 8):
+            await queue.put(draft(message_id))
+        queue.start()
+        await queue.wait_saved(7)
+        await queue.stop()
+        return queue.batches
+
+    assert asyncio.run(run()) == [[1, 2, 3], [4, 5, 6], [7]]
+
+
+def test_single_post_waits_at_most_max_latency():
+    async def run():
+        queue = RecordingQueue(batch_size=100, max_latency=0.05, max_size=10)
+        queue.start()
+        await queue.put(draft(1))
+        await asyncio.wait_for(queue.wait_saved(1), 1)
+        await queue.stop()
+        return queue.batches
+
+    assert asyncio.run(run()) == [[1]]
+
+
+def test_full_queue_blocks_put():
+    async def run():
+        queue = RecordingQueue(batch_size=10, max_latency=0.05, max_size=2)
+        await queue.put(draft(1))
+        await queue.put(draft(2))
+        blocked = asyncio.create_task(queue.put(draft(3)))
+        await asyncio.sleep(0.05)
+        assert not blocked.done()
+        # Обработчик освобождает место, и пост попадает в очередь
+        queue.start()
+        await asyncio.wait_for(blocked, 1)
+        await queue.stop()
+        return sorted(m for batch in queue.batches for m in batch)
+
+    assert asyncio.run(run()) == [1, 2, 3]
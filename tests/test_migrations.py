@@ -0,0 +1,89 @@
+"""Миграции: новая база и обновлённая старая приходят к одной схеме - схеме моделей"""
+import asyncio
+from datetime import datetime, timezone
+
+from sqlalchemy import inspect, insert, select, text
+
+from database.migrations import LATEST_VERSION, SCHEMA_V1, get_version, upgrade
+from database.models import PostHashtag
+from database.session import Base, create_engine
+
+# Таблицы первого релиза, до post_hashtags и журнала кликов
+BASELINE_TABLES = ("channel_posts", "post_media", "hashtag_stats")
+
+
+def schema(sync_conn) -> dict[str, tuple[set[str], set[str]]]:
+    """Таблица -> (колонки, индексы)"""
+    inspector = inspect(sync_conn)
+    return {
+        table: (
+            {c["name"] for c in inspector.get_columns(table)},
+            {i["name"] for i in inspector.get_indexes(table)},
+        )
+        for table in inspector.get_table_names()
+    }
+
+
+def model_schema() -> dict[str, tuple[set[str], set[str]]]:
+    return {
+        table.name: ({c.name for c in table.columns}, {i.name for i in table.indexes})
+        for table in Base.metadata.sorted_tables
+    }
+
+
+async def migrate(url: str, prepare=None) -> dict:
+    engine = create_engine(url)
+    try:
+        if prepare is not None:
+            async with engine.begin() as conn:
+                await prepare(conn)
+        assert await upgrade(engine)
+        # Повторный запуск на актуальной схеме ничего не делает
+        assert await upgrade(engine) == []
+        async with engine.connect() as conn:
+            assert await get_version(conn) == LATEST_VERSION
+            return await conn.run_sync(schema)
+    finally:
+        await engine.dispose()
+
+
+def test_fresh_install_matches_models(tmp_path):
+    fresh = asyncio.run(migrate(f"sqlite+aiosqlite:///{tmp_path}/fresh.db"))
+    for table, (columns, indexes) in model_schema().items():
+        assert fresh[table][0] == columns, table
+        assert fresh[table][1] == indexes, table
+
+
+def test_upgrade_from_baseline_matches_fresh_install(tmp_path):
+    async def baseline(conn):
+        await conn.run_sync(SCHEMA_V1.create_all, tables=[SCHEMA_V1.tables[t] for t in BASELINE_TABLES])
+        await conn.execute(insert(SCHEMA_V1.tables["channel_posts"]).values(
+            id=1, message_id=10, text="пост", date=datetime(2024, 1, 1, tzinfo=timezone.utc),
+            hashtags="#раз,#два",
+        ))
+
+    async def run():
+        fresh = await migrate(f"sqlite+aiosqlite:///{tmp_path}/fresh.db")
+        upgraded = await migrate(f"sqlite+aiosqlite:///{tmp_path}/old.db", baseline)
+        assert upgraded == fresh
+
+        engine = create_engine(f"sqlite+aiosqlite:///{tmp_path}/old.db")
+        async with engine.connect() as conn:
+            tags = (await conn.scalars(select(PostHashtag.hashtag).where(PostHashtag.post_id == 1))).all()
+            found = await conn.scalar(text("SELECT rowid FROM channel_posts_fts WHERE channel_posts_fts MATCH 'пост'"))
+        await engine.dispose()
+        # Старые посты перенесены в post_hashtags и попали в полнотекстовый индекс
+        assert sorted(tags) == ["#два", "#раз"]
+        assert found == 1
+
+    asyncio.run(run())
+
+
+def test_upgrade_of_unversioned_database(tmp_path):
+    """База, созданная по моделям до появления версий, проходит все шаги"""
+    async def run():
+        fresh = await migrate(f"sqlite+aiosqlite:///{tmp_path}/fresh.db")
+        unversioned = await migrate(f"sqlite+aiosqlite:///{tmp_path}/old.db", lambda conn: conn.run_sync(Base.metadata.create_all))
+        assert unversioned == fresh
+
+    asyncio.run(run())
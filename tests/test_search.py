@@ -0,0 +1,123 @@
+"""Отправка страниц рубрик (копирование из канала и по file_id) и полнотекстового поиска"""
+import asyncio
+from datetime import datetime, timezone
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.methods import CopyMessages, EditMessageText, SendMessage
+
+import handlers.search as search
+from database.crud import get_rubric_page, save_post_drafts
+from database.migrations import upgrade
+from database.schemas import PostDraft
+from database.session import async_session, get_engine
+from handlers.search import RenderedPage, copy_batches, send_rubric_page, send_search_page
+
+
+def rubric_page() -> RenderedPage:
+    """Посты 3, 2, 1 (от новых к старым): пост 1 - альбом из сообщений 10-13, пост 2 - 14-16, пост 3 - 17"""
+    items = [(post_id, SendMessage, {"text": f"p{post_id}"}, f"p{post_id}") for post_id in (3, 2, 1)]
+    return RenderedPage(
+        hashtag_id=1, items=items, message_ids=list(range(10, 18)), post_ids=[3, 2, 1],
+        post_message_ids=[17, 14, 10], first_id=3, last_id=1, has_prev=False, has_next=False
+    )
+
+
+class FakeSender:
+    """Очередь отправки: copyMessages с сообщением failing_id завершается ошибкой"""
+
+    def __init__(self, failing_id: int | None = None):
+        self.failing_id = failing_id
+        self.sent = []
+
+    def send(self, chat_id, method, priority=0):
+        future = asyncio.get_running_loop().create_future()
+        if isinstance(method, CopyMessages) and self.failing_id in method.message_ids:
+            future.set_exception(TelegramBadRequest(method=method, message="message to copy not found"))
+        else:
+            self.sent.append(method.message_ids if isinstance(method, CopyMessages) else method.text)
+            future.set_result(True)
+        return future
+
+
+def test_copy_batches_keep_albums_whole(monkeypatch):
+    monkeypatch.setattr(search, "MAX_BATCH_MESSAGES", 5)
+    assert copy_batches(rubric_page()) == [([10, 11, 12, 13], [1]), ([14, 15, 16, 17], [2, 3])]
+
+
+def test_failed_batch_resends_only_undelivered_posts_oldest_first(monkeypatch):
+    monkeypatch.setattr(search, "MAX_BATCH_MESSAGES", 5)
+    sender = FakeSender(failing_id=14)
+    asyncio.run(send_rubric_page(sender, 1, rubric_page()))
+    assert sender.sent == [[10, 11, 12, 13], "p2", "p3"]
+
+
+def test_resend_mode_uses_copy_order(monkeypatch):
+    monkeypatch.setattr(search.settings, "DELIVERY_MODE", "resend", raising=False)
+    sender = FakeSender()
+    asyncio.run(send_rubric_page(sender, 1, rubric_page()))
+    assert sender.sent == ["p1", "p2", "p3"]
+
+
+class NotModifiedSender(FakeSender):
+    """Повторное редактирование тем же текстом: Telegram отвечает message is not modified"""
+
+    def send(self, chat_id, method, priority=0):
+        if isinstance(method, EditMessageText) and method.text in self.sent:
+            future = asyncio.get_running_loop().create_future()
+            future.set_exception(TelegramBadRequest(method=method, message="message is not modified"))
+            return future
+        self.sent.append(method.text)
+        return super().send(chat_id, SendMessage(chat_id=chat_id, text="ok"), priority)
+
+
+def test_search_finds_posts_and_ignores_repeated_tap():
+    async def run():
+        await upgrade(get_engine())
+        async with async_session() as session:
+            await save_post_drafts(session, [PostDraft(
+                message_id=700001,
+                text="Малахит из уральских копей #Редкие_камни",
+                date=datetime(2024, 5, 1, tzinfo=timezone.utc),
+                hashtags=["#Редкие_камни"]
+            )])
+        sender = NotModifiedSender()
+        await send_search_page(sender, 1, "малахит", 0, edit_message_id=5)
+        # То же нажатие ещё раз не должно выбрасывать ошибку наружу
+        await send_search_page(sender, 1, "малахит", 0, edit_message_id=5)
+        await get_engine().dispose()
+        return sender.sent
+
+    sent = asyncio.run(run())
+    assert "<b>Малахит</b> из уральских копей" in sent[0]
+    assert sent.count(sent[0]) == 1
+
+
+def test_rubric_pages_walk_without_gaps_or_repeats():
+    """Keyset-страницы по (date, id): посты с одинаковой датой не теряются на границе страниц"""
+    tag = "#keyset"
+
+    async def run():
+        await upgrade(get_engine())
+        async with async_session() as session:
+            drafts = [
+                PostDraft(message_id=710000 + n, text=f"пост {n} {tag}", hashtags=[tag],
+                          date=datetime(2024, 5, 1 + n // 2, tzinfo=timezone.utc))
+                for n in range(7)
+            ]
+            await save_post_drafts(session, drafts)
+            newest_first = [d.post_id for d in sorted(drafts, key=lambda d: (d.date, d.post_id), reverse=True)]
+
+            pages, cursor, has_more = [], None, True
+            while has_more:
+                posts, has_more = await get_rubric_page(session, tag, cursor, limit=3)
+                pages.append([post.id for post in posts])
+                cursor = posts[-1].id
+            # Назад от последней страницы - предыдущая, тоже от новых к старым
+            back, has_newer = await get_rubric_page(session, tag, pages[-1][0], backward=True, limit=3)
+        await get_engine().dispose()
+        return newest_first, pages, [post.id for post in back], has_newer
+
+    newest_first, pages, back, has_newer = asyncio.run(run())
+    assert pages == [newest_first[:3], newest_first[3:6], newest_first[6:]]
+    assert back == pages[1]
+    assert has_newer
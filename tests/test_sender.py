@@ -0,0 +1,64 @@
+"""Лимиты исходящих сообщений"""
+import asyncio
+import time
+
+from aiogram.exceptions import TelegramRetryAfter
+from aiogram.methods import CopyMessages, SendMessage
+
+from services.sender import OutboundDispatcher, TokenBucket
+
+
+def test_large_call_is_charged_in_full():
+    bucket = TokenBucket(rate=10, capacity=5)
+    # copyMessages на 20 сообщений проходит при полном bucket...
+    assert bucket.reserve(20) == 0
+    # ...но следующий запрос ждёт, пока восстановятся все 20 токенов (долг 15 + 1)
+    assert 1.5 < bucket.reserve(1) <= 1.6
+
+
+class FakeBot:
+    """Bot API: запоминает время запросов, первый запрос в чат 1 получает flood wait"""
+
+    def __init__(self):
+        self.calls: list[tuple[int, float]] = []
+        self.flooded = False
+
+    async def __call__(self, method):
+        self.calls.append((method.chat_id, time.monotonic()))
+        if method.chat_id == 1 and not self.flooded:
+            self.flooded = True
+            raise TelegramRetryAfter(method=method, message="flood", retry_after=0.3)
+        return True
+
+
+def dispatcher(bot, rate: float = 1000) -> OutboundDispatcher:
+    return OutboundDispatcher(bot, rate, rate, rate, rate, rate, max_retries=3)
+
+
+def test_flood_wait_pauses_other_chats():
+    async def run():
+        bot = FakeBot()
+        sender = dispatcher(bot)
+        started = time.monotonic()
+        first = sender.send(1, SendMessage(chat_id=1, text="a"))
+        await asyncio.sleep(0.05)
+        await asyncio.gather(first, sender.send(2, SendMessage(chat_id=2, text="b")))
+        return started, bot.calls
+
+    started, calls = asyncio.run(run())
+    sent_to_second = next(at for chat_id, at in calls if chat_id == 2)
+    assert sent_to_second - started >= 0.29
+
+
+def test_same_pending_request_is_sent_once():
+    async def run():
+        bot = FakeBot()
+        sender = dispatcher(bot)
+        method = CopyMessages(chat_id=2, from_chat_id=-100, message_ids=[1, 2, 3])
+        futures = [sender.send(2, method), sender.send(2, method)]
+        await asyncio.gather(*futures)
+        return futures, bot.calls
+
+    futures, calls = asyncio.run(run())
+    assert futures[0] is futures[1]
+    assert len(calls) == 1
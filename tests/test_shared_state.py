@@ -0,0 +1,89 @@
+"""Общее состояние процессов: MemorySharedState и RedisSharedState (через fakeredis)"""
+import asyncio
+
+import pytest
+
+from services.shared_state import MemorySharedState, RedisSharedState
+
+fakeredis = pytest.importorskip("fakeredis")
+
+
+def redis_pair() -> tuple[RedisSharedState, RedisSharedState]:
+    """Два «процесса» с одним сервером Redis"""
+    server = fakeredis.FakeServer()
+    return tuple(
+        RedisSharedState(fakeredis.aioredis.FakeRedis(server=server, decode_responses=True))
+        for _ in range(2)
+    )
+
+
+def memory_pair() -> tuple[MemorySharedState, MemorySharedState]:
+    shared = MemorySharedState()
+    return shared, shared
+
+
+@pytest.fixture(params=["memory", "redis"])
+def pair(request):
+    return memory_pair() if request.param == "memory" else redis_pair()
+
+
+def test_counters_are_summed_and_popped_once(pair):
+    first, second = pair
+
+    async def run():
+        await first.incr_many("clicks", {"#a": 2, "#b": 1})
+        await second.incr_many("clicks", {"#a": 3})
+        assert await first.get_counters("clicks") == {"#a": 5, "#b": 1}
+        assert await second.pop_counters("clicks") == {"#a": 5, "#b": 1}
+        assert await first.pop_counters("clicks") == {}
+
+    asyncio.run(run())
+
+
+def test_token_bucket_is_shared(pair):
+    first, second = pair
+
+    async def run():
+        # Всплеск на 3 токена делят оба процесса
+        waits = [await shared.reserve_tokens("send", 1.0, 3.0) for shared in (first, second, first)]
+        assert waits == [0, 0, 0]
+        wait = await second.reserve_tokens("send", 1.0, 3.0)
+        assert 0.9 < wait <= 1.0
+        # Запрос дороже всего bucket ждёт только полного bucket, но уходит в долг на всю стоимость
+        assert await first.reserve_tokens("other", 10.0, 2.0, cost=5) == 0
+        wait = await second.reserve_tokens("other", 10.0, 2.0)
+        assert 0.35 < wait <= 0.4
+
+    asyncio.run(run())
+
+
+def test_pause_blocks_tokens_for_all_processes(pair):
+    first, second = pair
+
+    async def run():
+        await first.pause_tokens("send", 0.5)
+        wait = await second.reserve_tokens("send", 100.0, 100.0)
+        assert 0.4 < wait <= 0.5
+        # Более короткая пауза не укорачивает уже выставленную
+        await second.pause_tokens("send", 0.1)
+        assert await first.reserve_tokens("send", 100.0, 100.0) > 0.3
+
+    asyncio.run(run())
+
+
+def test_publish_reaches_other_process():
+    first, second = redis_pair()
+
+    async def run():
+        received = []
+        await second.subscribe("events", received.append)
+        await first.publish("events", "hello")
+        for _ in range(50):
+            if received:
+                break
+            await asyncio.sleep(0.01)
+        assert received == ["hello"]
+        await first.close()
+        await second.close()
+
+    asyncio.run(run())
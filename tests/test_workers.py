@@ -0,0 +1,125 @@
+"""Несколько процессов бота: передача кликов, сброс кэшей и раздача update воркерам"""
+import asyncio
+from datetime import datetime, timezone
+
+from aiogram.types import Update
+from sqlalchemy import select
+
+from database.crud import init_hashtags, FIXED_HASHTAGS
+from database.migrations import upgrade
+from database.models import ClickEvent, HashtagStats
+from database.session import async_session, get_engine
+from middlewares.fanout import UpdateFanoutMiddleware, partition_key
+from services.click_counter import ClickCounter
+from services.invalidation import InvalidationBus
+from services.page_cache import rubric_page_cache
+from services.hashtag_catalog import hashtag_catalog
+from services.shared_state import MemorySharedState, CLICKS_KEY
+
+TAG = FIXED_HASHTAGS[0]
+
+
+def test_worker_clicks_are_written_by_owner():
+    async def run():
+        engine = get_engine()
+        await upgrade(engine)
+        async with async_session() as session:
+            await init_hashtags(session)
+
+        shared = MemorySharedState()
+        owner, worker = ClickCounter(60), ClickCounter(60)
+        owner.attach(shared, owner=True)
+        worker.attach(shared, owner=False)
+
+        worker.increment(TAG, 3)
+        worker.record_views(TAG, [7])
+        owner.increment(TAG, 2)
+
+        # Воркер только переносит клики в общее хранилище, в БД ничего не пишет
+        assert await worker.flush() == 0
+        assert (await owner.pending_all())[TAG] == 5
+        # Основной процесс забирает клики всех процессов одним сбросом
+        assert await owner.flush() == 5
+        assert await shared.get_counters(CLICKS_KEY) == {}
+
+        async with async_session() as session:
+            stats = await session.scalar(select(HashtagStats).where(HashtagStats.name == TAG))
+            events = (await session.scalars(select(ClickEvent).where(ClickEvent.hashtag == TAG))).all()
+        assert stats.click_count == 5
+        assert sorted((e.post_id, e.count) for e in events) == [(0, 5), (7, 1)]
+        await engine.dispose()
+
+    asyncio.run(run())
+
+
+def test_invalidation_reaches_other_process_once():
+    async def run():
+        shared = MemorySharedState()
+        first, second = InvalidationBus(), InvalidationBus()
+        await first.attach(shared)
+        await second.attach(shared)
+
+        before = rubric_page_cache.generation(TAG)
+        await first.hashtags_changed([TAG])
+        # Свой кэш сбрасывается сразу, второй процесс - по сообщению; своё эхо пропускается
+        assert rubric_page_cache.generation(TAG) == before + 2
+
+        hashtag_catalog._loaded_at = 1.0
+        await second.catalog_changed()
+        assert hashtag_catalog._loaded_at == 0.0
+
+    asyncio.run(run())
+
+
+def update(update_id: int, **event) -> Update:
+    return Update.model_validate({"update_id": update_id, **event})
+
+
+def message(chat_id: int, text: str = "/start") -> dict:
+    return {
+        "message_id": 1,
+        "date": int(datetime.now(timezone.utc).timestamp()),
+        "chat": {"id": chat_id, "type": "private"},
+        "from": {"id": chat_id, "is_bot": False, "first_name": "u"},
+        "text": text,
+    }
+
+
+def test_partition_key_uses_chat():
+    assert partition_key(update(1, message=message(42))) == 42
+    callback = {"id": "c", "from": {"id": 5, "is_bot": False, "first_name": "u"},
+                "chat_instance": "x", "message": message(42), "data": "hashtag:1"}
+    assert partition_key(update(2, callback_query=callback)) == 42
+    inline = {"id": "q", "from": {"id": 9, "is_bot": False, "first_name": "u"}, "query": "", "offset": ""}
+    assert partition_key(update(3, inline_query=inline)) == 9
+
+
+def test_fanout_routes_by_chat_and_falls_back():
+    urls = ["http://w0", "http://w1", "http://w2"]
+    fanout = UpdateFanoutMiddleware(urls)
+    forwarded = []
+    handled = []
+
+    async def forward(url, event):
+        if url == "http://w2":
+            raise ConnectionError("воркер недоступен")
+        forwarded.append((url, event.update_id))
+
+    async def handler(event, data):
+        handled.append(event.update_id)
+
+    fanout._forward = forward
+    channel_post = dict(message(-1001000000000, "#Opera"), chat={"id": -1001000000000, "type": "channel"})
+    del channel_post["from"]
+
+    async def run():
+        await fanout(handler, update(1, message=message(3)), {})
+        await fanout(handler, update(2, message=message(4)), {})
+        await fanout(handler, update(3, message=message(5)), {})
+        await fanout(handler, update(4, channel_post=channel_post), {})
+
+    asyncio.run(run())
+    # Чат 3 -> воркер 0, чат 4 -> воркер 1, чат 5 -> недоступный воркер 2, пост канала - локально
+    assert forwarded == [("http://w0", 1), ("http://w1", 2)]
+    assert handled == [3, 4]
+    assert fanout.forwarded == 2